@@ -0,0 +1,314 @@
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+
+# Единая точка запуска: краулер -> токенизация -> индекс -> tf-idf -> поиск.
+# Для каждого этапа в pipeline_state.json хранятся sha256 его входов: для
+# токенизации и индекса - по каждому документу, для tf-idf и поиска - по
+# артефактам предыдущего этапа. В хэш входов входит и код этапа, поэтому после
+# правки скрипта этап пересчитывается целиком. Хэши файлов кэшируются по
+# размеру и mtime, как в make, и заново читаются только изменившиеся файлы.
+ROOT = os.path.dirname(os.path.abspath(__file__))
+STATE_FILE = os.path.join(ROOT, 'pipeline_state.json')
+DOWNLOADS_DIR = os.path.join(ROOT, 'downloads')
+TASK_DIRS = {stage: os.path.join(ROOT, f"task_{number}") for number, stage in
+             enumerate(('crawl', 'tokenize', 'index', 'tf_idf', 'search'), 1)}
+STAGES = tuple(TASK_DIRS)
+# результаты задания 2 для одного документа
+DOCUMENT_OUTPUTS = ('clean', 'tokens', 'lemmas', 'counts')
+CODE = {
+    'crawl': ['task_1/crawler.py'],
+    'tokenize': ['task_2/tokenization.py', 'task_2/html_extract.py', 'task_2/lemma_cache.py',
+                 'task_2/term_counts.py'],
+    'index': ['task_3/index.py', 'task_3/index_format.py', 'task_3/segments.py', 'task_3/postings.py',
+              'task_3/spimi.py'],
+    'tf_idf': ['task_4/tf_idf.py', 'task_4/vectors_format.py'],
+    'search': [],
+}
+# --stream: этапы tokenize, index и tf_idf одним проходом streaming.py
+STREAM_CODE = ['streaming.py', *CODE['tokenize'], *CODE['index'], *CODE['tf_idf']]
+INDEX_FILE = os.path.join(TASK_DIRS['index'], 'inverted_index.bin')
+SEGMENTS_DIR = os.path.join(TASK_DIRS['index'], 'segments')
+VECTORS_FILE = os.path.join(TASK_DIRS['tf_idf'], 'tf_idf', 'lemmas.bin')
+LEMMA_DICTIONARY = os.path.join(TASK_DIRS['tokenize'], 'lemma_dictionary.txt')
+
+
+class StageError(Exception):
+    pass
+
+
+class FileHashes:
+    """sha256 файлов с кэшем по (размер, mtime_ns)"""
+
+    def __init__(self, cache):
+        self.cache = cache
+        self.hashed = 0
+
+    def __call__(self, path):
+        key = os.path.relpath(path, ROOT)
+        stat = os.stat(path)
+        cached = self.cache.get(key)
+        if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            return cached[2]
+
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        self.hashed += 1
+        self.cache[key] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+        return self.cache[key][2]
+
+    def combined(self, paths):
+        """Один хэш по набору файлов; отсутствующий файл тоже меняет хэш"""
+        digest = hashlib.sha256()
+        for path in paths:
+            digest.update(os.path.relpath(path, ROOT).encode('utf-8'))
+            digest.update(self(path).encode('ascii') if os.path.exists(path) else b'-')
+        return digest.hexdigest()
+
+
+def load_state():
+    if not os.path.exists(STATE_FILE):
+        return {'files': {}, 'stages': {}}
+    with open(STATE_FILE, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_state(state):
+    tmp_path = STATE_FILE + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, STATE_FILE)
+
+
+def page_name(filename):
+    """page_007.html -> 007, как имена файлов задания 2"""
+    return filename.removeprefix('page_').removesuffix('.html')
+
+
+class Pipeline:
+    def __init__(self, force=False, adopt=False, segments=False, workers=1, verbose=False, memory=None):
+        self.force = force
+        self.adopt = adopt
+        self.segments = segments or os.path.isdir(SEGMENTS_DIR)
+        self.workers = workers
+        self.verbose = verbose
+        self.memory = memory
+        self.state = load_state()
+        self.hashes = FileHashes(self.state['files'])
+        self.report = []
+
+    def run(self, stages):
+        started = time.perf_counter()
+        try:
+            for stage in stages:
+                stage_started = time.perf_counter()
+                hashed_before = self.hashes.hashed
+                done, total = getattr(self, f"stage_{stage}")()
+                self.report.append((stage, done, total, time.perf_counter() - stage_started,
+                                    self.hashes.hashed - hashed_before))
+                save_state(self.state)
+        finally:
+            save_state(self.state)
+            self.print_report(time.perf_counter() - started)
+
+    def run_script(self, stage, script, *args, cwd=None):
+        command = [sys.executable, script, *args]
+        print(f"  {stage}: {' '.join([script, *args[:8]])}{' ...' if len(args) > 8 else ''}"
+              f"{' (не запускается: --adopt)' if self.adopt else ''}")
+        if self.adopt:
+            return
+        result = subprocess.run(command, cwd=cwd or TASK_DIRS[stage], text=True,
+                                stdout=None if self.verbose else subprocess.PIPE, stderr=subprocess.STDOUT)
+        if result.returncode != 0:
+            if result.stdout:
+                print(result.stdout[-2000:])
+            raise StageError(f"{script} завершился с кодом {result.returncode}")
+
+    def code_hash(self, stage):
+        return self.hashes.combined([os.path.join(ROOT, path) for path in CODE[stage]])
+
+    def _stage_state(self, stage, code):
+        """Состояние этапа; при изменении кода или --force прежние хэши не учитываются"""
+        previous = self.state['stages'].get(stage, {})
+        if self.force or previous.get('code') != code:
+            previous = {}
+        return previous
+
+    def stage_crawl(self):
+        self.run_script('crawl', os.path.join('task_1', 'crawler.py'), '--incremental', cwd=ROOT)
+        return 1, 1
+
+    def stage_tokenize(self):
+        code = self.code_hash('tokenize')
+        previous = self._stage_state('tokenize', code).get('documents', {})
+        pages = {page_name(filename): os.path.join(DOWNLOADS_DIR, filename)
+                 for filename in sorted(os.listdir(DOWNLOADS_DIR)) if filename.endswith('.html')}
+
+        documents = {}
+        changed = []
+        for name, path in pages.items():
+            documents[name] = self.hashes(path)
+            outputs = [self.document_output(kind, name) for kind in DOCUMENT_OUTPUTS]
+            if previous.get(name) != documents[name] or not all(map(os.path.exists, outputs)):
+                changed.append(name)
+
+        removed = [name for name in previous if name not in pages]
+        if changed:
+            # при полном пересчете словарь лемм пишется заново, при частичном - дополняется
+            pages_args = [] if len(changed) == len(pages) else changed
+            self.run_script('tokenize', 'tokenization.py', '--positions', '--workers', str(self.workers),
+                            *pages_args)
+        for name in removed:
+            for kind in DOCUMENT_OUTPUTS:
+                if os.path.exists(self.document_output(kind, name)):
+                    os.remove(self.document_output(kind, name))
+
+        self.state['stages']['tokenize'] = {'code': code, 'documents': documents}
+        return len(changed) + len(removed), len(pages)
+
+    def document_output(self, kind, name):
+        return os.path.join(TASK_DIRS['tokenize'], kind, f"{name}.txt")
+
+    def stage_index(self):
+        code = self.code_hash('index')
+        stage_state = self._stage_state('index', code)
+        previous = stage_state.get('documents', {})
+        lemmas_dir = os.path.join(TASK_DIRS['tokenize'], 'lemmas')
+        names = sorted(filename.removesuffix('.txt') for filename in os.listdir(lemmas_dir))
+
+        documents = {name: self.hashes.combined([self.document_output('lemmas', name),
+                                                 self.document_output('counts', name)])
+                     for name in names}
+        changed = [name for name in names if previous.get(name) != documents[name]]
+        removed = [name for name in previous if name not in documents]
+        mode = 'segments' if self.segments else 'file'
+        output = os.path.join(SEGMENTS_DIR, 'manifest.json') if self.segments else INDEX_FILE
+        if stage_state.get('mode') != mode or not os.path.exists(output):
+            changed, removed = names, []
+
+        if self.segments and not os.path.exists(output):
+            self.run_script('index', 'segments.py', '--dir', SEGMENTS_DIR, 'init')
+        elif self.segments:
+            # документы меняются по одному сегменту, слияние по политике segments.py -
+            # один раз после всех изменений, а не внутри add
+            if changed:
+                self.run_script('index', 'segments.py', '--dir', SEGMENTS_DIR, 'add', *changed)
+            if removed:
+                self.run_script('index', 'segments.py', '--dir', SEGMENTS_DIR, 'delete', *removed)
+            if changed or removed:
+                self.run_script('index', 'segments.py', '--dir', SEGMENTS_DIR, 'merge')
+        elif changed or removed:
+            self.run_script('index', 'index.py', '--positions')
+
+        self.state['stages']['index'] = {'code': code, 'mode': mode, 'documents': documents}
+        return len(changed) + len(removed), len(names)
+
+    def stage_stream(self):
+        """Потоковая пересборка заданий 2-4 целиком, если изменилась хоть одна страница или код"""
+        code = self.hashes.combined([os.path.join(ROOT, path) for path in STREAM_CODE])
+        pages = [os.path.join(DOWNLOADS_DIR, filename)
+                 for filename in sorted(os.listdir(DOWNLOADS_DIR)) if filename.endswith('.html')]
+        inputs = self.hashes.combined(pages)
+        previous = self._stage_state('stream', code)
+        outputs = (INDEX_FILE, VECTORS_FILE, LEMMA_DICTIONARY)
+        rebuild = previous.get('inputs') != inputs or not all(map(os.path.exists, outputs))
+        if rebuild:
+            args = ['--memory', str(self.memory)] if self.memory else []
+            self.run_script('stream', 'streaming.py', *args, cwd=ROOT)
+        self.state['stages']['stream'] = {'code': code, 'inputs': inputs}
+        return len(pages) if rebuild else 0, len(pages)
+
+    def index_path(self):
+        return SEGMENTS_DIR if self.segments else INDEX_FILE
+
+    def index_hash(self):
+        if self.segments:
+            return self.hashes.combined([os.path.join(SEGMENTS_DIR, 'manifest.json')])
+        return self.hashes.combined([INDEX_FILE])
+
+    def stage_tf_idf(self):
+        # idf зависит от всего корпуса, поэтому векторы пересчитываются пачкой
+        code = self.code_hash('tf_idf')
+        inputs = self.index_hash()
+        previous = self._stage_state('tf_idf', code)
+        rebuild = previous.get('inputs') != inputs or not os.path.exists(VECTORS_FILE)
+        if rebuild:
+            self.run_script('tf_idf', 'tf_idf.py', '--index', self.index_path())
+        self.state['stages']['tf_idf'] = {'code': code, 'inputs': inputs}
+        return int(rebuild), 1
+
+    def stage_search(self):
+        """Артефакты поиска собирать не нужно - проверяется, что они согласованы друг с другом"""
+        inputs = self.hashes.combined([VECTORS_FILE, LEMMA_DICTIONARY]) + self.index_hash()
+        previous = self.state['stages'].get('search', {})
+        if not self.force and previous.get('inputs') == inputs:
+            return 0, 1
+
+        for path in (TASK_DIRS['tokenize'], TASK_DIRS['index'], TASK_DIRS['tf_idf']):
+            if path not in sys.path:
+                sys.path.append(path)
+        from segments import open_index
+        from vectors_format import VectorsReader
+
+        index = open_index(self.index_path())
+        vectors = VectorsReader(VECTORS_FILE)
+        indexed = {int(index.doc_names[number]) for number in index.live_docs()}
+        missing = indexed - set(vectors.vectors)
+        stale = set(vectors.vectors) - indexed
+        vectors.close()
+        index.close()
+        if missing or stale:
+            raise StageError(f"tf-idf векторы не совпадают с индексом: нет векторов для {sorted(missing)}, "
+                             f"лишние {sorted(stale)}")
+        print(f"  search: индекс и векторы согласованы, документов {len(indexed)}")
+        self.state['stages']['search'] = {'inputs': inputs}
+        return 1, 1
+
+    def print_report(self, wall_time):
+        print("\nВремя по этапам:")
+        print(f"  {'этап':<10} {'пересчитано':>12} {'хэшей':>6} {'время, с':>9}")
+        for stage, done, total, seconds, hashed in self.report:
+            print(f"  {stage:<10} {f'{done}/{total}':>12} {hashed:>6} {seconds:9.2f}")
+        print(f"  {'всего':<10} {'':>12} {'':>6} {wall_time:9.2f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Пересчет заданий 1-5 только для изменившихся входов")
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=None,
+                        help="этапы для запуска (по умолчанию все, кроме краулера)")
+    parser.add_argument('--crawl', action='store_true', help="начать с инкрементального обхода страниц")
+    parser.add_argument('--force', action='store_true', help="пересчитать все, не глядя на хэши")
+    parser.add_argument('--adopt', action='store_true',
+                        help="считать текущие артефакты актуальными: только записать хэши")
+    parser.add_argument('--segments', action='store_true',
+                        help="вести индекс сегментами (task_3/segments), а не перестраивать файл")
+    parser.add_argument('--workers', type=int, default=1, help="процессов для токенизации")
+    parser.add_argument('--verbose', action='store_true', help="показывать вывод скриптов")
+    parser.add_argument('--stream', action='store_true',
+                        help="токенизация, индекс и tf-idf одним потоковым проходом (streaming.py), "
+                             "без промежуточных файлов заданий 2 и 4")
+    parser.add_argument('--memory', type=float, default=None, help="бюджет памяти для --stream, МБ")
+    args = parser.parse_args()
+
+    stages = args.stages or [stage for stage in STAGES if stage != 'crawl' or args.crawl]
+    if args.stream:
+        if args.segments or os.path.isdir(SEGMENTS_DIR):
+            print("Ошибка: --stream собирает индекс одним файлом, с сегментами он не работает")
+            sys.exit(1)
+        streamed = [stage for stage in stages if stage in ('tokenize', 'index', 'tf_idf')]
+        stages = [stage for stage in stages if stage not in streamed]
+        if streamed:
+            stages.insert(stages.index('search') if 'search' in stages else len(stages), 'stream')
+    pipeline = Pipeline(force=args.force, adopt=args.adopt, segments=args.segments,
+                        workers=args.workers, verbose=args.verbose, memory=args.memory)
+    try:
+        pipeline.run(stages)
+    except StageError as e:
+        print(f"Ошибка: {e}")
+        sys.exit(1)
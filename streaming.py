@@ -0,0 +1,224 @@
+import argparse
+import contextlib
+import io
+import os
+import pickle
+import resource
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from functools import lru_cache
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+for task in ('task_2', 'task_3', 'task_4'):
+    sys.path.append(os.path.join(ROOT, task))
+
+import tf_idf
+from index_format import IndexWriter
+from spimi import DEFAULT_MEMORY_BUDGET, SpillingPostings, entry_size
+from tokenization import TextProcessor
+from vectors_format import VectorsWriter
+
+# Потоковая пересборка в одном процессе: страницы downloads/ по одной проходят
+# извлечение текста, токенизацию и лемматизацию (task_2) и сразу попадают в
+# накопитель постингов (task_3/spimi.py), который при превышении бюджета памяти
+# сбрасывает отсортированные прогоны на диск; в конце прогоны сливаются прямо в
+# inverted_index.bin. Частоты токенов документа по дороге пишутся во временный
+# файл, и второй проход по нему считает tf-idf (task_4) по готовому индексу;
+# импакты векторов инвертируются тем же накопителем. Результаты те же, что у
+# tokenization.py --positions, index.py --positions и tf_idf.py, но каталоги
+# clean/, tokens/, lemmas/, counts/ и tf_idf/{tokens,lemmas}/ пишутся только с
+# --debug-outputs. В памяти остаются только словарные структуры (кэш лемм,
+# словарь токен -> лемма, номера терминов при записи векторов) и по числу на документ.
+DOWNLOADS_DIR = os.path.join(ROOT, 'downloads')
+STAGES = ('read', 'extract', 'tokenize', 'lemmatize', 'save', 'index', 'tf_idf')
+# порог веса, как в tf_idf.write_weights
+MIN_WEIGHT = 0.0000001
+DF_CACHE_SIZE = 65536
+
+
+class StreamingBuild:
+    def __init__(self, output_root=ROOT, pages_dir=DOWNLOADS_DIR, memory_budget=DEFAULT_MEMORY_BUDGET,
+                 debug_outputs=False, temp_dir=None):
+        self.task_2_dir = os.path.join(output_root, 'task_2')
+        self.index_file = os.path.join(output_root, 'task_3', 'inverted_index.bin')
+        self.tf_idf_dir = os.path.join(output_root, 'task_4', 'tf_idf')
+        self.vectors_file = os.path.join(self.tf_idf_dir, 'lemmas.bin')
+        self.memory_budget = memory_budget
+        self.debug_outputs = debug_outputs
+        self.temp_dir = temp_dir
+
+        for directory in (self.task_2_dir, os.path.dirname(self.index_file), self.tf_idf_dir):
+            os.makedirs(directory, exist_ok=True)
+        if debug_outputs:
+            os.makedirs(os.path.join(self.tf_idf_dir, 'tokens'), exist_ok=True)
+            os.makedirs(os.path.join(self.tf_idf_dir, 'lemmas'), exist_ok=True)
+
+        self.processor = TextProcessor(pages_dir=pages_dir, output_dir=self.task_2_dir, verbose=False,
+                                       positions=True, write_outputs=debug_outputs)
+        self.timings = self.processor.timings
+        self.runs = {}
+        self.lemma_doc_frequency = lru_cache(maxsize=DF_CACHE_SIZE)(self._lemma_doc_frequency)
+
+    def run(self):
+        started = time.perf_counter()
+        with tempfile.TemporaryFile(dir=self.temp_dir) as forward:
+            doc_names, offsets = self.build_index(forward)
+            self.build_vectors(doc_names, offsets, forward)
+        self.processor.save_lemma_dictionary()
+        self.print_report(time.perf_counter() - started, len(doc_names))
+
+    def pages(self):
+        """Страницы по возрастанию имени документа - в этом порядке документы нумеруются в индексе"""
+        return sorted(self.processor.get_html_files(), key=self.processor.get_page_number)
+
+    def documents(self):
+        """Генератор (имя документа, [(токен, лемма или None, число вхождений, позиции)]) -
+        то же, что load_term_counts читает из counts/, но прямо из HTML"""
+        for path in self.pages():
+            page_num = self.processor.get_page_number(path)
+            tokens, lemmas, clean_text, term_counts = self.processor.process_file(path)
+            if not (tokens and clean_text):
+                continue
+
+            if self.debug_outputs:
+                self.processor.save_page(page_num, tokens, lemmas, clean_text, term_counts)
+            token_lemma = {token: lemma for lemma, lemma_tokens in lemmas.items() for token in lemma_tokens}
+            yield page_num, [(token, token_lemma.get(token), len(term_counts[token]), term_counts[token])
+                             for token in tokens]
+
+    def build_index(self, forward):
+        """Проход 1: постинги лемм с tf и позициями, как у index.py --positions.
+        Частоты токенов документа дописываются в forward для прохода 2"""
+        doc_names = []
+        doc_lengths = []
+        offsets = {}
+        with SpillingPostings(self.memory_budget, self.temp_dir) as postings:
+            for name, entries in self.documents():
+                started = time.perf_counter()
+                lemma_counts = defaultdict(int)
+                lemma_positions = defaultdict(list)
+                doc_length = 0
+                for token, lemma, count, positions in entries:
+                    doc_length += count
+                    if lemma is not None:
+                        lemma_counts[lemma] += count
+                        lemma_positions[lemma].extend(positions)
+
+                if lemma_counts:
+                    doc_id = len(doc_names)
+                    doc_names.append(name)
+                    doc_lengths.append(doc_length)
+                    offsets[name] = forward.tell()
+                    pickle.dump([entry[:3] for entry in entries], forward, protocol=pickle.HIGHEST_PROTOCOL)
+                    for lemma, count in lemma_counts.items():
+                        positions = sorted(lemma_positions[lemma])
+                        postings.add(lemma, (doc_id, count, positions), entry_size(len(positions)))
+                self.timings['index'] += time.perf_counter() - started
+
+            started = time.perf_counter()
+            with IndexWriter(self.index_file, doc_names, positions=True, frequencies=True) as writer:
+                writer.doc_lengths = doc_lengths
+                for lemma, entries in postings.merged():
+                    writer.add_term(lemma, [doc_id for doc_id, _, _ in entries],
+                                    [positions for _, _, positions in entries], [tf for _, tf, _ in entries])
+            self.runs['index'] = (postings.run_count, postings.spilled_bytes)
+            self.timings['index'] += time.perf_counter() - started
+        return doc_names, offsets
+
+    def build_vectors(self, doc_names, offsets, forward):
+        """Проход 2: tf-idf документов по готовому индексу в порядке tf_idf.py (по номеру документа)"""
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            tf_idf.parse_index(self.index_file)
+        self.lemma_doc_frequency.cache_clear()
+
+        with SpillingPostings(self.memory_budget, self.temp_dir) as impacts, \
+                VectorsWriter(self.vectors_file) as writer:
+            for name in sorted(doc_names, key=tf_idf.parse_doc_number):
+                forward.seek(offsets[name])
+                doc_id = tf_idf.parse_doc_number(name)
+                vector, lemma_idf = self.document_weights(doc_id, pickle.load(forward))
+                norm = writer.add_document(doc_id, vector)
+                for lemma, weight in vector.items():
+                    impacts.add(lemma, (doc_id, weight, weight / norm if norm > 0 else 0.0, lemma_idf[lemma]))
+
+            # idf леммы в файле векторов - из первого документа, как setdefault в tf_idf.py
+            for lemma, entries in impacts.merged():
+                writer.add_term(lemma, entries[0][3], [(doc_id, weight) for doc_id, weight, _, _ in entries],
+                                max(ratio for _, _, ratio, _ in entries))
+            self.runs['tf_idf'] = (impacts.run_count, impacts.spilled_bytes)
+        tf_idf.INDEX.close()
+        self.timings['tf_idf'] += time.perf_counter() - started
+
+    def document_weights(self, doc_id, entries):
+        """Вектор {лемма: tf-idf} документа и idf его лемм; с debug_outputs пишет еще
+        текстовые файлы tf_idf/tokens и tf_idf/lemmas"""
+        token_counts = {}
+        lemma_counts = {}
+        lemmas_to_tokens = {}
+        for token, lemma, count in entries:
+            token_counts[token] = count
+            if lemma is not None:
+                lemma_counts[lemma] = lemma_counts.get(lemma, 0) + count
+                lemmas_to_tokens.setdefault(lemma, []).append(token)
+        doc_size = sum(token_counts.values())
+
+        lemmas, idf, values = self.weights(lemma_counts, doc_size,
+                                           lambda lemma: self.lemma_doc_frequency(tuple(lemmas_to_tokens[lemma])))
+        vector = {}
+        lemma_idf = {}
+        for lemma, term_idf, value in zip(lemmas, idf, values):
+            if value > MIN_WEIGHT:
+                vector[lemma] = value
+                lemma_idf[lemma] = term_idf
+
+        if self.debug_outputs:
+            file_name = f"tf_{tf_idf.format_doc_number(doc_id)}.txt"
+            tf_idf.write_weights(os.path.join(self.tf_idf_dir, 'lemmas', file_name), lemmas, idf, values)
+            tf_idf.write_weights(os.path.join(self.tf_idf_dir, 'tokens', file_name),
+                                 *self.weights(token_counts, doc_size, tf_idf.doc_frequency))
+        return vector, lemma_idf
+
+    def weights(self, counts, doc_size, doc_frequency):
+        """Термины по убыванию частоты (при равенстве - в порядке появления), их idf и tf-idf -
+        в том же порядке и с тем же округлением, что CountMatrix и compute_tf_idf"""
+        terms = sorted(counts, key=lambda term: -counts[term])
+        idf = [float(tf_idf.solve_idf(doc_frequency(term))) for term in terms]
+        values = [round(counts[term] / doc_size * term_idf, tf_idf.digits) for term, term_idf in zip(terms, idf)]
+        return terms, idf, values
+
+    def _lemma_doc_frequency(self, tokens):
+        """Число документов индекса хотя бы с одним из токенов леммы, как lemma_idf_values"""
+        mask = 0
+        for token in tokens:
+            mask |= tf_idf.posting_mask(token)
+        return mask.bit_count()
+
+    def print_report(self, wall_time, doc_count):
+        print(f"Документов в индексе: {doc_count}, бюджет памяти {self.memory_budget / 2 ** 20:g} МБ")
+        for stage, (runs, spilled) in self.runs.items():
+            print(f"  {stage:<10} прогонов на диске: {runs}, сброшено {spilled / 2 ** 20:.1f} МБ")
+        print("Время по этапам:")
+        for stage in STAGES:
+            print(f"  {stage:<10} {self.timings[stage]:8.2f} с")
+        print(f"Общее время: {wall_time:.2f} с")
+        # ru_maxrss в Linux - в килобайтах
+        print(f"Пиковая память процесса: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} МБ")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Потоковая пересборка индекса и tf-idf прямо из downloads/")
+    parser.add_argument('--memory', type=float, default=DEFAULT_MEMORY_BUDGET / 2 ** 20,
+                        help="бюджет памяти накопителя постингов, МБ")
+    parser.add_argument('--debug-outputs', action='store_true',
+                        help="писать еще промежуточные файлы заданий 2 и 4 (clean/, tokens/, lemmas/, counts/, tf_idf/)")
+    parser.add_argument('--output-root', default=ROOT,
+                        help="корень для результатов (task_2/, task_3/, task_4/ внутри), по умолчанию репозиторий")
+    parser.add_argument('--temp-dir', default=None, help="каталог для прогонов и временных файлов")
+    args = parser.parse_args()
+
+    build = StreamingBuild(output_root=args.output_root, memory_budget=int(args.memory * 2 ** 20),
+                           debug_outputs=args.debug_outputs, temp_dir=args.temp_dir)
+    build.run()
@@ -0,0 +1,246 @@
+import argparse
+import asyncio
+import copy
+import hashlib
+import os
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from crawler import (BASE_URL, CHANGED_FILE, CITIES, INDEX_FILE, MANIFEST_FILE, OUTPUT_DIR,
+                     conditional_headers, load_manifest, page_filename, save_manifest, write_index)
+
+CONCURRENCY = 8
+RATE_PER_HOST = 2.0
+BURST = 4
+MAX_RETRIES = 5
+BACKOFF_BASE = 1.0
+CHUNK_SIZE = 64 * 1024
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+
+
+class TokenBucket:
+    """Ограничение частоты запросов: rate токенов в секунду, не более capacity подряд"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class HostRateLimiter:
+    def __init__(self, rate=RATE_PER_HOST, burst=BURST):
+        self.buckets = defaultdict(lambda: TokenBucket(rate, burst))
+
+    async def acquire(self, url):
+        await self.buckets[urlsplit(url).netloc].acquire()
+
+
+def retry_delay(response, attempt):
+    retry_after = response.headers.get('Retry-After') if response is not None else None
+    if retry_after and retry_after.isdigit():
+        return float(retry_after)
+    return BACKOFF_BASE * 2 ** attempt
+
+
+async def fetch_to_file(session, limiter, url, filepath, headers=None, max_retries=MAX_RETRIES):
+    """Скачивает страницу потоково во временный файл .part.
+
+    Возвращает (status, headers, (sha256, путь к .part)) или (304, headers, None).
+    Недокачанный .part удаляется, в том числе при обрыве тела ответа и отмене.
+    """
+    tmp_path = filepath + ".part"
+    for attempt in range(max_retries + 1):
+        await limiter.acquire(url)
+        try:
+            async with session.get(url, headers=headers) as response:
+                if response.status == 304:
+                    return 304, response.headers, None
+
+                if response.status in RETRY_STATUSES and attempt < max_retries:
+                    delay = retry_delay(response, attempt)
+                    print(f"{response.status} для {url}, повтор через {delay:.1f} с")
+                    await asyncio.sleep(delay)
+                    continue
+
+                response.raise_for_status()
+
+                digest = hashlib.sha256()
+                complete = False
+                try:
+                    with open(tmp_path, 'wb') as f:
+                        async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                            digest.update(chunk)
+                            f.write(chunk)
+                    complete = True
+                finally:
+                    if not complete and os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+
+                return response.status, response.headers, (digest.hexdigest(), tmp_path)
+
+        except (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError) as e:
+            if attempt >= max_retries:
+                raise
+            delay = retry_delay(None, attempt)
+            print(f"Ошибка соединения для {url}: {e}, повтор через {delay:.1f} с")
+            await asyncio.sleep(delay)
+
+
+def contiguous_done(done):
+    """Сколько позиций подряд с первой уже обработано - run['last_index'] для crawler.py"""
+    done = set(done)
+    last = 0
+    while last + 1 in done:
+        last += 1
+    return last
+
+
+async def crawl_async(cities, base_url=BASE_URL, output_dir=OUTPUT_DIR,
+                      manifest_path=MANIFEST_FILE, index_file=INDEX_FILE,
+                      incremental=False, concurrency=CONCURRENCY,
+                      rate=RATE_PER_HOST, burst=BURST):
+    """Параллельная загрузка страниц, возвращает список изменившихся файлов.
+
+    Страницы завершаются не по порядку, поэтому кроме run['failed'] в манифесте
+    хранится run['done'] - обработанные позиции; продолжение запуска с
+    --incremental загружает неудачные и еще не обработанные страницы.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    manifest = load_manifest(manifest_path) if incremental else {'pages': {}, 'run': None}
+    run = manifest.get('run')
+    if incremental and run and not run.get('completed'):
+        run.setdefault('failed', [])
+        # манифест прерванного crawler.py: обработаны позиции до last_index
+        run.setdefault('done', [i for i in range(1, run['last_index'] + 1) if i not in run['failed']])
+        run.setdefault('changed', [])
+        print(f"Продолжаю прерванный запуск: обработано {len(run['done'])}, "
+              f"повторяю неудачные: {len(run['failed'])}")
+    else:
+        run = {'started_at': datetime.now(timezone.utc).isoformat(),
+               'last_index': 0, 'completed': False, 'changed': [], 'failed': [], 'done': []}
+        manifest['run'] = run
+    changed = run['changed']
+    failed = run['failed']
+    done = set(run['done'])
+
+    limiter = HostRateLimiter(rate, burst)
+    semaphore = asyncio.Semaphore(concurrency)
+    save_lock = asyncio.Lock()
+    timeout = aiohttp.ClientTimeout(total=60)
+    total = len(cities)
+
+    async def save():
+        # снимок пишется в потоке, чтобы не останавливать загрузки; замок
+        # сохраняет порядок записей и не дает двум записям делить один .tmp
+        async with save_lock:
+            run['done'] = sorted(done)
+            run['last_index'] = contiguous_done(done)
+            snapshot = copy.deepcopy(manifest)
+            await asyncio.to_thread(save_manifest, snapshot, manifest_path)
+
+    async def process(session, i, city):
+        url = f"{base_url}/{city}"
+        filename = page_filename(i)
+        filepath = os.path.join(output_dir, filename)
+        entry = manifest['pages'].get(url)
+        headers = conditional_headers(entry) if incremental and os.path.exists(filepath) else None
+
+        async with semaphore:
+            try:
+                status, response_headers, body = await fetch_to_file(session, limiter, url, filepath, headers)
+            except Exception as e:
+                print(f"[{i}/{total}] Ошибка {city}: {e}")
+                if i not in failed:
+                    failed.append(i)
+                done.add(i)
+                await save()
+                return
+
+        if status == 304:
+            print(f"[{i}/{total}] Не изменилась: {filename}")
+        else:
+            content_hash, tmp_path = body
+            if entry and entry.get('sha256') == content_hash and os.path.exists(filepath):
+                os.remove(tmp_path)
+                print(f"[{i}/{total}] Содержимое не изменилось: {filename}")
+            else:
+                os.replace(tmp_path, filepath)
+                if filename not in changed:
+                    changed.append(filename)
+                print(f"[{i}/{total}] Сохранено: {filename}")
+
+            entry = {
+                'url': url,
+                'file': filename,
+                'etag': response_headers.get('ETag'),
+                'last_modified': response_headers.get('Last-Modified'),
+                'sha256': content_hash,
+            }
+
+        entry['fetched_at'] = datetime.now(timezone.utc).isoformat()
+        manifest['pages'][url] = entry
+        if i in failed:
+            failed.remove(i)
+        done.add(i)
+        await save()
+
+    pending = [i for i in range(1, total + 1) if i in failed or i not in done]
+    async with aiohttp.ClientSession(headers={'User-Agent': USER_AGENT}, timeout=timeout) as session:
+        await asyncio.gather(*(process(session, i, cities[i - 1]) for i in pending))
+
+    failed.sort()
+    changed.sort()
+    run['completed'] = not failed
+    if failed:
+        print(f"Не загружено страниц: {len(failed)} ({', '.join(map(page_filename, failed))}), "
+              f"повторите запуск с --incremental")
+    await save()
+    write_index(manifest, index_file)
+
+    return changed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Асинхронный краулер страниц городов")
+    parser.add_argument('--concurrency', type=int, default=CONCURRENCY,
+                        help="максимум одновременных загрузок")
+    parser.add_argument('--rate', type=float, default=RATE_PER_HOST,
+                        help="запросов в секунду на один хост")
+    parser.add_argument('--burst', type=int, default=BURST)
+    parser.add_argument('--incremental', action='store_true')
+    parser.add_argument('--base-url', default=BASE_URL)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    changed = asyncio.run(crawl_async(CITIES[:100], base_url=args.base_url,
+                                      incremental=args.incremental,
+                                      concurrency=args.concurrency,
+                                      rate=args.rate, burst=args.burst))
+    elapsed = time.perf_counter() - started
+
+    with open(CHANGED_FILE, 'w', encoding='utf-8') as f:
+        for filename in changed:
+            f.write(f"{filename}\n")
+
+    print(f"Изменилось документов: {len(changed)} (список в {CHANGED_FILE}), время: {elapsed:.1f} с")
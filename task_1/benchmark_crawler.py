@@ -0,0 +1,86 @@
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+
+from aiohttp import web
+
+from async_crawler import crawl_async
+from crawler import crawl, make_session
+
+
+def make_mock_app(page_size, latency, error_rate):
+    body = ("<html><body>" + "Город " * (page_size // 12) + "</body></html>").encode('utf-8')
+
+    async def handle(request):
+        await asyncio.sleep(latency)
+        if random.random() < error_rate:
+            return web.Response(status=503)
+        return web.Response(body=body, content_type='text/html')
+
+    app = web.Application()
+    app.router.add_get('/wiki/{name}', handle)
+    return app
+
+
+def start_mock_server(port, page_size, latency, error_rate):
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(make_mock_app(page_size, latency, error_rate))
+
+    def run():
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(runner.setup())
+        loop.run_until_complete(web.TCPSite(runner, '127.0.0.1', port).start())
+        loop.run_forever()
+
+    threading.Thread(target=run, daemon=True).start()
+    time.sleep(0.5)
+
+
+def run_benchmark(pages, base_url, concurrency):
+    cities = [f"Город_{i}" for i in range(1, pages + 1)]
+    work_dir = tempfile.mkdtemp()
+
+    try:
+        def paths(name):
+            return {
+                'output_dir': os.path.join(work_dir, name),
+                'manifest_path': os.path.join(work_dir, f"{name}_manifest.json"),
+                'index_file': os.path.join(work_dir, f"{name}_index.txt"),
+            }
+
+        started = time.perf_counter()
+        crawl(make_session(), cities, base_url=base_url, delay=0, **paths('serial'))
+        serial_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        asyncio.run(crawl_async(cities, base_url=base_url, concurrency=concurrency,
+                                rate=1000, burst=concurrency, **paths('async')))
+        async_time = time.perf_counter() - started
+    finally:
+        shutil.rmtree(work_dir)
+
+    print("-" * 10)
+    print(f"Страниц: {pages}")
+    print(f"Последовательный краулер: {serial_time:.2f} с, {pages / serial_time:.1f} стр/с")
+    print(f"Асинхронный краулер (concurrency={concurrency}): {async_time:.2f} с, "
+          f"{pages / async_time:.1f} стр/с")
+    print(f"Ускорение: {serial_time / async_time:.1f}x")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Сравнение пропускной способности краулеров на локальном сервере")
+    parser.add_argument('--pages', type=int, default=200)
+    parser.add_argument('--page-size', type=int, default=550_000, help="размер страницы, байт")
+    parser.add_argument('--latency', type=float, default=0.05, help="задержка ответа сервера, секунд")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="доля ответов 503")
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    start_mock_server(args.port, args.page_size, args.latency, args.error_rate)
+    run_benchmark(args.pages, f"http://127.0.0.1:{args.port}/wiki", args.concurrency)
@@ -1,11 +1,17 @@
+import argparse
+import hashlib
+import json
 import os
 import time
+from datetime import datetime, timezone
 import requests
 from urllib.parse import quote
 
 BASE_URL = "https://ru.ruwiki.ru/wiki/"
 OUTPUT_DIR = "downloads"
 INDEX_FILE = "index.txt"
+MANIFEST_FILE = "manifest.json"
+CHANGED_FILE = "changed.txt"
 REQUEST_DELAY = 10
 
 CITIES = [
@@ -31,38 +37,166 @@ CITIES = [
     "Подольск", "Петропавловск-Камчатский", "Норильск", "Сызрань", "Мытищи"
 ]
 
-if not os.path.exists(OUTPUT_DIR):
-    os.makedirs(OUTPUT_DIR)
-if os.path.exists(INDEX_FILE):
-    os.remove(INDEX_FILE)
-
-session = requests.Session()
-session.headers.update({
-    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-})
-
-for i, city in enumerate(CITIES[:100], 1):
-    url = f"{BASE_URL}/{city}"
-    
-    filename = f"page_{i:03d}.html"
-    filepath = os.path.join(OUTPUT_DIR, filename)
-    
-    print(f"[{i}/100] Загружаю: {city}")
-    
-    try:
-        response = session.get(url, timeout=15)
-        response.encoding = 'utf-8'
-        
-        with open(filepath, 'w', encoding='utf-8') as f:
-            f.write(response.text)
-        
-        with open(INDEX_FILE, 'a', encoding='utf-8') as f:
-            f.write(f"{filename}\t{url}\n")
-        
-        print(f"Сохранено: {filename}")
-        
-        if i < 100:
-            time.sleep(REQUEST_DELAY)
-            
-    except Exception as e:
-        print(f"Ошибка: {e}")
+
+def page_filename(i):
+    return f"page_{i:03d}.html"
+
+
+def load_manifest(path=MANIFEST_FILE):
+    """Манифест: {'pages': {url: запись}, 'run': состояние последнего запуска}.
+
+    run['last_index'] - дальше какой позиции запуск уже дошел, run['failed'] -
+    позиции страниц, которые загрузить не удалось: продолжение прерванного или
+    неполного запуска начинает с них. Запуск завершен, только когда failed пуст.
+    """
+    if not os.path.exists(path):
+        return {'pages': {}, 'run': None}
+
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, path=MANIFEST_FILE):
+    # пишем во временный файл и подменяем, чтобы падение не испортило манифест
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def write_index(manifest, index_file=INDEX_FILE):
+    entries = sorted(manifest['pages'].values(), key=lambda entry: entry['file'])
+    with open(index_file, 'w', encoding='utf-8') as f:
+        for entry in entries:
+            f.write(f"{entry['file']}\t{entry['url']}\n")
+
+
+def conditional_headers(entry):
+    headers = {}
+    if entry and entry.get('etag'):
+        headers['If-None-Match'] = entry['etag']
+    if entry and entry.get('last_modified'):
+        headers['If-Modified-Since'] = entry['last_modified']
+    return headers
+
+
+def make_session():
+    session = requests.Session()
+    session.headers.update({
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+    })
+    return session
+
+
+def crawl(session, cities, base_url=BASE_URL, output_dir=OUTPUT_DIR,
+          manifest_path=MANIFEST_FILE, index_file=INDEX_FILE,
+          incremental=False, delay=REQUEST_DELAY):
+    """Скачивает страницы, возвращает список изменившихся файлов"""
+    os.makedirs(output_dir, exist_ok=True)
+
+    manifest = load_manifest(manifest_path)
+    if not incremental:
+        manifest = {'pages': {}, 'run': None}
+        if os.path.exists(index_file):
+            os.remove(index_file)
+
+    run = manifest.get('run')
+    start = 1
+    changed = []
+    if incremental and run and not run.get('completed'):
+        start = run['last_index'] + 1
+        changed = run.get('changed', [])
+        run.setdefault('failed', [])
+        print(f"Продолжаю прерванный запуск с позиции {start}, повторяю неудачные: {len(run['failed'])}")
+    else:
+        run = {'started_at': datetime.now(timezone.utc).isoformat(),
+               'last_index': 0, 'completed': False, 'changed': changed, 'failed': []}
+        manifest['run'] = run
+
+    failed = run['failed']
+    total = len(cities)
+    # сначала страницы, не загруженные прежде, затем оставшиеся по порядку
+    pending = sorted(i for i in failed if i < start) + list(range(start, total + 1))
+    for position, i in enumerate(pending):
+        city = cities[i - 1]
+        url = f"{base_url}/{city}"
+        filename = page_filename(i)
+        filepath = os.path.join(output_dir, filename)
+        entry = manifest['pages'].get(url)
+
+        print(f"[{i}/{total}] Загружаю: {city}")
+
+        try:
+            headers = conditional_headers(entry) if incremental and os.path.exists(filepath) else {}
+            response = session.get(url, timeout=15, headers=headers)
+
+            if response.status_code == 304:
+                print(f"Не изменилась: {filename}")
+            else:
+                response.raise_for_status()
+                response.encoding = 'utf-8'
+                content_hash = hashlib.sha256(response.content).hexdigest()
+
+                if entry and entry.get('sha256') == content_hash and os.path.exists(filepath):
+                    print(f"Содержимое не изменилось: {filename}")
+                else:
+                    with open(filepath, 'w', encoding='utf-8') as f:
+                        f.write(response.text)
+                    changed.append(filename)
+                    print(f"Сохранено: {filename}")
+
+                entry = {
+                    'url': url,
+                    'file': filename,
+                    'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified'),
+                    'sha256': content_hash,
+                }
+
+            entry['fetched_at'] = datetime.now(timezone.utc).isoformat()
+            manifest['pages'][url] = entry
+            if i in failed:
+                failed.remove(i)
+            run['last_index'] = max(run['last_index'], i)
+
+        except Exception as e:
+            print(f"Ошибка: {e}")
+            if i not in failed:
+                failed.append(i)
+            run['last_index'] = max(run['last_index'], i)
+
+        finally:
+            save_manifest(manifest, manifest_path)
+            # пауза и после ошибки: следующий запрос не должен идти сразу
+            if position < len(pending) - 1:
+                time.sleep(delay)
+
+    run['completed'] = not failed
+    if failed:
+        print(f"Не загружено страниц: {len(failed)} ({', '.join(map(page_filename, sorted(failed)))}), "
+              f"повторите запуск с --incremental")
+    save_manifest(manifest, manifest_path)
+    write_index(manifest, index_file)
+
+    return changed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Краулер страниц городов")
+    parser.add_argument('--incremental', action='store_true',
+                        help="условные запросы по манифесту, пропуск неизменившихся страниц")
+    parser.add_argument('--delay', type=float, default=REQUEST_DELAY,
+                        help="пауза между запросами, секунд")
+    parser.add_argument('--base-url', default=BASE_URL)
+    parser.add_argument('--manifest', default=MANIFEST_FILE)
+    args = parser.parse_args()
+
+    changed = crawl(make_session(), CITIES[:100], base_url=args.base_url,
+                    manifest_path=args.manifest, incremental=args.incremental,
+                    delay=args.delay)
+
+    with open(CHANGED_FILE, 'w', encoding='utf-8') as f:
+        for filename in changed:
+            f.write(f"{filename}\n")
+
+    print(f"Изменилось документов: {len(changed)} (список в {CHANGED_FILE})")
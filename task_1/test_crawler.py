@@ -0,0 +1,204 @@
+import asyncio
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import async_crawler
+import crawler
+from async_crawler import crawl_async
+from crawler import crawl, load_manifest, make_session
+
+CITIES = [f"city{i}" for i in range(1, 6)]
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Страница /wiki/<имя> с ETag; имена из server.failing отвечают 503,
+    из server.truncated - обрывают тело ответа (один раз на каждое упоминание)"""
+
+    def do_GET(self):
+        name = self.path.rsplit('/', 1)[-1]
+        self.server.requests.append(name)
+        if name in self.server.failing:
+            self.send_response(503)
+            self.end_headers()
+            return
+
+        etag = f'"{name}-v1"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        body = f"<html><body>{name}</body></html>".encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.end_headers()
+        if name in self.server.truncated:
+            self.server.truncated.remove(name)
+            self.wfile.write(body[:len(body) // 2])
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+    httpd.failing = set()
+    httpd.truncated = []
+    httpd.requests = []
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def paths(tmp_path):
+    return {
+        'output_dir': str(tmp_path / 'downloads'),
+        'manifest_path': str(tmp_path / 'manifest.json'),
+        'index_file': str(tmp_path / 'index.txt'),
+    }
+
+
+def base_url(server):
+    return f"http://127.0.0.1:{server.server_address[1]}/wiki"
+
+
+def index_files(paths):
+    with open(paths['index_file'], encoding='utf-8') as f:
+        return [line.split('\t')[0] for line in f]
+
+
+class InterruptingSession:
+    """Сессия, которая обрывает запуск (как Ctrl+C) на запросе к странице stop_at"""
+
+    def __init__(self, stop_at):
+        self.session = make_session()
+        self.stop_at = stop_at
+
+    def get(self, url, **kwargs):
+        if url.endswith(f"/{self.stop_at}"):
+            raise KeyboardInterrupt
+        return self.session.get(url, **kwargs)
+
+
+def test_full_crawl(server, paths):
+    changed = crawl(make_session(), CITIES, base_url=base_url(server), delay=0, **paths)
+
+    assert changed == [f"page_{i:03d}.html" for i in range(1, 6)]
+    assert index_files(paths) == changed
+    run = load_manifest(paths['manifest_path'])['run']
+    assert run['completed'] and run['failed'] == []
+
+
+def test_failed_page_is_retried_and_run_stays_incomplete(server, paths):
+    server.failing = {'city2'}
+    crawl(make_session(), CITIES, base_url=base_url(server), delay=0, **paths)
+
+    run = load_manifest(paths['manifest_path'])['run']
+    assert not run['completed']
+    assert run['failed'] == [2]
+    assert 'page_002.html' not in index_files(paths)
+
+    server.failing = set()
+    server.requests.clear()
+    changed = crawl(make_session(), CITIES, base_url=base_url(server), delay=0, incremental=True, **paths)
+
+    assert server.requests == ['city2']
+    assert 'page_002.html' in changed
+    run = load_manifest(paths['manifest_path'])['run']
+    assert run['completed'] and run['failed'] == []
+    assert len(index_files(paths)) == 5
+
+
+def test_resume_after_crash_retries_earlier_failure(server, paths):
+    server.failing = {'city1'}
+    with pytest.raises(KeyboardInterrupt):
+        crawl(InterruptingSession('city4'), CITIES, base_url=base_url(server), delay=0, **paths)
+
+    run = load_manifest(paths['manifest_path'])['run']
+    assert run['failed'] == [1]
+    assert run['last_index'] == 3
+
+    server.failing = set()
+    server.requests.clear()
+    crawl(make_session(), CITIES, base_url=base_url(server), delay=0, incremental=True, **paths)
+
+    # сначала повторена неудачная страница, затем запуск продолжен с прерванной
+    assert server.requests == ['city1', 'city4', 'city5']
+    assert sorted(os.listdir(paths['output_dir'])) == [f"page_{i:03d}.html" for i in range(1, 6)]
+    assert load_manifest(paths['manifest_path'])['run']['completed']
+    assert len(index_files(paths)) == 5
+
+
+def test_delay_after_errors(server, paths, monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(crawler.time, 'sleep', sleeps.append)
+    server.failing = {'city1', 'city3'}
+
+    crawl(make_session(), CITIES, base_url=base_url(server), delay=7, **paths)
+
+    # пауза между всеми соседними запросами, в том числе после неудачных
+    assert sleeps == [7] * (len(CITIES) - 1)
+
+
+def crawl_fast(server, paths, **kwargs):
+    return asyncio.run(crawl_async(CITIES, base_url=base_url(server), rate=1000, burst=100, **paths, **kwargs))
+
+
+@pytest.fixture
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(async_crawler, 'BACKOFF_BASE', 0)
+
+
+def test_async_failed_page_is_retried_and_run_stays_incomplete(server, paths, no_backoff):
+    server.failing = {'city3'}
+    crawl_fast(server, paths)
+
+    run = load_manifest(paths['manifest_path'])['run']
+    assert not run['completed']
+    assert run['failed'] == [3]
+    assert run['done'] == [1, 2, 3, 4, 5]
+    assert 'page_003.html' not in index_files(paths)
+
+    server.failing = set()
+    server.requests.clear()
+    changed = crawl_fast(server, paths, incremental=True)
+
+    assert server.requests == ['city3']
+    assert 'page_003.html' in changed
+    run = load_manifest(paths['manifest_path'])['run']
+    assert run['completed'] and run['failed'] == []
+    assert len(index_files(paths)) == 5
+
+
+def test_async_manifest_saved_per_page(server, paths, no_backoff, monkeypatch):
+    saved = []
+    monkeypatch.setattr(async_crawler, 'save_manifest',
+                        lambda manifest, path: saved.append(sorted(manifest['run']['done'])))
+    crawl_fast(server, paths)
+
+    # по записи на каждую страницу и итоговая
+    assert len(saved) == len(CITIES) + 1
+    assert saved[-1] == [1, 2, 3, 4, 5]
+
+
+def test_async_truncated_body_is_retried_without_part_files(server, paths, no_backoff):
+    server.truncated = ['city2', 'city2']
+    crawl_fast(server, paths)
+
+    assert server.requests.count('city2') == 3
+    assert sorted(os.listdir(paths['output_dir'])) == [f"page_{i:03d}.html" for i in range(1, 6)]
+    with open(os.path.join(paths['output_dir'], 'page_002.html'), encoding='utf-8') as f:
+        assert f.read() == "<html><body>city2</body></html>"
+    assert load_manifest(paths['manifest_path'])['run']['completed']
@@ -0,0 +1,56 @@
+import argparse
+import os
+import sys
+import time
+
+from html_extract import extract_text, extract_text_soup
+
+EXTRACTORS = {
+    'soup': extract_text_soup,
+    'stream': extract_text,
+}
+
+
+def load_pages(pages_dir, limit=None):
+    names = sorted(f for f in os.listdir(pages_dir) if f.endswith('.html'))[:limit]
+    pages = []
+    for name in names:
+        with open(os.path.join(pages_dir, name), 'r', encoding='utf-8') as f:
+            pages.append((name, f.read()))
+    return pages
+
+
+def run(extract, pages, repeat):
+    """Лучшее время из repeat прогонов и тексты последнего прогона"""
+    best = float('inf')
+    texts = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        texts = [extract(html) for _, html in pages]
+        best = min(best, time.perf_counter() - started)
+    return best, texts
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Скорость извлечения текста: дерево BeautifulSoup и потоковый разбор")
+    parser.add_argument('--pages', default='../downloads', help="каталог со скачанными страницами")
+    parser.add_argument('--limit', type=int, default=None, help="взять только первые N страниц")
+    parser.add_argument('--repeat', type=int, default=1, help="прогонов, берется лучший")
+    args = parser.parse_args()
+
+    pages = load_pages(args.pages, args.limit)
+    size_mb = sum(len(html.encode('utf-8')) for _, html in pages) / 2 ** 20
+    print(f"Страниц: {len(pages)}, {size_mb:.1f} МБ")
+
+    results = {}
+    for name, extract in EXTRACTORS.items():
+        elapsed, texts = run(extract, pages, args.repeat)
+        results[name] = texts
+        print(f"{name:8s} {elapsed:7.2f} с  {size_mb / elapsed:6.2f} МБ/с  {elapsed / len(pages) * 1e3:7.1f} мс/стр")
+
+    mismatches = [page for (page, _), soup_text, stream_text in zip(pages, results['soup'], results['stream'])
+                  if soup_text != stream_text]
+    if mismatches:
+        print(f"Тексты различаются на {len(mismatches)} страницах: {', '.join(mismatches[:10])}")
+        sys.exit(1)
+    print("Тексты совпадают на всех страницах")
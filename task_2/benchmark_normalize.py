@@ -0,0 +1,103 @@
+import argparse
+import contextlib
+import io
+import os
+import re
+import sys
+import time
+from collections import Counter
+
+from benchmark_extract import load_pages
+from html_extract import extract_raw_text, filter_text
+from tokenization import TextProcessor
+
+
+def legacy_filter_text(text):
+    """Прежняя очистка: два прохода re.sub и два некомпилированных шаблона на предложение"""
+    text = re.sub(r'\s+', ' ', text)
+    meaningful_lines = []
+    for line in text.split('. '):
+        if re.search(r'https?://|\.(jpg|png|svg|css|js)|\d+px|data:image|window\.|function\(', line, re.IGNORECASE):
+            continue
+        if re.search(r'[{}\[\]<>]|var |let |const |return |if\(', line):
+            continue
+        if line.strip():
+            meaningful_lines.append(line.strip())
+    return re.sub(r'\s+', ' ', '. '.join(meaningful_lines))
+
+
+def legacy_tokenize(text, stop_words):
+    """Прежняя токенизация: список всех слов, затем фильтр в цикле"""
+    clean_words = []
+    for word in re.findall(r'\b[а-яё]{2,30}\b', text.lower()):
+        if word in stop_words or len(word) > 25:
+            continue
+        clean_words.append(word)
+    return clean_words
+
+
+def best_time(function, items, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for item in items:
+            function(item)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def check_outputs(processor, pages, raw_texts, output_dir):
+    """Сверка новой очистки и токенизации с сохраненными clean/ и tokens/ и со старым кодом"""
+    mismatches = []
+    for (name, _), raw_text in zip(pages, raw_texts):
+        page_num = processor.get_page_number(name)
+        clean_text = filter_text(raw_text)
+        tokens = Counter(processor.tokenize(clean_text))
+
+        with open(os.path.join(output_dir, 'clean', f"{page_num}.txt"), encoding='utf-8') as f:
+            saved_clean = f.read()
+        with open(os.path.join(output_dir, 'tokens', f"{page_num}.txt"), encoding='utf-8') as f:
+            saved_tokens = f.read().split()
+
+        if (clean_text != saved_clean or clean_text != legacy_filter_text(raw_text)
+                or sorted(tokens) != saved_tokens
+                or tokens != Counter(legacy_tokenize(clean_text, processor.stop_words))):
+            mismatches.append(name)
+    return mismatches
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Скорость очистки текста и токенизации, сверка с clean/ и tokens/")
+    parser.add_argument('--pages', default='../downloads', help="каталог со скачанными страницами")
+    parser.add_argument('--limit', type=int, default=None, help="взять только первые N страниц")
+    parser.add_argument('--repeat', type=int, default=5, help="прогонов, берется лучший")
+    args = parser.parse_args()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        processor = TextProcessor(pages_dir=args.pages, output_dir='.', verbose=False)
+
+    pages = load_pages(args.pages, args.limit)
+    raw_texts = [extract_raw_text(html) for _, html in pages]
+    clean_texts = [filter_text(text) for text in raw_texts]
+    size_mb = sum(len(text.encode('utf-8')) for text in raw_texts) / 2 ** 20
+    print(f"Страниц: {len(pages)}, извлеченного текста {size_mb:.1f} МБ")
+
+    stop_words = processor.stop_words
+    cases = [
+        ('очистка', legacy_filter_text, filter_text, raw_texts),
+        ('токенизация', lambda text: legacy_tokenize(text, stop_words),
+         lambda text: list(processor.tokenize(text)), clean_texts),
+        ('подсчет токенов', lambda text: Counter(legacy_tokenize(text, stop_words)),
+         lambda text: Counter(processor.tokenize(text)), clean_texts),
+    ]
+    print(f"{'Этап':18s} {'было, мс':>10s} {'стало, мс':>10s} {'ускорение':>10s}")
+    for name, legacy, current, items in cases:
+        legacy_time = best_time(legacy, items, args.repeat)
+        current_time = best_time(current, items, args.repeat)
+        print(f"{name:18s} {legacy_time * 1e3:10.1f} {current_time * 1e3:10.1f} {legacy_time / current_time:9.2f}x")
+
+    mismatches = check_outputs(processor, pages, raw_texts, '.')
+    if mismatches:
+        print(f"Результат отличается на {len(mismatches)} страницах: {', '.join(mismatches[:10])}")
+        sys.exit(1)
+    print("clean/ и tokens/ совпадают с сохраненными на всех страницах")
@@ -0,0 +1,221 @@
+import re
+from html.parser import HTMLParser
+
+from bs4 import BeautifulSoup
+from bs4.dammit import EntitySubstitution, UnicodeDammit
+
+# Извлечение текста страницы. extract_text читает HTML потоком событий
+# html.parser и не строит дерево: поддеревья ненужных тегов и классов
+# пропускаются прямо при чтении, текст собирается только из первого
+# подходящего div и разбор останавливается, как только он закрыт. Стек
+# открытых тегов ведется так же, как у BeautifulSoup с html.parser (закрывающий
+# тег снимает стек до последнего открытого тега с тем же именем, пустые
+# элементы закрываются сразу), поэтому результат совпадает с extract_text_soup -
+# прежней реализацией на дереве BeautifulSoup.
+
+REMOVED_TAGS = frozenset(['script', 'style', 'meta', 'link', 'noscript', 'header', 'footer', 'nav', 'aside',
+                          'form', 'button', 'iframe'])
+REMOVED_CLASS_RE = re.compile(r'(sidebar|menu|nav|footer|header|banner|adv|advert|popup|modal)')
+CONTENT_CLASS_RE = re.compile(r'content|article|mw-parser-output|page|main')
+# пустые элементы и теги, строки внутри которых get_text не учитывает, - как в bs4
+VOID_TAGS = frozenset(['area', 'base', 'basefont', 'bgsound', 'br', 'col', 'command', 'embed', 'frame', 'hr',
+                       'image', 'img', 'input', 'isindex', 'keygen', 'link', 'menuitem', 'meta', 'nextid',
+                       'param', 'source', 'spacer', 'track', 'wbr'])
+STRING_CONTAINERS = frozenset(['rt', 'rp', 'style', 'script', 'template'])
+# предложение со ссылкой, картинкой, размером или кусочком кода - мусор. Опережающая
+# проверка первого символа отсекает почти все позиции, где ни одна ветка не начнется
+JUNK_RE = re.compile(r'(?=[hH.\ddDwWfF{}\[\]<>vlcri])'
+                     r'(?:(?i:https?://|\.(jpg|png|svg|css|js)|\d+px|data:image|window\.|function\()'
+                     r'|[{}\[\]<>]|var |let |const |return |if\()')
+
+
+def filter_text(text):
+    """Склеивает пробелы и выбрасывает мусорные предложения за один проход по тексту"""
+    search_junk = JUNK_RE.search
+    collapsed = ' '.join(text.split())
+    if text[-1:].isspace():
+        # пробел в конце значим для шаблонов вида 'var '
+        collapsed += ' '
+    # мусор ищется до strip по той же причине
+    return '. '.join(line.strip() for line in collapsed.split('. ') if line.strip() and not search_junk(line))
+
+
+def extract_text_soup(html_content):
+    """Прежняя реализация: полное дерево BeautifulSoup"""
+    soup = BeautifulSoup(html_content, 'html.parser')
+
+    for element in soup(list(REMOVED_TAGS)):
+        element.decompose()
+
+    for element in soup.find_all(class_=REMOVED_CLASS_RE):
+        element.decompose()
+
+    main_content = soup.find('div', class_=CONTENT_CLASS_RE)
+    if not main_content:
+        main_content = soup.find('body')
+
+    if main_content:
+        text = main_content.get_text(separator=' ', strip=True)
+    else:
+        text = soup.get_text(separator=' ', strip=True)
+
+    return filter_text(text)
+
+
+class _ContentClosed(Exception):
+    pass
+
+
+class StreamingExtractor(HTMLParser):
+    """Текст первого div с CONTENT_CLASS_RE (иначе body, иначе всего документа)
+    без удаленных поддеревьев. Элемент стека - (тег, удален, строки не считаются)"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.stack = []
+        self.open_counts = {}
+        self.closed_void = []
+        self.data = []
+        self.main_depth = None
+        self.body_depth = None
+        self.body_closed = False
+        self.main_strings = []
+        self.body_strings = []
+        self.document_strings = []
+
+    def text(self):
+        if self.main_depth is not None:
+            strings = self.main_strings
+        elif self.body_depth is not None or self.body_closed:
+            strings = self.body_strings
+        else:
+            strings = self.document_strings
+        return ' '.join(strings)
+
+    def close(self):
+        try:
+            super().close()
+        except _ContentClosed:
+            return
+        self._flush()
+
+    def _flush(self):
+        if not self.data:
+            return
+        text = ''.join(self.data).strip()
+        self.data = []
+        if not text or (self.stack and (self.stack[-1][1] or self.stack[-1][2])):
+            return
+        self._add_string(text)
+
+    def _add_string(self, text):
+        if self.main_depth is not None:
+            self.main_strings.append(text)
+            return
+        self.document_strings.append(text)
+        if self.body_depth is not None:
+            self.body_strings.append(text)
+
+    def _push(self, tag, attrs):
+        removed, hidden = self.stack[-1][1:] if self.stack else (False, False)
+        if not removed:
+            classes = None
+            for name, value in attrs:
+                if name == 'class':
+                    classes = value or ''
+            removed = tag in REMOVED_TAGS or (classes is not None and REMOVED_CLASS_RE.search(classes) is not None)
+            if not removed and self.main_depth is None:
+                if tag == 'div' and classes is not None and CONTENT_CLASS_RE.search(classes):
+                    self.main_depth = len(self.stack)
+                elif tag == 'body' and self.body_depth is None and not self.body_closed:
+                    self.body_depth = len(self.stack)
+
+        self.stack.append((tag, removed, hidden or tag in STRING_CONTAINERS))
+        self.open_counts[tag] = self.open_counts.get(tag, 0) + 1
+
+    def _pop_to(self, tag):
+        if not self.open_counts.get(tag):
+            return
+        while self.stack:
+            name = self.stack.pop()[0]
+            self.open_counts[name] -= 1
+            if self.main_depth is not None and len(self.stack) <= self.main_depth:
+                raise _ContentClosed()
+            if self.body_depth is not None and len(self.stack) <= self.body_depth:
+                self.body_depth = None
+                self.body_closed = True
+            if name == tag:
+                return
+
+    def handle_starttag(self, tag, attrs):
+        self._flush()
+        self._push(tag, attrs)
+        if tag in VOID_TAGS:
+            self._pop_to(tag)
+            self.closed_void.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self._flush()
+        self._push(tag, attrs)
+        self._pop_to(tag)
+
+    def handle_endtag(self, tag):
+        if tag in self.closed_void:
+            # </br> после <br> - тег уже закрыт
+            self.closed_void.remove(tag)
+            return
+        self._flush()
+        self._pop_to(tag)
+
+    def handle_data(self, data):
+        self.data.append(data)
+
+    def handle_charref(self, name):
+        # числовые и именованные ссылки разбираются так же, как в bs4
+        base, pattern = (16, r'^([0-9a-f]+)(.*)') if name[:1] in 'xX' else (10, r'^([0-9]+)(.*)')
+        digits = name[1:] if base == 16 else name
+        try:
+            code, extra = int(digits, base), ''
+        except ValueError:
+            match = re.search(pattern, digits)
+            code, extra = (int(match.group(1), base), match.group(2)) if match else (None, digits)
+        if code is not None:
+            self.data.append(UnicodeDammit.numeric_character_reference(code)[0])
+        self.data.append(extra)
+
+    def handle_entityref(self, name):
+        character = EntitySubstitution.HTML_ENTITY_TO_CHARACTER.get(name)
+        self.data.append(character if character is not None else f"&{name}")
+
+    def handle_comment(self, data):
+        self._flush()
+
+    def handle_decl(self, decl):
+        self._flush()
+
+    def handle_pi(self, data):
+        self._flush()
+
+    def unknown_decl(self, data):
+        self._flush()
+        if data.upper().startswith('CDATA['):
+            # CDATA попадает в текст даже внутри rt/rp/template, но не в удаленных поддеревьях
+            text = data[len('CDATA['):].strip()
+            if text and not (self.stack and self.stack[-1][1]):
+                self._add_string(text)
+
+
+def extract_raw_text(html_content):
+    """Строки основного блока через пробел, до filter_text"""
+    parser = StreamingExtractor()
+    try:
+        parser.feed(html_content)
+    except _ContentClosed:
+        pass
+    else:
+        parser.close()
+    return parser.text()
+
+
+def extract_text(html_content):
+    return filter_text(extract_raw_text(html_content))
@@ -0,0 +1,77 @@
+import os
+from functools import lru_cache
+
+import pymorphy3
+
+DEFAULT_CACHE_SIZE = 100_000
+DICTIONARY_FILE = 'lemma_dictionary.txt'
+
+
+class LemmaCache:
+    """Лемматизация с LRU-кэшем и необязательным словарем токен -> лемма"""
+
+    def __init__(self, morph=None, maxsize=DEFAULT_CACHE_SIZE):
+        self.morph = morph if morph is not None else pymorphy3.MorphAnalyzer()
+        self.dictionary = {}
+        self.dictionary_hits = 0
+        self._normal_form = lru_cache(maxsize=maxsize)(self._parse)
+
+    def _parse(self, word):
+        return self.morph.parse(word)[0].normal_form
+
+    def lemmatize(self, word):
+        lemma = self.dictionary.get(word)
+        if lemma is not None:
+            self.dictionary_hits += 1
+            return lemma
+        return self._normal_form(word)
+
+    def load_dictionary(self, path):
+        self.dictionary.update(read_dictionary(path))
+        return len(self.dictionary)
+
+    def clear(self):
+        self._normal_form.cache_clear()
+        self.dictionary_hits = 0
+
+    def stats(self):
+        info = self._normal_form.cache_info()
+        return {
+            'hits': info.hits,
+            'misses': info.misses,
+            'size': info.currsize,
+            'maxsize': info.maxsize,
+            'dictionary_hits': self.dictionary_hits,
+            'dictionary_size': len(self.dictionary),
+        }
+
+
+def read_dictionary(path):
+    """{токен: лемма} из файла словаря, пустой словарь, если файла нет"""
+    dictionary = {}
+    if not os.path.exists(path):
+        return dictionary
+
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 2:
+                dictionary[parts[0]] = parts[1]
+    return dictionary
+
+
+def save_dictionary(token_to_lemma, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        for token, lemma in sorted(token_to_lemma.items()):
+            f.write(f"{token} {lemma}\n")
+
+
+_shared_cache = None
+
+
+def get_lemma_cache():
+    """Общий для процесса кэш, чтобы MorphAnalyzer создавался один раз"""
+    global _shared_cache
+    if _shared_cache is None:
+        _shared_cache = LemmaCache()
+    return _shared_cache
@@ -0,0 +1,51 @@
+import os
+
+# Частоты терминов документа (counts/NNN.txt), по строке на токен в алфавитном порядке:
+#   токен лемма число_вхождений [позиции]
+# Позиции - номера вхождений в потоке токенов документа (после удаления стоп-слов),
+# через запятую разностями от предыдущей. Лемма '-' - токен, для которого лемма
+# не сохранилась.
+COUNTS_DIR = 'counts'
+NO_LEMMA = '-'
+
+
+def save_term_counts(path, term_counts, lemmas):
+    """term_counts: {токен: число} или {токен: [позиции]}, lemmas: {лемма: [токены]}"""
+    token_lemma = {token: lemma for lemma, tokens in lemmas.items() for token in tokens}
+    lines = []
+    for token in sorted(term_counts):
+        value = term_counts[token]
+        lemma = token_lemma.get(token, NO_LEMMA)
+        if isinstance(value, int):
+            lines.append(f"{token} {lemma} {value}\n")
+        else:
+            deltas = [value[0]] + [b - a for a, b in zip(value, value[1:])]
+            lines.append(f"{token} {lemma} {len(value)} {','.join(map(str, deltas))}\n")
+
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(''.join(lines))
+
+
+def load_term_counts(path):
+    """[(токен, лемма или None, число вхождений, позиции или None)] в порядке файла"""
+    entries = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) < 3:
+                continue
+
+            token, lemma, count = parts[0], parts[1], int(parts[2])
+            positions = None
+            if len(parts) > 3:
+                positions = []
+                position = 0
+                for delta in parts[3].split(','):
+                    position += int(delta)
+                    positions.append(position)
+            entries.append((token, None if lemma == NO_LEMMA else lemma, count, positions))
+    return entries
+
+
+def counts_path(task_2_dir, page_num):
+    return os.path.join(task_2_dir, COUNTS_DIR, f"{page_num}.txt")
@@ -1,103 +1,77 @@
+import argparse
 import os
 import re
-from bs4 import BeautifulSoup
-import pymorphy3
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import filterfalse
 from nltk.corpus import stopwords
 import nltk
 
+from html_extract import extract_text
+from lemma_cache import DICTIONARY_FILE, get_lemma_cache, read_dictionary, save_dictionary
+from term_counts import save_term_counts
+
+TOKEN_RE = re.compile(r'\b[а-яё]{2,25}\b')
+STAGES = ('read', 'extract', 'tokenize', 'lemmatize', 'save')
+
+
 class TextProcessor:
-    def __init__(self, pages_dir='../downloads', output_dir='.'):
+    def __init__(self, pages_dir='../downloads', output_dir='.', verbose=True, positions=False,
+                 write_outputs=True):
         self.pages_dir = pages_dir
         self.output_dir = output_dir
+        self.verbose = verbose
+        self.positions = positions
+        self.timings = defaultdict(float)
+        self.token_lemmas = {}
 
         self.tokens_dir = os.path.join(output_dir, 'tokens')
         self.lemmas_dir = os.path.join(output_dir, 'lemmas')
         self.clean_text_dir = os.path.join(output_dir, 'clean')
+        self.counts_dir = os.path.join(output_dir, 'counts')
 
-        os.makedirs(self.tokens_dir, exist_ok=True)
-        os.makedirs(self.lemmas_dir, exist_ok=True)
-        os.makedirs(self.clean_text_dir, exist_ok=True)
+        # потоковая сборка (streaming.py) пишет эти каталоги только для отладки
+        if write_outputs:
+            os.makedirs(self.tokens_dir, exist_ok=True)
+            os.makedirs(self.lemmas_dir, exist_ok=True)
+            os.makedirs(self.clean_text_dir, exist_ok=True)
+            os.makedirs(self.counts_dir, exist_ok=True)
 
         nltk.download('stopwords', quiet=True)
         self.stop_words = set(stopwords.words('russian'))
 
-        self.morph = pymorphy3.MorphAnalyzer()
+        self.lemma_cache = get_lemma_cache()
+        self.morph = self.lemma_cache.morph
 
     def extract_text_from_html(self, html_content):
-        soup = BeautifulSoup(html_content, 'html.parser')
-        
-        for element in soup(['script', 'style', 'meta', 'link', 'noscript', 
-                             'header', 'footer', 'nav', 'aside', 'form', 
-                             'button', 'iframe']):
-            element.decompose()
-        
-        for element in soup.find_all(class_=re.compile(r'(sidebar|menu|nav|footer|header|banner|adv|advert|popup|modal)')):
-            element.decompose()
-        
-        main_content = None
-        
-        possible_content = soup.find('div', class_=re.compile(r'content|article|mw-parser-output|page|main'))
-        if possible_content:
-            main_content = possible_content
-        else:
-            main_content = soup.find('body')
-        
-        if main_content:
-            text = main_content.get_text(separator=' ', strip=True)
-        else:
-            text = soup.get_text(separator=' ', strip=True)
-        
-        text = re.sub(r'\s+', ' ', text)
-        
-        lines = text.split('. ')
-        meaningful_lines = []
-        for line in lines:
-            if re.search(r'https?://|\.(jpg|png|svg|css|js)|\d+px|data:image|window\.|function\(', line, re.IGNORECASE):
-                continue
-            if re.search(r'[{}\[\]<>]|var |let |const |return |if\(', line):
-                continue
-            if line.strip():
-                meaningful_lines.append(line.strip())
-        
-        clean_text = '. '.join(meaningful_lines)
-        
-        clean_text = re.sub(r'\s+', ' ', clean_text)
-        
-        return clean_text
+        return extract_text(html_content)
 
     def save_clean_text(self, text, output_file):
         try:
             with open(output_file, 'w', encoding='utf-8') as f:
                 f.write(text)
-            print(f"Очищенный текст сохранен в {output_file}")
+            if self.verbose:
+                print(f"Очищенный текст сохранен в {output_file}")
         except Exception as e:
             print(f"Ошибка при сохранении очищенного текста: {e}")
 
     def tokenize(self, text):
-        words = re.findall(r'\b[а-яё]{2,30}\b', text.lower())
-        
-        clean_words = []
-        for word in words:
-            if word in self.stop_words:
-                continue
-                
-            if len(word) > 25:
-                continue
-                
-            clean_words.append(word)
-        
-        return clean_words
+        """Ленивый поток токенов: русские слова от 2 до 25 букв без стоп-слов.
+        Слово длиннее 25 букв целиком не проходит шаблон из-за границ \\b"""
+        return filterfalse(self.stop_words.__contains__, TOKEN_RE.findall(text.lower()))
 
     def lemmatize_words(self, words):
         lemma_dict = {}
         
         for word in words:
             try:
-                parsed = self.morph.parse(word)[0]
-                lemma = parsed.normal_form
+                lemma = self.lemma_cache.lemmatize(word)
                 
                 if len(lemma) > 30:
                     continue
+                
+                self.token_lemmas[word] = lemma
                     
                 if lemma not in lemma_dict:
                     lemma_dict[lemma] = set()
@@ -113,16 +87,21 @@ class TextProcessor:
         
         return result
 
-    def get_html_files(self):
+    def get_html_files(self, pages=None):
+        """HTML-файлы каталога страниц; pages - номера страниц, если нужны не все"""
         html_files = []
         
         if not os.path.exists(self.pages_dir):
             print(f"Директория {self.pages_dir} не существует!")
             return []
             
+        wanted = {int(page) for page in pages} if pages else None
         for file in os.listdir(self.pages_dir):
             if file.endswith(('.html', '.htm')):
-                html_files.append(os.path.join(self.pages_dir, file))
+                path = os.path.join(self.pages_dir, file)
+                page_num = self.get_page_number(path)
+                if wanted is None or (page_num.isdigit() and int(page_num) in wanted):
+                    html_files.append(path)
         
         html_files.sort()
         return html_files
@@ -138,36 +117,49 @@ class TextProcessor:
 
     def process_file(self, html_file_path):
         try:
+            started = time.perf_counter()
             with open(html_file_path, 'r', encoding='utf-8') as f:
                 html_content = f.read()
+            started = self._add_timing('read', started)
             
             clean_text = self.extract_text_from_html(html_content)
+            started = self._add_timing('extract', started)
             
-            tokens = self.tokenize(clean_text)
-            
-            unique_tokens = []
-            seen = set()
-            for token in tokens:
-                if token not in seen:
-                    seen.add(token)
-                    unique_tokens.append(token)
-            
-            unique_tokens.sort()
+            term_counts = self.count_terms(self.tokenize(clean_text))
+            unique_tokens = sorted(term_counts)
+            started = self._add_timing('tokenize', started)
             
             lemmas = self.lemmatize_words(unique_tokens)
+            self._add_timing('lemmatize', started)
             
-            return unique_tokens, lemmas, clean_text
+            return unique_tokens, lemmas, clean_text, term_counts
             
         except Exception as e:
             print(f"Ошибка при обработке файла {html_file_path}: {e}")
-            return [], {}, ""
+            return [], {}, "", {}
+
+    def count_terms(self, tokens):
+        """{токен: число вхождений} или, с positions, {токен: [позиции в потоке токенов]}"""
+        if not self.positions:
+            return Counter(tokens)
+        
+        positions = defaultdict(list)
+        for position, token in enumerate(tokens):
+            positions[token].append(position)
+        return positions
+
+    def _add_timing(self, stage, started):
+        now = time.perf_counter()
+        self.timings[stage] += now - started
+        return now
 
     def save_tokens(self, tokens, output_file):
         try:
             with open(output_file, 'w', encoding='utf-8') as f:
                 for token in tokens:
                     f.write(f"{token}\n")
-            print(f"Токены сохранены в {output_file}")
+            if self.verbose:
+                print(f"Токены сохранены в {output_file}")
         except Exception as e:
             print(f"Ошибка при сохранении токенов: {e}")
 
@@ -176,12 +168,49 @@ class TextProcessor:
             with open(output_file, 'w', encoding='utf-8') as f:
                 for lemma, words in sorted(lemmas.items()):
                     f.write(f"{lemma} {' '.join(words)}\n")
-            print(f"Леммы сохранены в {output_file}")
+            if self.verbose:
+                print(f"Леммы сохранены в {output_file}")
         except Exception as e:
             print(f"Ошибка при сохранении лемм: {e}")
 
-    def process_all_pages(self):
-        html_files = self.get_html_files()
+    def save_counts(self, term_counts, lemmas, output_file):
+        try:
+            save_term_counts(output_file, term_counts, lemmas)
+            if self.verbose:
+                print(f"Частоты терминов сохранены в {output_file}")
+        except Exception as e:
+            print(f"Ошибка при сохранении частот терминов: {e}")
+
+    def save_page(self, page_num, tokens, lemmas, clean_text, term_counts):
+        started = time.perf_counter()
+
+        clean_file = os.path.join(self.clean_text_dir, f"{page_num}.txt")
+        self.save_clean_text(clean_text, clean_file)
+
+        tokens_file = os.path.join(self.tokens_dir, f"{page_num}.txt")
+        self.save_tokens(tokens, tokens_file)
+
+        lemmas_file = os.path.join(self.lemmas_dir, f"{page_num}.txt")
+        self.save_lemmas(lemmas, lemmas_file)
+
+        counts_file = os.path.join(self.counts_dir, f"{page_num}.txt")
+        self.save_counts(term_counts, lemmas, counts_file)
+
+        self._add_timing('save', started)
+
+    def process_page(self, html_file):
+        """Обработка одной страницы с сохранением результатов, возвращает сводку"""
+        page_num = self.get_page_number(html_file)
+        tokens, lemmas, clean_text, term_counts = self.process_file(html_file)
+
+        if not (tokens and clean_text):
+            return page_num, None
+
+        self.save_page(page_num, tokens, lemmas, clean_text, term_counts)
+        return page_num, (len(tokens), len(lemmas), len(clean_text))
+
+    def process_all_pages(self, workers=1, pages=None):
+        html_files = self.get_html_files(pages)
         
         if not html_files:
             print(f"HTML-файлы не найдены в директории: {self.pages_dir}")
@@ -193,34 +222,97 @@ class TextProcessor:
         total_tokens = 0
         total_lemmas = 0
         total_files_processed = 0
+        started = time.perf_counter()
         
-        for html_file in html_files:
-            page_num = self.get_page_number(html_file)
-            
+        if workers > 1:
+            print(f"Параллельная обработка, процессов: {workers}")
+            results = self._process_parallel(html_files, workers)
+        else:
+            results = self._process_serial(html_files)
+        
+        for html_file, (page_num, summary) in zip(html_files, results):
             print(f"Обработка файла: {os.path.basename(html_file)}")
             
-            tokens, lemmas, clean_text = self.process_file(html_file)
-            
-            if tokens and clean_text:
-                clean_file = os.path.join(self.clean_text_dir, f"{page_num}.txt")
-                self.save_clean_text(clean_text, clean_file)
-                
-                tokens_file = os.path.join(self.tokens_dir, f"{page_num}.txt")
-                self.save_tokens(tokens, tokens_file)
+            if summary:
+                tokens_count, lemmas_count, text_length = summary
                 
-                lemmas_file = os.path.join(self.lemmas_dir, f"{page_num}.txt")
-                self.save_lemmas(lemmas, lemmas_file)
-                
-                total_tokens += len(tokens)
-                total_lemmas += len(lemmas)
+                total_tokens += tokens_count
+                total_lemmas += lemmas_count
                 total_files_processed += 1
                 
-                print(f"Найдено: {len(tokens)} уникальных токенов, {len(lemmas)} лемм")
-                print(f"Длина очищенного текста: {len(clean_text)} символов")
+                print(f"Найдено: {tokens_count} уникальных токенов, {lemmas_count} лемм")
+                print(f"Длина очищенного текста: {text_length} символов")
             else:
                 print(f"Не удалось извлечь данные из файла")
             
             print("-" * 10)
+        
+        self.print_timings(time.perf_counter() - started, total_files_processed)
+        self.save_lemma_dictionary(merge=bool(pages))
+
+    def save_lemma_dictionary(self, merge=False):
+        """merge - дополнить существующий словарь (обработаны не все страницы)"""
+        dictionary_file = os.path.join(self.output_dir, DICTIONARY_FILE)
+        try:
+            if merge:
+                self.token_lemmas = {**read_dictionary(dictionary_file), **self.token_lemmas}
+            save_dictionary(self.token_lemmas, dictionary_file)
+            print(f"Словарь токен -> лемма ({len(self.token_lemmas)} слов) сохранен в {dictionary_file}")
+        except Exception as e:
+            print(f"Ошибка при сохранении словаря лемм: {e}")
+
+    def _process_serial(self, html_files):
+        for html_file in html_files:
+            yield self.process_page(html_file)
+
+    def _process_parallel(self, html_files, workers):
+        with ProcessPoolExecutor(max_workers=workers,
+                                 initializer=_init_worker,
+                                 initargs=(self.pages_dir, self.output_dir, self.positions)) as executor:
+            # map отдает результаты в порядке файлов, по мере готовности
+            for page_num, summary, timings, token_lemmas in executor.map(_process_page_in_worker, html_files):
+                for stage, seconds in timings.items():
+                    self.timings[stage] += seconds
+                self.token_lemmas.update(token_lemmas)
+                yield page_num, summary
+
+    def print_timings(self, wall_time, files_count):
+        print("Время по этапам (суммарно по всем процессам):")
+        for stage in STAGES:
+            print(f"  {stage:<10} {self.timings[stage]:8.2f} с")
+        print(f"  {'сумма по этапам':<10} {sum(self.timings.values()):8.2f} с")
+        print(f"Общее время: {wall_time:.2f} с, обработано файлов: {files_count}")
+
+        cache_stats = self.lemma_cache.stats()
+        print(f"Кэш лемм (главный процесс): попаданий {cache_stats['hits']}, промахов {cache_stats['misses']}")
+
+
+_worker_processor = None
+
+
+def _init_worker(pages_dir, output_dir, positions):
+    # MorphAnalyzer и стоп-слова создаются один раз на процесс
+    global _worker_processor
+    _worker_processor = TextProcessor(pages_dir=pages_dir, output_dir=output_dir, verbose=False,
+                                      positions=positions)
+
+
+def _process_page_in_worker(html_file):
+    _worker_processor.timings.clear()
+    _worker_processor.token_lemmas.clear()
+    page_num, summary = _worker_processor.process_page(html_file)
+    return page_num, summary, dict(_worker_processor.timings), dict(_worker_processor.token_lemmas)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Токенизация и лемматизация скачанных страниц")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="количество процессов (1 - последовательная обработка)")
+    parser.add_argument('--positions', action='store_true',
+                        help="сохранять в counts/ позиции токенов, а не только частоты")
+    parser.add_argument('pages', nargs='*',
+                        help="номера страниц для обработки (новые или измененные), по умолчанию все")
+    args = parser.parse_args()
 
-processor = TextProcessor(pages_dir='../downloads', output_dir='.')
-processor.process_all_pages()
+    processor = TextProcessor(pages_dir='../downloads', output_dir='.', positions=args.positions)
+    processor.process_all_pages(workers=args.workers, pages=args.pages)
@@ -0,0 +1,54 @@
+import argparse
+import filecmp
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from index import InvertedIndexBuilder
+
+
+def build(output_file, counts_dir, positions, memory_budget):
+    """Время, пик памяти Python (tracemalloc) и статистика прогонов одной сборки"""
+    builder = InvertedIndexBuilder(output_file=output_file, counts_dir=counts_dir, positions=positions,
+                                   verbose=False, memory_budget=memory_budget)
+    tracemalloc.start()
+    started = time.perf_counter()
+    builder.build_index()
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak, builder.spill_stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Внешняя сборка индекса против сборки в памяти: "
+                                                 "побайтная сверка, время и пик памяти")
+    parser.add_argument('--budgets', type=float, nargs='+', default=[64, 4, 0.5],
+                        help="бюджеты памяти внешней сборки, МБ")
+    parser.add_argument('--no-positions', action='store_true', help="индекс только с частотами")
+    args = parser.parse_args()
+
+    counts_dir = '../task_2/counts/'
+    positions = not args.no_positions
+    mismatches = []
+    with tempfile.TemporaryDirectory() as directory:
+        reference = os.path.join(directory, 'memory.bin')
+        elapsed, peak, _ = build(reference, counts_dir, positions, None)
+        print(f"{'Сборка':18s} {'время, с':>9s} {'пик, МБ':>8s} {'прогонов':>9s} {'на диске, МБ':>13s}")
+        print(f"{'в памяти':18s} {elapsed:9.2f} {peak / 2 ** 20:8.1f} {'-':>9s} {'-':>13s}")
+
+        for budget in args.budgets:
+            output = os.path.join(directory, f"external_{budget}.bin")
+            elapsed, peak, stats = build(output, counts_dir, positions, int(budget * 2 ** 20))
+            name = f"внешняя, {budget:g} МБ"
+            print(f"{name:18s} {elapsed:9.2f} {peak / 2 ** 20:8.1f} {stats['runs']:9d} "
+                  f"{stats['spilled_bytes'] / 2 ** 20:13.1f}")
+            if not filecmp.cmp(reference, output, shallow=False):
+                mismatches.append(name)
+
+    if mismatches:
+        print(f"Индекс отличается от сборки в памяти: {', '.join(mismatches)}")
+        sys.exit(1)
+    print("Все индексы побайтно совпадают со сборкой в памяти")
@@ -0,0 +1,49 @@
+import argparse
+import json
+import os
+import random
+import time
+
+from index_format import IndexReader
+
+
+def measure(function, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return (time.perf_counter() - started) / repeat, result
+
+
+def load_json(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return {term: set(docs) for term, docs in json.load(f).items()}
+
+
+def run_benchmark(json_path, binary_path, lookups, repeat):
+    json_load, json_index = measure(lambda: load_json(json_path), repeat)
+    binary_load, reader = measure(lambda: IndexReader(binary_path), repeat)
+
+    terms = random.sample(list(json_index), min(lookups, len(json_index)))
+
+    json_lookup, _ = measure(lambda: [json_index[term] for term in terms], repeat)
+    binary_lookup, _ = measure(lambda: [reader[term] for term in terms], repeat)
+
+    for term in terms:
+        if json_index[term] != reader[term]:
+            raise AssertionError(f"Постинги термина '{term}' не совпадают")
+
+    print(f"{'':<22}{'JSON':>12}{'бинарный':>12}")
+    print(f"{'размер, КБ':<22}{os.path.getsize(json_path) / 1024:>12.0f}{os.path.getsize(binary_path) / 1024:>12.0f}")
+    print(f"{'загрузка, мс':<22}{json_load * 1000:>12.2f}{binary_load * 1000:>12.2f}")
+    print(f"{f'{len(terms)} поисков, мс':<22}{json_lookup * 1000:>12.2f}{binary_lookup * 1000:>12.2f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Сравнение JSON и бинарного формата индекса")
+    parser.add_argument('--json', default='inverted_index.json')
+    parser.add_argument('--binary', default='inverted_index.bin')
+    parser.add_argument('--lookups', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    run_benchmark(args.json, args.binary, args.lookups, args.repeat)
@@ -0,0 +1,66 @@
+import argparse
+import random
+import time
+
+from search import BooleanSearchEngine
+
+
+def linear_resolve(index, term):
+    """Прежний поиск термина: полный перебор ключей при промахе"""
+    if term in index:
+        return term
+    term_lower = term.lower()
+    for key in index:
+        if key.lower() == term_lower:
+            return key
+    return None
+
+
+def make_queries(engine, count, miss_rate):
+    terms = list(engine.index)
+    alphabet = 'абвгдежзиклмнопрстуфхцчшщэюя'
+    queries = []
+    for _ in range(count):
+        if random.random() < miss_rate:
+            queries.append(''.join(random.choice(alphabet) for _ in range(random.randint(5, 12))))
+        else:
+            term = random.choice(terms)
+            queries.append(term.capitalize() if random.random() < 0.5 else term)
+    return queries
+
+
+def run_benchmark(count, miss_rate, linear_limit):
+    engine = BooleanSearchEngine()
+    queries = make_queries(engine, count, miss_rate)
+
+    # прогрев кэша лемм, чтобы сравнивать поиск по словарю, а не pymorphy3
+    for query in queries:
+        engine._resolve_term(query)
+
+    started = time.perf_counter()
+    for query in queries:
+        engine._resolve_term(query)
+    dictionary_time = (time.perf_counter() - started) / len(queries)
+
+    sample = queries[:linear_limit]
+    started = time.perf_counter()
+    for query in sample:
+        linear_resolve(engine.index, query)
+    linear_time = (time.perf_counter() - started) / len(sample)
+
+    print(f"Терминов в индексе: {len(engine.index)}, запросов: {count}, доля промахов: {miss_rate:.0%}")
+    print(f"Перебор ключей:        {linear_time * 1e6:10.1f} мкс/термин ({len(sample)} терминов)")
+    print(f"Нормализованный словарь: {dictionary_time * 1e6:8.1f} мкс/термин")
+    print(f"Ускорение: {linear_time / dictionary_time:.0f}x")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Поиск терминов с большой долей промахов")
+    parser.add_argument('--queries', type=int, default=10000)
+    parser.add_argument('--miss-rate', type=float, default=0.8)
+    parser.add_argument('--linear-limit', type=int, default=200,
+                        help="сколько терминов прогнать через полный перебор")
+    args = parser.parse_args()
+
+    random.seed(0)
+    run_benchmark(args.queries, args.miss_rate, args.linear_limit)
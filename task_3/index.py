@@ -1,20 +1,45 @@
+import argparse
+import itertools
 import json
 import os
 import re
+import sys
+import time
 from collections import defaultdict
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "task_2"))
+from index_format import IndexReader, IndexWriter, write_index
+from spimi import SpillingPostings, entry_size
+from term_counts import load_term_counts
+
+# раз в столько секунд внешняя сборка печатает прогресс
+PROGRESS_INTERVAL = 5.0
+
 class InvertedIndexBuilder:
-    def __init__(self, lemmas_dir='../task_2/lemmas/', output_file='inverted_index.json'):
+    def __init__(self, lemmas_dir='../task_2/lemmas/', output_file='inverted_index.bin', json_file=None,
+                 counts_dir=None, positions=False, doc_names=None, verbose=True, memory_budget=None,
+                 temp_dir=None):
         self.lemmas_dir = lemmas_dir
         self.output_file = output_file
+        self.json_file = json_file
+        self.counts_dir = counts_dir
+        # только эти документы (для сегментов segments.py), по умолчанию - все
+        self.doc_names = doc_names
+        self.verbose = verbose
+        # с бюджетом памяти (в байтах) индекс собирается во внешней памяти, см. build_external
+        self.memory_budget = memory_budget
+        self.temp_dir = temp_dir
+        self.spill_stats = None
         self.inverted_index = defaultdict(set)
+        # из counts/ задания 2: tf лемм и длины документов для BM25, по желанию позиции
+        self.frequencies = defaultdict(dict) if counts_dir else None
+        self.doc_lengths = {} if counts_dir else None
+        self.positions = defaultdict(dict) if counts_dir and positions else None
         
     def build_index(self):
-        if not os.path.exists(self.lemmas_dir):
-            raise FileNotFoundError(f"Директория {self.lemmas_dir} не найдена")
-        
-        lemma_files = [f for f in os.listdir(self.lemmas_dir) 
-                      if f.endswith('.txt')]
+        lemma_files = self._lemma_files()
+        if self.memory_budget is not None:
+            return self.build_external(lemma_files)
         
         for filename in lemma_files:
             file_path = os.path.join(self.lemmas_dir, filename)
@@ -28,18 +53,135 @@ class InvertedIndexBuilder:
             
             for lemma in lemmas:
                 self.inverted_index[lemma].add(doc_name)
+            
+            if self.counts_dir:
+                self._add_counts(doc_name)
         
         serializable_index = {
-            term: list(docs) for term, docs in self.inverted_index.items()
+            term: sorted(docs) for term, docs in self.inverted_index.items()
         }
         
-        with open(self.output_file, 'w', encoding='utf-8') as f:
-            json.dump(serializable_index, f, ensure_ascii=False, indent=2)
+        write_index(self.output_file, serializable_index, self.positions, self.frequencies, self.doc_lengths)
+        if self.json_file:
+            self.export_json(serializable_index)
+        
+        if self.verbose:
+            if self.positions is not None:
+                print(f"Индекс с частотами и позициями лемм построен и сохранен в {self.output_file}")
+            elif self.frequencies is not None:
+                print(f"Индекс с частотами лемм построен и сохранен в {self.output_file}")
+            else:
+                print(f"Индекс построен и сохранен в {self.output_file}")
+            print(f"Всего терминов: {len(serializable_index)}")
+    
+    def _lemma_files(self):
+        if not os.path.exists(self.lemmas_dir):
+            raise FileNotFoundError(f"Директория {self.lemmas_dir} не найдена")
         
-        print(f"Индекс построен и сохранен в {self.output_file}")
-        print(f"Всего терминов: {len(serializable_index)}")
+        if self.doc_names is None:
+            return [f for f in os.listdir(self.lemmas_dir) 
+                    if f.endswith('.txt')]
         
-        return serializable_index
+        lemma_files = [f"{name}.txt" for name in self.doc_names]
+        for filename in lemma_files:
+            if not os.path.exists(os.path.join(self.lemmas_dir, filename)):
+                raise FileNotFoundError(f"Файл {filename} не найден в {self.lemmas_dir}")
+        return lemma_files
+    
+    def build_external(self, lemma_files):
+        """Сборка во внешней памяти: документы читаются по возрастанию имени и
+        получают номера по порядку, постинги копятся в SpillingPostings до
+        memory_budget, сбрасываются на диск отсортированными прогонами и сливаются
+        кучей прямо в IndexWriter. Результат побайтно совпадает с обычной сборкой"""
+        files = sorted(lemma_files, key=self._extract_doc_name)
+        doc_names = []
+        doc_lengths = []
+        progress = BuildProgress(len(files), self.verbose)
+        
+        with SpillingPostings(self.memory_budget, self.temp_dir) as postings:
+            for filename in files:
+                file_path = os.path.join(self.lemmas_dir, filename)
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    content = f.read()
+                progress.read_bytes += len(content.encode('utf-8'))
+                
+                lemmas = self._extract_lemmas(content)
+                if lemmas:
+                    doc_id = len(doc_names)
+                    doc_name = self._extract_doc_name(filename)
+                    doc_names.append(doc_name)
+                    lemma_counts, lemma_positions = {}, {}
+                    if self.counts_dir:
+                        lemma_counts, lemma_positions, doc_length = self._document_counts(doc_name)
+                        doc_lengths.append(doc_length)
+                    
+                    for lemma in lemmas:
+                        positions = sorted(lemma_positions.get(lemma, []))
+                        postings.add(lemma, (doc_id, lemma_counts.get(lemma, 0), positions),
+                                     entry_size(len(positions)))
+                progress.document(postings)
+            
+            progress.start_merge(postings)
+            json_file = open(self.json_file, 'w', encoding='utf-8') if self.json_file else None
+            try:
+                if json_file:
+                    json_file.write('{')
+                with IndexWriter(self.output_file, doc_names, self.positions is not None,
+                                 self.frequencies is not None) as writer:
+                    writer.doc_lengths = doc_lengths
+                    for number, (term, entries) in enumerate(postings.merged()):
+                        doc_ids = [doc_id for doc_id, _, _ in entries]
+                        writer.add_term(term, doc_ids, [positions for _, _, positions in entries],
+                                        [tf for _, tf, _ in entries])
+                        if json_file:
+                            self._write_json_term(json_file, number, term, [doc_names[doc_id] for doc_id in doc_ids])
+                        progress.term()
+                if json_file:
+                    json_file.write('\n}' if progress.terms else '}')
+            finally:
+                if json_file:
+                    json_file.close()
+        
+            self.spill_stats = {'runs': postings.run_count, 'spilled_bytes': postings.spilled_bytes,
+                                'merge_passes': postings.merge_passes}
+        
+        progress.finish(self.output_file)
+        if self.verbose and self.json_file:
+            print(f"Индекс экспортирован в JSON: {self.json_file}")
+    
+    def _write_json_term(self, f, number, term, docs):
+        """Запись термина в JSON по ходу слияния - тот же вид, что у json.dump(indent=2)"""
+        entry = json.dumps({term: docs}, ensure_ascii=False, indent=2)[2:-2]
+        f.write(('\n' if number == 0 else ',\n') + entry)
+    
+    def export_json(self, serializable_index):
+        with open(self.json_file, 'w', encoding='utf-8') as f:
+            json.dump(serializable_index, f, ensure_ascii=False, indent=2)
+        print(f"Индекс экспортирован в JSON: {self.json_file}")
+    
+    def _add_counts(self, doc_name):
+        lemma_counts, lemma_positions, doc_length = self._document_counts(doc_name)
+        self.doc_lengths[doc_name] = doc_length
+        for lemma, count in lemma_counts.items():
+            self.frequencies[lemma][doc_name] = count
+        for lemma, positions in lemma_positions.items():
+            self.positions[lemma][doc_name] = sorted(positions)
+    
+    def _document_counts(self, doc_name):
+        """tf леммы - сумма частот ее токенов из counts/, позиции - объединение их позиций"""
+        counts_file = os.path.join(self.counts_dir, f"{doc_name}.txt")
+        lemma_counts = defaultdict(int)
+        lemma_positions = defaultdict(list)
+        doc_length = 0
+        for token, lemma, count, positions in load_term_counts(counts_file):
+            doc_length += count
+            if self.positions is not None and positions is None:
+                raise ValueError(f"В {counts_file} нет позиций: запустите tokenization.py --positions")
+            if lemma is not None:
+                lemma_counts[lemma] += count
+                if self.positions is not None:
+                    lemma_positions[lemma].extend(positions)
+        return lemma_counts, lemma_positions, doc_length
     
     def _extract_doc_name(self, filename):
         name = filename.replace('.txt', '')
@@ -60,14 +202,82 @@ class InvertedIndexBuilder:
         
         return lemmas
 
-builder = InvertedIndexBuilder()
-try:
-    index = builder.build_index()
+class BuildProgress:
+    """Прогресс и пропускная способность внешней сборки: раз в PROGRESS_INTERVAL
+    секунд при чтении документов и при слиянии, итог - в конце"""
+    
+    def __init__(self, total, verbose=True):
+        self.total = total
+        self.verbose = verbose
+        self.documents = 0
+        self.read_bytes = 0
+        self.terms = 0
+        self.started = self.reported = time.perf_counter()
+        self.read_time = 0.0
+        self.runs = ''
+    
+    def _due(self):
+        now = time.perf_counter()
+        if not self.verbose or now - self.reported < PROGRESS_INTERVAL:
+            return False
+        self.reported = now
+        return True
+    
+    def document(self, postings):
+        self.documents += 1
+        if self._due():
+            elapsed = time.perf_counter() - self.started
+            print(f"  документов {self.documents}/{self.total}, {self.documents / elapsed:.0f} док/с, "
+                  f"{self.read_bytes / 2 ** 20 / elapsed:.1f} МБ/с, прогонов на диске: {postings.run_count}")
+    
+    def start_merge(self, postings):
+        self.read_time = time.perf_counter() - self.started
+        self.runs = (f"прогонов на диске: {postings.run_count}, сброшено {postings.spilled_bytes / 2 ** 20:.1f} МБ"
+                     if postings.run_count else "все постинги уместились в памяти")
+        if self.verbose:
+            print(f"Прочитано документов: {self.documents} за {self.read_time:.2f} с "
+                  f"({self.read_bytes / 2 ** 20 / max(self.read_time, 1e-9):.1f} МБ/с), {self.runs}")
+    
+    def term(self):
+        self.terms += 1
+        if self._due():
+            print(f"  слияние: записано терминов {self.terms}")
+    
+    def finish(self, path):
+        if not self.verbose:
+            return
+        merge_time = time.perf_counter() - self.started - self.read_time
+        print(f"Индекс построен во внешней памяти и сохранен в {path}")
+        print(f"Всего терминов: {self.terms}, слияние {merge_time:.2f} с "
+              f"({self.terms / max(merge_time, 1e-9):.0f} терминов/с)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Построение инвертированного индекса")
+    parser.add_argument('--json', nargs='?', const='inverted_index.json', default=None,
+                        help="дополнительно экспортировать индекс в JSON")
+    parser.add_argument('--counts', nargs='?', const='../task_2/counts/', default=None,
+                        help="сохранить tf лемм и длины документов из counts/ задания 2 (для BM25)")
+    parser.add_argument('--positions', action='store_true',
+                        help="сохранить еще и позиции лемм (для фраз и NEAR), нужен tokenization.py --positions")
+    parser.add_argument('--memory', type=float, default=None,
+                        help="собрать во внешней памяти с бюджетом в МБ (для корпусов больше памяти)")
+    parser.add_argument('--temp-dir', default=None, help="каталог для прогонов внешней сборки")
+    args = parser.parse_args()
+
+    counts_dir = args.counts or ('../task_2/counts/' if args.positions else None)
+    memory_budget = int(args.memory * 2 ** 20) if args.memory is not None else None
+    builder = InvertedIndexBuilder(json_file=args.json, counts_dir=counts_dir, positions=args.positions,
+                                   memory_budget=memory_budget, temp_dir=args.temp_dir)
+    try:
+        builder.build_index()
     
-    print("\nПример первых 10 терминов:")
-    for i, (term, docs) in enumerate(list(index.items())[:10]):
-        print(f"{term}: {docs}")
+        print("\nПример первых 10 терминов:")
+        index = IndexReader(builder.output_file)
+        for term, docs in itertools.islice(index.items(), 10):
+            print(f"{term}: {sorted(docs)}")
+        index.close()
         
-except FileNotFoundError as e:
-    print(f"Ошибка: {e}")
-    print("Убедитесь, что папка с леммами существует и содержит файлы")
+    except FileNotFoundError as e:
+        print(f"Ошибка: {e}")
+        print("Убедитесь, что папка с леммами существует и содержит файлы")
@@ -0,0 +1,403 @@
+import mmap
+import shutil
+import struct
+import tempfile
+from collections.abc import Mapping
+
+from postings import Bitmap, is_dense, rank
+
+# Бинарный формат инвертированного индекса (little-endian):
+#   заголовок   HEADER
+#   документы   varint длины + имя в utf-8 для каждого документа
+#   термины     имена терминов в utf-8 подряд, отсортированы побайтно
+#   таблица     TERM_ENTRY фиксированного размера на каждый термин -> бинарный поиск без декодирования,
+#               последняя запись-ограничитель хранит концы секций терминов и постингов
+#   постинги    редкие термины - номера документов дельтами в varint,
+#               частые (is_dense по df) - битовая маска на все документы
+#   позиции     только с флагом FLAG_POSITIONS: POSITION_OFFSET на каждый термин + ограничитель,
+#               затем блоки терминов - POSITION_OFFSET на каждый документ из постингов
+#               (в том же порядке) и списки позиций: varint числа позиций + позиции дельтами.
+#               Позиции одного документа читаются без декодирования остальных
+#   частоты     только с флагом FLAG_FREQUENCIES: POSITION_OFFSET на каждый термин + ограничитель,
+#               затем tf в varint в порядке постингов термина
+#   длины       только с FLAG_FREQUENCIES: DOC_LENGTH (число токенов) на каждый документ,
+#               средняя длина - в заголовке (для BM25)
+MAGIC = b'SEIX'
+VERSION = 4
+HEADER = struct.Struct('<4sHHIIQQQQQQQd')
+TERM_ENTRY = struct.Struct('<III')
+POSITION_OFFSET = struct.Struct('<I')
+DOC_LENGTH = struct.Struct('<I')
+FLAG_POSITIONS = 1
+FLAG_FREQUENCIES = 2
+# секции после таблицы документов в порядке записи в файл
+SECTIONS = ('terms', 'table', 'postings', 'position_table', 'positions', 'frequency_table', 'frequencies',
+            'lengths')
+COPY_BUFFER = 1 << 20
+
+
+def encode_varint(value, out):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def decode_varint(buffer, pos):
+    result = 0
+    shift = 0
+    while True:
+        byte = buffer[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def encode_postings(doc_ids):
+    out = bytearray()
+    previous = 0
+    for doc_id in doc_ids:
+        encode_varint(doc_id - previous, out)
+        previous = doc_id
+    return out
+
+
+def decode_postings(buffer, pos, count):
+    doc_ids = []
+    doc_id = 0
+    for _ in range(count):
+        delta, pos = decode_varint(buffer, pos)
+        doc_id += delta
+        doc_ids.append(doc_id)
+    return doc_ids
+
+
+def encode_positions(doc_positions):
+    """Блок позиций термина: смещения списков и сами списки"""
+    offsets = bytearray()
+    lists = bytearray()
+    header_size = len(doc_positions) * POSITION_OFFSET.size
+    for positions in doc_positions:
+        offsets += POSITION_OFFSET.pack(header_size + len(lists))
+        encode_varint(len(positions), lists)
+        lists += encode_postings(positions)
+    return offsets + lists
+
+
+def write_index(path, index, positions=None, frequencies=None, doc_lengths=None):
+    """Сохраняет индекс {термин: документы} в бинарном формате.
+
+    positions - необязательные позиции {термин: {документ: отсортированные позиции}},
+    frequencies - {термин: {документ: tf}} вместе с doc_lengths {документ: число токенов}.
+    """
+    doc_names = sorted({doc for docs in index.values() for doc in docs})
+    doc_numbers = {name: number for number, name in enumerate(doc_names)}
+
+    with IndexWriter(path, doc_names, positions is not None, frequencies is not None) as writer:
+        for term in sorted(index, key=lambda term: term.encode('utf-8')):
+            doc_ids = sorted(doc_numbers[doc] for doc in index[term])
+            term_positions = term_frequencies = None
+            if positions is not None:
+                term_positions = [positions.get(term, {}).get(doc_names[doc_id], []) for doc_id in doc_ids]
+            if frequencies is not None:
+                term_frequencies = [frequencies.get(term, {}).get(doc_names[doc_id], 0) for doc_id in doc_ids]
+            writer.add_term(term, doc_ids, term_positions, term_frequencies)
+
+        if frequencies is not None:
+            writer.doc_lengths = [doc_lengths.get(name, 0) for name in doc_names]
+
+
+class IndexWriter:
+    """Потоковая запись бинарного индекса: термины подаются по одному, побайтно
+    по возрастанию, с номерами документов из doc_names. Секции копятся во
+    временных файлах и склеиваются при закрытии, так что в памяти не держится
+    ни индекс, ни даже его секции - это нужно внешней сборке (spimi.py).
+    Для индекса с частотами до закрытия нужно заполнить doc_lengths"""
+
+    def __init__(self, path, doc_names, positions=False, frequencies=False):
+        self.path = path
+        self.doc_names = doc_names
+        self.positions = positions
+        self.frequencies = frequencies
+        self.doc_lengths = None
+        self.term_count = 0
+        self.previous = None
+        self.sizes = dict.fromkeys(SECTIONS, 0)
+        self.sections = {name: tempfile.TemporaryFile() for name in SECTIONS}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self._discard()
+
+    def _write(self, section, data):
+        self.sections[section].write(data)
+        self.sizes[section] += len(data)
+
+    def add_term(self, term, doc_ids, positions=None, frequencies=None):
+        """positions и frequencies - по списку/числу на каждый документ doc_ids"""
+        encoded = term.encode('utf-8')
+        if self.previous is not None and encoded <= self.previous:
+            raise ValueError(f"Термины должны идти побайтно по возрастанию: {term}")
+        self.previous = encoded
+
+        if is_dense(len(doc_ids), len(self.doc_names)):
+            postings = Bitmap.from_list(doc_ids, len(self.doc_names)).to_bytes()
+        else:
+            postings = encode_postings(doc_ids)
+
+        self._write('table', TERM_ENTRY.pack(self.sizes['terms'], self.sizes['postings'], len(doc_ids)))
+        self._write('terms', encoded)
+        self._write('postings', postings)
+
+        if self.positions:
+            self._write('position_table', POSITION_OFFSET.pack(self.sizes['positions']))
+            self._write('positions', encode_positions(positions))
+
+        if self.frequencies:
+            self._write('frequency_table', POSITION_OFFSET.pack(self.sizes['frequencies']))
+            encoded_frequencies = bytearray()
+            for tf in frequencies:
+                encode_varint(tf, encoded_frequencies)
+            self._write('frequencies', encoded_frequencies)
+        self.term_count += 1
+
+    def close(self):
+        self._write('table', TERM_ENTRY.pack(self.sizes['terms'], self.sizes['postings'], 0))
+        if self.positions:
+            self._write('position_table', POSITION_OFFSET.pack(self.sizes['positions']))
+
+        average_length = 0.0
+        if self.frequencies:
+            self._write('frequency_table', POSITION_OFFSET.pack(self.sizes['frequencies']))
+            lengths = self.doc_lengths or [0] * len(self.doc_names)
+            for length in lengths:
+                self._write('lengths', DOC_LENGTH.pack(length))
+            average_length = sum(lengths) / len(lengths) if lengths else 0.0
+
+        docs_section = bytearray()
+        for name in self.doc_names:
+            encoded = name.encode('utf-8')
+            encode_varint(len(encoded), docs_section)
+            docs_section += encoded
+
+        sizes = self.sizes
+        docs_offset = HEADER.size
+        terms_offset = docs_offset + len(docs_section)
+        table_offset = terms_offset + sizes['terms']
+        postings_offset = table_offset + sizes['table']
+        positions_offset = postings_offset + sizes['postings'] if self.positions else 0
+        frequencies_offset = postings_offset + sizes['postings'] + sizes['position_table'] + sizes['positions']
+        lengths_offset = frequencies_offset + sizes['frequency_table'] + sizes['frequencies']
+        if not self.frequencies:
+            frequencies_offset = lengths_offset = 0
+
+        flags = 0
+        if self.positions:
+            flags |= FLAG_POSITIONS
+        if self.frequencies:
+            flags |= FLAG_FREQUENCIES
+
+        with open(self.path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, flags, len(self.doc_names), self.term_count,
+                                docs_offset, terms_offset, table_offset, postings_offset, positions_offset,
+                                frequencies_offset, lengths_offset, average_length))
+            f.write(docs_section)
+            for name in SECTIONS:
+                section = self.sections[name]
+                section.seek(0)
+                shutil.copyfileobj(section, f, COPY_BUFFER)
+        self._discard()
+
+    def _discard(self):
+        for section in self.sections.values():
+            section.close()
+
+
+class IndexReader(Mapping):
+    """Чтение бинарного индекса: постинги термина декодируются только при обращении к нему.
+
+    Файл открывается через mmap, поэтому несколько процессов делят его страницы
+    через кэш ОС и не держат собственную копию индекса.
+
+    Ведет себя как словарь {термин: множество документов}. doc_key задает,
+    во что превращать имя документа (например, int для task_5).
+    """
+
+    def __init__(self, path, doc_key=None):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._parse(doc_key)
+
+    def close(self):
+        self.buffer.close()
+
+    def _parse(self, doc_key):
+        (magic, version, flags, self.doc_count, self.term_count, docs_offset, self.terms_offset,
+         self.table_offset, self.postings_offset, self.positions_offset, self.frequencies_offset,
+         lengths_offset, self.average_doc_length) = HEADER.unpack_from(self.buffer, 0)
+
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} не является бинарным индексом")
+        if version != VERSION:
+            raise ValueError(f"Неподдерживаемая версия индекса: {version}")
+
+        self.doc_names = []
+        pos = docs_offset
+        for _ in range(self.doc_count):
+            length, pos = decode_varint(self.buffer, pos)
+            self.doc_names.append(self.buffer[pos:pos + length].decode('utf-8'))
+            pos += length
+
+        self.doc_keys = [doc_key(name) for name in self.doc_names] if doc_key else self.doc_names
+        # общий интерфейс с SegmentedIndex: в одном файле удаленных документов нет
+        self.live_doc_count = self.doc_count
+        self.has_positions = bool(flags & FLAG_POSITIONS)
+        self.has_frequencies = bool(flags & FLAG_FREQUENCIES)
+        self.doc_lengths = []
+        if self.has_frequencies:
+            self.doc_lengths = [length for length, in DOC_LENGTH.iter_unpack(
+                self.buffer[lengths_offset:lengths_offset + self.doc_count * DOC_LENGTH.size])]
+
+    def _entry(self, number):
+        return TERM_ENTRY.unpack_from(self.buffer, self.table_offset + number * TERM_ENTRY.size)
+
+    def _term_bytes(self, number):
+        start = self._entry(number)[0]
+        end = self._entry(number + 1)[0]
+        return self.buffer[self.terms_offset + start:self.terms_offset + end]
+
+    def find(self, term):
+        """Номер термина в таблице или -1"""
+        key = term.encode('utf-8')
+        low, high = 0, self.term_count - 1
+        while low <= high:
+            middle = (low + high) // 2
+            current = self._term_bytes(middle)
+            if current < key:
+                low = middle + 1
+            elif current > key:
+                high = middle - 1
+            else:
+                return middle
+        return -1
+
+    def _decode(self, number):
+        _, offset, df = self._entry(number)
+        start = self.postings_offset + offset
+        if is_dense(df, self.doc_count):
+            return Bitmap.from_bytes(self.buffer[start:start + (self.doc_count + 7) // 8], self.doc_count)
+        return decode_postings(self.buffer, start, df)
+
+    def posting_set(self, term):
+        """Список номеров документов или Bitmap для частых терминов"""
+        number = self.find(term)
+        if number < 0:
+            return []
+        return self._decode(number)
+
+    def positions(self, term, doc_ids):
+        """{номер документа: позиции термина} только для переданных документов,
+        где термин встречается - остальные списки позиций не декодируются"""
+        if not self.has_positions:
+            raise ValueError("Индекс построен без позиций")
+
+        number = self.find(term)
+        if number < 0:
+            return {}
+        return self.positions_at(number, doc_ids)
+
+    def positions_at(self, number, doc_ids):
+        postings = self._decode(number)
+        data_offset = self.positions_offset + (self.term_count + 1) * POSITION_OFFSET.size
+        block = data_offset + POSITION_OFFSET.unpack_from(
+            self.buffer, self.positions_offset + number * POSITION_OFFSET.size)[0]
+
+        result = {}
+        for doc_id in doc_ids:
+            position = rank(postings, doc_id)
+            if position < 0:
+                continue
+            start = block + POSITION_OFFSET.unpack_from(self.buffer, block + position * POSITION_OFFSET.size)[0]
+            count, start = decode_varint(self.buffer, start)
+            result[doc_id] = decode_postings(self.buffer, start, count)
+        return result
+
+    def frequencies(self, term):
+        """tf термина в каждом документе, в порядке postings(term)"""
+        if not self.has_frequencies:
+            raise ValueError("Индекс построен без частот терминов")
+
+        number = self.find(term)
+        if number < 0:
+            return []
+        return self.frequencies_at(number)
+
+    def frequencies_at(self, number):
+        df = self._entry(number)[2]
+        data_offset = self.frequencies_offset + (self.term_count + 1) * POSITION_OFFSET.size
+        start = data_offset + POSITION_OFFSET.unpack_from(
+            self.buffer, self.frequencies_offset + number * POSITION_OFFSET.size)[0]
+        result = []
+        for _ in range(df):
+            value, start = decode_varint(self.buffer, start)
+            result.append(value)
+        return result
+
+    def term_numbers(self):
+        """{термин: номер} за один проход по таблице - для массовых обращений
+        без бинарного поиска на каждый термин"""
+        return {term: number for number, term in enumerate(self.terms())}
+
+    def posting_set_at(self, number):
+        return self._decode(number)
+
+    def doc_frequency_at(self, number):
+        return self._entry(number)[2]
+
+    def postings(self, term):
+        """Отсортированные номера документов (индексы в doc_names)"""
+        number = self.find(term)
+        if number < 0:
+            return []
+        postings = self._decode(number)
+        return postings.to_list() if isinstance(postings, Bitmap) else postings
+
+    def doc_frequency(self, term):
+        number = self.find(term)
+        return self._entry(number)[2] if number >= 0 else 0
+
+    def live_docs(self):
+        return range(self.doc_count)
+
+    def deleted_docs(self):
+        return []
+
+    def terms(self):
+        for number in range(self.term_count):
+            yield self._term_bytes(number).decode('utf-8')
+
+    def __getitem__(self, term):
+        number = self.find(term)
+        if number < 0:
+            raise KeyError(term)
+        return {self.doc_keys[doc_id] for doc_id in self._decode(number)}
+
+    def __contains__(self, term):
+        return self.find(term) >= 0
+
+    def __iter__(self):
+        return self.terms()
+
+    def __len__(self):
+        return self.term_count
+
+    def to_dict(self):
+        return {term: sorted(self[term]) for term in self.terms()}
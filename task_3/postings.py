@@ -0,0 +1,209 @@
+from bisect import bisect_left
+
+# Операции над списками документов двух видов:
+#   - редкие термины: отсортированный список номеров документов, пересечение
+#     и разность идут галопом (экспоненциальный шаг + бинарный поиск) по длинному
+#     списку, поэтому стоят O(m log(n/m)), а не O(n + m);
+#   - частые термины: Bitmap, битовая маска на весь корпус, где AND/OR/NOT -
+#     побитовые операции над целым числом Python (по машинным словам, на C).
+# Списки и маски можно смешивать, результат приводится к более удобному виду.
+
+# Маска выгоднее списка 32-битных номеров, если термин есть больше чем в 1/32 документов
+DENSE_RATIO = 32
+
+
+def is_dense(df, doc_count):
+    return df * DENSE_RATIO > doc_count
+
+
+class Bitmap:
+    __slots__ = ('bits', 'size')
+
+    def __init__(self, bits, size):
+        self.bits = bits
+        self.size = size
+
+    @classmethod
+    def from_list(cls, doc_ids, size):
+        data = bytearray((size + 7) // 8)
+        for doc_id in doc_ids:
+            data[doc_id >> 3] |= 1 << (doc_id & 7)
+        return cls(int.from_bytes(data, 'little'), size)
+
+    @classmethod
+    def from_bytes(cls, data, size):
+        return cls(int.from_bytes(data, 'little'), size)
+
+    def to_bytes(self):
+        return self.bits.to_bytes((self.size + 7) // 8, 'little')
+
+    def to_list(self):
+        result = []
+        for position, byte in enumerate(self.to_bytes()):
+            if byte:
+                base = position << 3
+                for bit in range(8):
+                    if byte >> bit & 1:
+                        result.append(base + bit)
+        return result
+
+    def __iter__(self):
+        return iter(self.to_list())
+
+    def __len__(self):
+        return self.bits.bit_count()
+
+    def __bool__(self):
+        return self.bits != 0
+
+    def __eq__(self, other):
+        return isinstance(other, Bitmap) and self.bits == other.bits
+
+
+def _filter(doc_ids, bitmap, keep):
+    data = bitmap.to_bytes()
+    return [doc_id for doc_id in doc_ids if bool(data[doc_id >> 3] >> (doc_id & 7) & 1) == keep]
+
+
+def to_list(postings):
+    return postings.to_list() if isinstance(postings, Bitmap) else list(postings)
+
+
+def gallop(values, target, low=0):
+    """Первая позиция в values начиная с low, где значение >= target"""
+    size = len(values)
+    if low >= size or values[low] >= target:
+        return low
+
+    step = 1
+    high = low + 1
+    while high < size and values[high] < target:
+        low = high
+        step *= 2
+        high = low + step
+
+    return bisect_left(values, target, low + 1, min(high, size))
+
+
+def rank(postings, doc_id):
+    """Порядковый номер doc_id в списке документов или -1, если его там нет"""
+    if isinstance(postings, Bitmap):
+        if not postings.bits >> doc_id & 1:
+            return -1
+        return (postings.bits & ((1 << doc_id) - 1)).bit_count()
+    position = bisect_left(postings, doc_id)
+    if position < len(postings) and postings[position] == doc_id:
+        return position
+    return -1
+
+
+def intersect(first, second):
+    if isinstance(first, Bitmap) and isinstance(second, Bitmap):
+        return Bitmap(first.bits & second.bits, first.size)
+    if isinstance(first, Bitmap):
+        return _filter(second, first, True)
+    if isinstance(second, Bitmap):
+        return _filter(first, second, True)
+
+    if len(first) > len(second):
+        first, second = second, first
+
+    result = []
+    pos = 0
+    size = len(second)
+    for doc_id in first:
+        pos = gallop(second, doc_id, pos)
+        if pos == size:
+            break
+        if second[pos] == doc_id:
+            result.append(doc_id)
+            pos += 1
+    return result
+
+
+def intersect_many(lists):
+    """Пересечение начиная с самого редкого термина"""
+    if not lists:
+        return []
+
+    lists = sorted(lists, key=len)
+    result = lists[0]
+    for postings in lists[1:]:
+        if not result:
+            break
+        result = intersect(result, postings)
+    return result
+
+
+def difference(first, second):
+    """first без second за один проход по first"""
+    if isinstance(first, Bitmap):
+        if not isinstance(second, Bitmap):
+            second = Bitmap.from_list(second, first.size)
+        return Bitmap(first.bits & ~second.bits, first.size)
+    if isinstance(second, Bitmap):
+        return _filter(first, second, False)
+
+    result = []
+    pos = 0
+    size = len(second)
+    for doc_id in first:
+        pos = gallop(second, doc_id, pos)
+        if pos < size and second[pos] == doc_id:
+            pos += 1
+            continue
+        result.append(doc_id)
+    return result
+
+
+def union(first, second):
+    if isinstance(first, Bitmap) or isinstance(second, Bitmap):
+        size = first.size if isinstance(first, Bitmap) else second.size
+        if not isinstance(first, Bitmap):
+            first = Bitmap.from_list(first, size)
+        if not isinstance(second, Bitmap):
+            second = Bitmap.from_list(second, size)
+        return Bitmap(first.bits | second.bits, size)
+
+    result = []
+    i = j = 0
+    first_size, second_size = len(first), len(second)
+    while i < first_size and j < second_size:
+        a, b = first[i], second[j]
+        if a < b:
+            result.append(a)
+            i += 1
+        elif b < a:
+            result.append(b)
+            j += 1
+        else:
+            result.append(a)
+            i += 1
+            j += 1
+    result.extend(first[i:])
+    result.extend(second[j:])
+    return result
+
+
+def complement(postings, doc_count):
+    if not isinstance(postings, Bitmap):
+        postings = Bitmap.from_list(postings, doc_count)
+    mask = (1 << doc_count) - 1
+    return Bitmap(mask & ~postings.bits, doc_count)
+
+
+def min_distance(first, second):
+    """Наименьшее |a - b| для отсортированных списков позиций, проход слиянием"""
+    best = None
+    i = j = 0
+    while i < len(first) and j < len(second):
+        distance = abs(first[i] - second[j])
+        if best is None or distance < best:
+            best = distance
+            if best == 0:
+                break
+        if first[i] < second[j]:
+            i += 1
+        else:
+            j += 1
+    return best
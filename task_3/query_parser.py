@@ -0,0 +1,231 @@
+import re
+
+# Разбор булевых запросов: токены -> AST -> оптимизированный план.
+# Приоритет: NEAR/k > NOT > AND > OR, соседние термины без оператора соединяются через AND.
+# "..." - фраза: слова подряд; a NEAR/k b - термины или фразы не дальше k позиций друг от друга.
+# Слова фразы выделяются так же, как токены в задании 2, стоп-слова из фразы выбрасываются:
+# позиции в индексе считаются по потоку токенов без стоп-слов.
+
+TOKEN_RE = re.compile(r'"[^"]*"|"|\(|\)|[^\s()"]+')
+NEAR_RE = re.compile(r'NEAR/(\d+)')
+WORD_RE = re.compile(r'\b[а-яё]{2,30}\b')
+OPERATORS = {'AND', 'OR', 'NOT'}
+
+
+class Term:
+    def __init__(self, term):
+        self.term = term
+        self.estimate = None
+
+    def __repr__(self):
+        return f"Term({self.term!r})"
+
+
+class Phrase:
+    def __init__(self, terms):
+        self.terms = terms
+        self.estimate = None
+
+    def __repr__(self):
+        return f"Phrase({self.terms!r})"
+
+
+class Near:
+    def __init__(self, left, right, distance):
+        self.left = left
+        self.right = right
+        self.distance = distance
+        self.estimate = None
+
+    def __repr__(self):
+        return f"Near({self.left!r}, {self.right!r}, {self.distance})"
+
+
+class Not:
+    def __init__(self, operand):
+        self.operand = operand
+        self.estimate = None
+
+    def __repr__(self):
+        return f"Not({self.operand!r})"
+
+
+class And:
+    def __init__(self, operands):
+        self.operands = operands
+        self.estimate = None
+
+    def __repr__(self):
+        return f"And({self.operands!r})"
+
+
+class Or:
+    def __init__(self, operands):
+        self.operands = operands
+        self.estimate = None
+
+    def __repr__(self):
+        return f"Or({self.operands!r})"
+
+
+def tokenize(query):
+    return TOKEN_RE.findall(query)
+
+
+def normalize(query):
+    """Ключ кэша планов: запрос с единообразными пробелами"""
+    return ' '.join(tokenize(query))
+
+
+class Parser:
+    def __init__(self, tokens, stop_words=frozenset()):
+        self.tokens = tokens
+        self.stop_words = stop_words
+        self.pos = 0
+
+    def parse(self):
+        if not self.tokens:
+            raise ValueError("Пустой запрос")
+        node = self._or()
+        if self.pos != len(self.tokens):
+            raise ValueError(f"Неожиданный токен '{self.tokens[self.pos]}'")
+        return node
+
+    def _peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def _take(self):
+        token = self._peek()
+        if token is None:
+            raise ValueError("Запрос неожиданно закончился")
+        self.pos += 1
+        return token
+
+    def _or(self):
+        operands = [self._and()]
+        while self._peek() == 'OR':
+            self.pos += 1
+            operands.append(self._and())
+        return operands[0] if len(operands) == 1 else Or(operands)
+
+    def _and(self):
+        operands = [self._not()]
+        while self._peek() is not None and self._peek() not in ('OR', ')'):
+            if self._peek() == 'AND':
+                self.pos += 1
+            operands.append(self._not())
+        return operands[0] if len(operands) == 1 else And(operands)
+
+    def _not(self):
+        if self._peek() == 'NOT':
+            self.pos += 1
+            return Not(self._not())
+        return self._near()
+
+    def _near(self):
+        node = self._primary()
+        while self._peek() is not None and NEAR_RE.fullmatch(self._peek()):
+            distance = int(NEAR_RE.fullmatch(self._take()).group(1))
+            right = self._primary()
+            for operand in (node, right):
+                if not isinstance(operand, (Term, Phrase)):
+                    raise ValueError("NEAR соединяет только термины и фразы")
+            node = Near(node, right, distance)
+        return node
+
+    def _primary(self):
+        token = self._take()
+        if token == '(':
+            node = self._or()
+            if self._take() != ')':
+                raise ValueError("Не закрыта скобка")
+            return node
+        if token == '"':
+            raise ValueError("Не закрыта кавычка")
+        if token.startswith('"'):
+            return self._phrase(token[1:-1])
+        if token == ')' or token in OPERATORS or NEAR_RE.fullmatch(token):
+            raise ValueError(f"Ожидался термин, получено '{token}'")
+        return Term(token)
+
+    def _phrase(self, text):
+        words = [word for word in WORD_RE.findall(text.lower()) if word not in self.stop_words]
+        if not words:
+            raise ValueError(f"Во фразе '{text}' нет слов для поиска")
+        return Term(words[0]) if len(words) == 1 else Phrase(words)
+
+
+def parse(query, stop_words=frozenset()):
+    return Parser(tokenize(query), stop_words).parse()
+
+
+def optimize(node, cardinality, doc_count):
+    """Упрощает дерево и проставляет оценки числа документов.
+
+    cardinality(term) - длина списка документов термина.
+    """
+    if isinstance(node, Term):
+        node.estimate = cardinality(node.term)
+        return node
+
+    if isinstance(node, Phrase):
+        node.estimate = min(cardinality(term) for term in node.terms)
+        return node
+
+    if isinstance(node, Near):
+        node.left = optimize(node.left, cardinality, doc_count)
+        node.right = optimize(node.right, cardinality, doc_count)
+        node.estimate = min(node.left.estimate, node.right.estimate)
+        return node
+
+    if isinstance(node, Not):
+        operand = optimize(node.operand, cardinality, doc_count)
+        if isinstance(operand, Not):
+            return operand.operand
+        node.operand = operand
+        node.estimate = doc_count - operand.estimate
+        return node
+
+    kind = type(node)
+    operands = []
+    for operand in node.operands:
+        operand = optimize(operand, cardinality, doc_count)
+        if isinstance(operand, kind):
+            operands.extend(operand.operands)
+        else:
+            operands.append(operand)
+
+    if isinstance(node, Or):
+        operands.sort(key=lambda operand: operand.estimate, reverse=True)
+        node.operands = operands
+        node.estimate = min(doc_count, sum(operand.estimate for operand in operands))
+        return node
+
+    positive = sorted((operand for operand in operands if not isinstance(operand, Not)),
+                      key=lambda operand: operand.estimate)
+    negative = sorted((operand for operand in operands if isinstance(operand, Not)),
+                      key=lambda operand: operand.operand.estimate, reverse=True)
+    node.operands = positive + negative
+    if positive:
+        node.estimate = positive[0].estimate
+    else:
+        node.estimate = max(0, doc_count - sum(operand.operand.estimate for operand in negative))
+    return node
+
+
+def explain(node, indent=0):
+    padding = '  ' * indent
+    if isinstance(node, Term):
+        return f"{padding}TERM '{node.term}'  ~{node.estimate}"
+    if isinstance(node, Phrase):
+        return f"{padding}PHRASE \"{' '.join(node.terms)}\"  ~{node.estimate}"
+    if isinstance(node, Near):
+        return (f"{padding}NEAR/{node.distance}  ~{node.estimate}\n"
+                + explain(node.left, indent + 1) + '\n' + explain(node.right, indent + 1))
+    if isinstance(node, Not):
+        return f"{padding}NOT  ~{node.estimate}\n" + explain(node.operand, indent + 1)
+
+    name = 'AND' if isinstance(node, And) else 'OR'
+    lines = [f"{padding}{name}  ~{node.estimate}"]
+    lines.extend(explain(operand, indent + 1) for operand in node.operands)
+    return '\n'.join(lines)
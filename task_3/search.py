@@ -1,29 +1,58 @@
-import json
-import re
+import argparse
+import os
+import sys
+from collections import defaultdict
+from functools import cache, lru_cache
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "task_2"))
+from lemma_cache import get_lemma_cache
+from segments import open_index
+from postings import complement, difference, intersect, intersect_many, min_distance, to_list, union
+from query_parser import Near, Not, Or, Phrase, Term, explain, normalize, optimize, parse
+
+PLAN_CACHE_SIZE = 1024
+
+
+def fold_term(term):
+    return term.strip().lower().replace('ё', 'е')
+
+
+@cache
+def load_stop_words():
+    """Стоп-слова, которые задание 2 выбрасывает до подсчета позиций (нужны только фразам)"""
+    try:
+        from nltk.corpus import stopwords
+        return frozenset(stopwords.words('russian'))
+    except (ImportError, LookupError):
+        return frozenset()
+
 
 class BooleanSearchEngine:
-    def __init__(self, index_file='inverted_index.json'):
+    def __init__(self, index_file='inverted_index.bin'):
         self.index_file = index_file
         self.index = self._load_index()
-        self.all_documents = self._get_all_documents()
+        self.doc_names = self.index.doc_names if self.index else []
+        # номера удаленных документов сегментированного индекса, в дополнение не попадают
+        self.deleted = self.index.deleted_docs() if self.index else []
+        self.terms = self._build_term_dictionary()
+        self.lemma_cache = get_lemma_cache()
+        self._compile_cached = lru_cache(maxsize=PLAN_CACHE_SIZE)(self._compile)
         
     def _load_index(self):
         try:
-            with open(self.index_file, 'r', encoding='utf-8') as f:
-                index = json.load(f)
-            
-            return {term: set(docs) for term, docs in index.items()}
+            return open_index(self.index_file)
         except FileNotFoundError:
             print(f"Файл индекса {self.index_file} не найден")
             print("Сначала выполните index.py для построения индекса")
-            return {}
+            return None
     
-    def _get_all_documents(self):
-        all_docs = set()
-
-        for docs in self.index.values():
-            all_docs.update(docs)
-        return all_docs
+    def _build_term_dictionary(self):
+        """Свернутый термин (нижний регистр, ё -> е) -> ключи индекса, один проход при загрузке"""
+        terms = defaultdict(list)
+        if self.index:
+            for key in self.index:
+                terms[fold_term(key)].append(key)
+        return dict(terms)
     
     def search(self, query):
         query = query.strip()
@@ -31,87 +60,143 @@ class BooleanSearchEngine:
         if not query:
             return set()
         
-        result = self._evaluate_expression(query)
+        result = self._execute(self.compile(query))
         
-        return result
+        return {self.doc_names[doc_id] for doc_id in result}
     
-    def _evaluate_expression(self, expr):
-        expr = expr.strip()
+    def compile(self, query):
+        return self._compile_cached(normalize(query))
+    
+    def _compile(self, normalized_query):
+        stop_words = load_stop_words() if '"' in normalized_query else frozenset()
+        return optimize(parse(normalized_query, stop_words), self._cardinality, len(self.doc_names))
+    
+    def explain(self, query):
+        return explain(self.compile(query))
+    
+    def _cardinality(self, term):
+        return sum(self.index.doc_frequency(key) for key in self._resolve_term(term))
+    
+    def _execute(self, node):
+        """Возвращает отсортированный список номеров документов"""
+        if isinstance(node, Term):
+            return self._evaluate_term(node.term)
         
-        if not expr:
-            return set()
+        if isinstance(node, Phrase):
+            candidates = self._positional_candidates(node)
+            return sorted(self._match_positions(node, candidates))
+        
+        if isinstance(node, Near):
+            return self._evaluate_near(node)
+        
+        if isinstance(node, Not):
+            # голый NOT - единственный случай, когда нужно дополнение
+            return self._complement(self._execute(node.operand))
+        
+        if isinstance(node, Or):
+            result = []
+            for operand in node.operands:
+                result = union(result, self._execute(operand))
+            return result
         
-        if expr.startswith('(') and expr.endswith(')'):
-            if self._is_balanced(expr):
-                return self._evaluate_expression(expr[1:-1].strip())
-        
-        depth = 0
-        for i, char in enumerate(expr):
-            if char == '(':
-                depth += 1
-            elif char == ')':
-                depth -= 1
-            elif depth == 0:
-                if i + 2 < len(expr) and expr[i:i+3] == ' OR ':
-                    left = expr[:i]
-                    right = expr[i+3:]
-                    left_result = self._evaluate_expression(left)
-                    right_result = self._evaluate_expression(right)
-                    return left_result | right_result
-        
-        depth = 0
-        for i, char in enumerate(expr):
-            if char == '(':
-                depth += 1
-            elif char == ')':
-                depth -= 1
-            elif depth == 0:
-                if i + 4 < len(expr) and expr[i:i+5] == ' AND ':
-                    left = expr[:i]
-                    right = expr[i+5:]
-                    left_result = self._evaluate_expression(left)
-                    right_result = self._evaluate_expression(right)
-                    return left_result & right_result
-        
-        if expr.startswith('NOT '):
-            term = expr[4:].strip()
-            term_result = self._evaluate_term(term)
-            return self.all_documents - term_result
-        
-        return self._evaluate_term(expr)
+        positive = [self._execute(operand) for operand in node.operands if not isinstance(operand, Not)]
+        negative = [operand.operand for operand in node.operands if isinstance(operand, Not)]
+        
+        if positive:
+            result = intersect_many(positive)
+        else:
+            excluded = []
+            for operand in negative:
+                excluded = union(excluded, self._execute(operand))
+            return self._complement(excluded)
+        
+        # AND NOT - потоковая разность, дополнение не строится
+        for operand in negative:
+            if not result:
+                break
+            result = difference(result, self._execute(operand))
+        return result
     
-    def _is_balanced(self, expr):
-        count = 0
-        for char in expr:
-            if char == '(':
-                count += 1
-            elif char == ')':
-                count -= 1
-            if count < 0:
-                return False
-        return count == 0
+    def _complement(self, postings):
+        result = complement(postings, len(self.doc_names))
+        return difference(result, self.deleted) if self.deleted else result
     
-    def _evaluate_term(self, term):
-        term = term.strip()
-        if not term:
-            return set()
+    def _resolve_term(self, term):
+        """Ключи индекса для термина: точное совпадение, без учета регистра и ё,
+        затем лемма запроса - так же, как при индексации"""
+        folded = fold_term(term)
+        if not folded:
+            return []
         
-        term_lower = term.lower()
+        keys = self.terms.get(folded)
+        if keys:
+            return [term] if term in keys else keys
         
-        if term in self.index:
-            return self.index[term]
+        lemma = self.lemma_cache.lemmatize(folded)
+        return self.terms.get(fold_term(lemma), [])
+    
+    def _evaluate_term(self, term):
+        result = []
+        for key in self._resolve_term(term):
+            result = union(result, self.index.posting_set(key))
+        return result
+    
+    def _positional_candidates(self, node):
+        """Документы со всеми терминами фразы - обычное пересечение постингов,
+        позиции дальше декодируются только для них"""
+        if not self.index.has_positions:
+            raise ValueError("Для фраз и NEAR нужен индекс с позициями: python index.py --positions")
+        if isinstance(node, Term):
+            return to_list(self._evaluate_term(node.term))
+        return to_list(intersect_many([self._evaluate_term(term) for term in node.terms]))
+    
+    def _term_positions(self, term, doc_ids):
+        keys = self._resolve_term(term)
+        if len(keys) == 1:
+            return self.index.positions(keys[0], doc_ids)
         
-        for key, docs in self.index.items():
-            if key.lower() == term_lower:
-                return docs
+        merged = defaultdict(list)
+        for key in keys:
+            for doc_id, positions in self.index.positions(key, doc_ids).items():
+                merged[doc_id].extend(positions)
+        return {doc_id: sorted(positions) for doc_id, positions in merged.items()}
+    
+    def _match_positions(self, node, doc_ids):
+        """{документ: позиции начала совпадения} для термина или фразы.
+        Каждое следующее слово фразы читается только для еще подходящих документов"""
+        matches = self._term_positions(node.term if isinstance(node, Term) else node.terms[0], doc_ids)
+        if isinstance(node, Term):
+            return matches
         
-        return set()
+        for offset, term in enumerate(node.terms[1:], 1):
+            if not matches:
+                break
+            following = self._term_positions(term, list(matches))
+            next_matches = {}
+            for doc_id, starts in matches.items():
+                positions = set(following.get(doc_id, ()))
+                kept = [start for start in starts if start + offset in positions]
+                if kept:
+                    next_matches[doc_id] = kept
+            matches = next_matches
+        return matches
+    
+    def _evaluate_near(self, node):
+        candidates = to_list(intersect(self._positional_candidates(node.left),
+                                       self._positional_candidates(node.right)))
+        left = self._match_positions(node.left, candidates)
+        right = self._match_positions(node.right, list(left))
+        return [doc_id for doc_id in sorted(right)
+                if min_distance(left[doc_id], right[doc_id]) <= node.distance]
     
     def interactive_search(self):
         print("Поддерживаемые операторы:")
         print("  AND - логическое И")
         print("  OR  - логическое ИЛИ")
         print("  NOT - логическое НЕ")
+        print('  "..." - фраза, слова подряд')
+        print("  NEAR/k - термины или фразы не дальше k слов друг от друга")
+        print("  explain <запрос> - план выполнения с оценками числа документов")
         print("\nДля выхода введите 'exit'")
         print("-" * 10)
         
@@ -125,6 +210,10 @@ class BooleanSearchEngine:
                 if not query:
                     continue
                 
+                if query.startswith('explain '):
+                    print(self.explain(query[len('explain '):]))
+                    continue
+                
                 result = self.search(query)
                 
                 if result:
@@ -143,9 +232,15 @@ class BooleanSearchEngine:
                 print("Проверьте синтаксис запроса")
 
 
-engine = BooleanSearchEngine()
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Булев поиск по инвертированному индексу")
+    parser.add_argument('--index', default='inverted_index.bin',
+                        help="файл индекса или каталог сегментов (segments.py)")
+    args = parser.parse_args()
+
+    engine = BooleanSearchEngine(args.index)
 
-if not engine.index:
-    print("Не удалось загрузить индекс")
+    if not engine.index:
+        print("Не удалось загрузить индекс")
 
-engine.interactive_search()
+    engine.interactive_search()
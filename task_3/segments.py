@@ -0,0 +1,565 @@
+import argparse
+import heapq
+import json
+import os
+import re
+import shutil
+import threading
+from bisect import bisect_right
+from collections import defaultdict
+from collections.abc import Mapping
+
+from index import InvertedIndexBuilder
+from index_format import IndexReader, write_index
+from postings import Bitmap, to_list, union
+
+# Сегментированный индекс - каталог с файлами:
+#   manifest.json      поколение и список сегментов
+#   seg_NNNNNN.bin     сегмент - обычный бинарный индекс (index_format) части документов
+#   seg_NNNNNN.G.del   tombstones сегмента в поколении G: Bitmap удаленных документов
+#                      по их номерам в сегменте
+# Новый или обновленный документ пишется в новый маленький сегмент, прежняя копия
+# помечается удаленной, так что живая копия у документа всегда одна. Запрос
+# расходится по всем сегментам: номер документа в общем пространстве - номер в
+# сегменте плюс число документов в предыдущих сегментах. Слияние переписывает
+# несколько сегментов в один без удаленных документов. Любое изменение - это
+# новые файлы и атомарная замена manifest.json, поэтому читатель видит либо
+# старый, либо новый набор сегментов целиком.
+SEGMENTS_DIR = 'segments'
+MANIFEST = 'manifest.json'
+SEGMENT_RE = re.compile(r'seg_(\d+)\.')
+# Политика слияния: сегменты делятся на ярусы по числу живых документов
+# (степени MERGE_FACTOR), MERGE_FACTOR сегментов одного яруса сливаются в один;
+# сегмент, где удалено больше MAX_DELETED_RATIO документов, переписывается сам
+MERGE_FACTOR = 4
+MAX_DELETED_RATIO = 0.3
+
+
+def load_manifest(directory):
+    with open(os.path.join(directory, MANIFEST), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def read_deletes(directory, entry, doc_count):
+    if not entry['deletes']:
+        return Bitmap(0, doc_count)
+    with open(os.path.join(directory, entry['deletes']), 'rb') as f:
+        return Bitmap.from_bytes(f.read(), doc_count)
+
+
+def open_index(path, doc_key=None):
+    """Каталог сегментов или файл индекса"""
+    if os.path.isdir(path):
+        return SegmentedIndex(path, doc_key)
+    return IndexReader(path, doc_key)
+
+
+class Segment:
+    def __init__(self, directory, entry, doc_key, base):
+        self.name = entry['name']
+        self.reader = IndexReader(os.path.join(directory, f"{self.name}.bin"), doc_key)
+        self.deleted = read_deletes(directory, entry, self.reader.doc_count)
+        self.base = base
+
+    @property
+    def live_count(self):
+        return self.reader.doc_count - len(self.deleted)
+
+    def is_live(self, doc_id):
+        return not self.deleted.bits >> doc_id & 1
+
+    def live_postings(self, postings, size):
+        """Живые документы постинга в номерах общего пространства размера size"""
+        if isinstance(postings, Bitmap):
+            return Bitmap((postings.bits & ~self.deleted.bits) << self.base, size)
+        if not self.deleted:
+            return [self.base + doc_id for doc_id in postings]
+        return [self.base + doc_id for doc_id in postings if self.is_live(doc_id)]
+
+    def live_frequency(self, number):
+        if not self.deleted:
+            return self.reader.doc_frequency_at(number)
+        postings = self.reader.posting_set_at(number)
+        if isinstance(postings, Bitmap):
+            return (postings.bits & ~self.deleted.bits).bit_count()
+        return sum(1 for doc_id in postings if self.is_live(doc_id))
+
+
+class SegmentedIndex(Mapping):
+    """Чтение сегментированного индекса с тем же интерфейсом, что у IndexReader.
+
+    Постинги, частоты и позиции собираются по всем сегментам без удаленных
+    документов; doc_count - размер общего пространства номеров (вместе с
+    удаленными), live_doc_count и average_doc_length - по живым документам.
+    """
+
+    def __init__(self, path, doc_key=None):
+        self.path = path
+        manifest = load_manifest(path)
+        self.generation = manifest['generation']
+
+        self.segments = []
+        base = 0
+        for entry in manifest['segments']:
+            segment = Segment(path, entry, doc_key, base)
+            self.segments.append(segment)
+            base += segment.reader.doc_count
+        self.bases = [segment.base for segment in self.segments]
+        self.doc_count = base
+
+        self.doc_names = [name for segment in self.segments for name in segment.reader.doc_names]
+        self.doc_keys = [key for segment in self.segments for key in segment.reader.doc_keys]
+        self.live_doc_count = sum(segment.live_count for segment in self.segments)
+        self.has_positions = bool(self.segments) and all(s.reader.has_positions for s in self.segments)
+        self.has_frequencies = bool(self.segments) and all(s.reader.has_frequencies for s in self.segments)
+
+        self.doc_lengths = []
+        self.average_doc_length = 0.0
+        if self.has_frequencies:
+            self.doc_lengths = [length for segment in self.segments for length in segment.reader.doc_lengths]
+            live = [self.doc_lengths[doc_id] for doc_id in self.live_docs()]
+            self.average_doc_length = sum(live) / len(live) if live else 0.0
+        self._term_list = None
+
+    def close(self):
+        for segment in self.segments:
+            segment.reader.close()
+
+    def _segment(self, doc_id):
+        return self.segments[bisect_right(self.bases, doc_id) - 1]
+
+    def live_docs(self):
+        return [segment.base + doc_id for segment in self.segments
+                for doc_id in range(segment.reader.doc_count) if segment.is_live(doc_id)]
+
+    def deleted_docs(self):
+        return [segment.base + doc_id for segment in self.segments for doc_id in segment.deleted.to_list()]
+
+    def posting_set(self, term):
+        """Список номеров документов или Bitmap, если хоть в одном сегменте термин частый"""
+        result = []
+        for segment in self.segments:
+            number = segment.reader.find(term)
+            if number >= 0:
+                result = union(result, segment.live_postings(segment.reader.posting_set_at(number),
+                                                             self.doc_count))
+        return result
+
+    def postings(self, term):
+        return to_list(self.posting_set(term))
+
+    def frequencies(self, term):
+        """tf термина в каждом документе, в порядке postings(term)"""
+        if not self.has_frequencies:
+            raise ValueError("Индекс построен без частот терминов")
+
+        result = []
+        for segment in self.segments:
+            number = segment.reader.find(term)
+            if number < 0:
+                continue
+            frequencies = segment.reader.frequencies_at(number)
+            if not segment.deleted:
+                result.extend(frequencies)
+                continue
+            doc_ids = to_list(segment.reader.posting_set_at(number))
+            result.extend(tf for doc_id, tf in zip(doc_ids, frequencies) if segment.is_live(doc_id))
+        return result
+
+    def positions(self, term, doc_ids):
+        if not self.has_positions:
+            raise ValueError("Индекс построен без позиций")
+
+        by_segment = defaultdict(list)
+        for doc_id in doc_ids:
+            segment = self._segment(doc_id)
+            if segment.is_live(doc_id - segment.base):
+                by_segment[segment].append(doc_id - segment.base)
+
+        result = {}
+        for segment, local_ids in by_segment.items():
+            number = segment.reader.find(term)
+            if number < 0:
+                continue
+            for doc_id, positions in segment.reader.positions_at(number, local_ids).items():
+                result[segment.base + doc_id] = positions
+        return result
+
+    def doc_frequency(self, term):
+        total = 0
+        for segment in self.segments:
+            number = segment.reader.find(term)
+            if number >= 0:
+                total += segment.live_frequency(number)
+        return total
+
+    def terms(self):
+        """Термины с живыми документами, побайтно по возрастанию, как у IndexReader"""
+        def numbered(segment):
+            for number, term in enumerate(segment.reader.terms()):
+                yield term.encode('utf-8'), term, number, segment
+
+        previous = None
+        found = False
+        for key, term, number, segment in heapq.merge(*(numbered(s) for s in self.segments),
+                                                      key=lambda item: item[0]):
+            if key != previous:
+                if found:
+                    yield previous.decode('utf-8')
+                previous, found = key, False
+            if not found:
+                found = not segment.deleted or segment.live_frequency(number) > 0
+        if found:
+            yield previous.decode('utf-8')
+
+    def term_numbers(self):
+        if self._term_list is None:
+            self._term_list = list(self.terms())
+        return {term: number for number, term in enumerate(self._term_list)}
+
+    def posting_set_at(self, number):
+        return self.posting_set(self._term_list[number])
+
+    def doc_frequency_at(self, number):
+        return self.doc_frequency(self._term_list[number])
+
+    def __getitem__(self, term):
+        postings = self.posting_set(term)
+        if not postings:
+            raise KeyError(term)
+        return {self.doc_keys[doc_id] for doc_id in postings}
+
+    def __contains__(self, term):
+        return self.doc_frequency(term) > 0
+
+    def __iter__(self):
+        return self.terms()
+
+    def __len__(self):
+        if self._term_list is None:
+            self._term_list = list(self.terms())
+        return len(self._term_list)
+
+
+class SegmentWriter:
+    """Изменение сегментированного индекса: добавление и удаление документов, слияние.
+
+    Документы берутся из результатов задания 2 (lemmas/ и counts/). Изменения
+    манифеста идут под блокировкой, поэтому слияние может работать в фоновом
+    потоке, пока добавляются документы. Писатель у каталога один.
+    """
+
+    def __init__(self, directory=SEGMENTS_DIR, lemmas_dir='../task_2/lemmas/', counts_dir='../task_2/counts/',
+                 positions=True, merge_factor=MERGE_FACTOR):
+        self.directory = directory
+        self.lemmas_dir = lemmas_dir
+        self.counts_dir = counts_dir
+        self.positions = positions
+        self.merge_factor = merge_factor
+        self.lock = threading.Lock()
+        self.merge_thread = None
+        self.next_number = 1
+        # сегменты, которые еще пишутся: их файлы не удаляются при фиксации
+        self.building = set()
+
+    def create(self, source=None):
+        """Новый каталог с одним сегментом: копия готового индекса или все документы задания 2"""
+        os.makedirs(self.directory, exist_ok=True)
+        if os.path.exists(os.path.join(self.directory, MANIFEST)):
+            raise FileExistsError(f"{self.directory} уже содержит сегментированный индекс")
+
+        name = self._new_name()
+        path = self._path(name)
+        if source:
+            shutil.copyfile(source, path)
+        else:
+            self._builder(path, None).build_index()
+        manifest = {'generation': 0, 'next_segment': self.next_number, 'segments': []}
+        self._commit(manifest, [self._entry(name)])
+
+    def open(self):
+        manifest = load_manifest(self.directory)
+        self.next_number = max([manifest['next_segment']] + [
+            int(match.group(1)) + 1 for match in map(SEGMENT_RE.match, os.listdir(self.directory)) if match])
+        return self
+
+    def _new_name(self):
+        with self.lock:
+            name = f"seg_{self.next_number:06d}"
+            self.next_number += 1
+            self.building.add(name)
+            return name
+
+    def _discard(self, name):
+        self.building.discard(name)
+        if os.path.exists(self._path(name)):
+            os.remove(self._path(name))
+
+    def _path(self, name):
+        return os.path.join(self.directory, f"{name}.bin")
+
+    def _builder(self, path, doc_names):
+        return InvertedIndexBuilder(self.lemmas_dir, path, counts_dir=self.counts_dir, positions=self.positions,
+                                    doc_names=doc_names, verbose=False)
+
+    def _entry(self, name, deleted=None):
+        reader = IndexReader(self._path(name))
+        entry = {'name': name, 'docs': reader.doc_count, 'deleted': 0, 'deletes': None}
+        reader.close()
+        if deleted:
+            entry['deleted'] = len(deleted)
+            entry['pending'] = deleted
+        return entry
+
+    def _commit(self, manifest, segments):
+        """Записывает новые tombstones и атомарно заменяет манифест, затем удаляет
+        файлы, на которые манифест больше не ссылается"""
+        generation = manifest['generation'] + 1
+        for entry in segments:
+            deleted = entry.pop('pending', None)
+            if deleted is not None:
+                entry['deletes'] = f"{entry['name']}.{generation}.del"
+                with open(os.path.join(self.directory, entry['deletes']), 'wb') as f:
+                    f.write(deleted.to_bytes())
+
+        manifest = {'generation': generation, 'next_segment': self.next_number, 'segments': segments}
+        temporary = os.path.join(self.directory, f"{MANIFEST}.tmp")
+        with open(temporary, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(temporary, os.path.join(self.directory, MANIFEST))
+
+        self.building.difference_update(entry['name'] for entry in segments)
+        used = {f"{entry['name']}.bin" for entry in segments} | {entry['deletes'] for entry in segments}
+        used |= {f"{name}.bin" for name in self.building}
+        for filename in os.listdir(self.directory):
+            if SEGMENT_RE.match(filename) and filename not in used:
+                os.remove(os.path.join(self.directory, filename))
+        return manifest
+
+    def _delete_names(self, segments, doc_names):
+        """Помечает удаленными живые копии документов; возвращает число помеченных"""
+        marked = 0
+        for entry in segments:
+            reader = IndexReader(self._path(entry['name']))
+            deleted = read_deletes(self.directory, entry, reader.doc_count)
+            bits = deleted.bits
+            for doc_id, name in enumerate(reader.doc_names):
+                if name in doc_names and not bits >> doc_id & 1:
+                    bits |= 1 << doc_id
+            reader.close()
+            if bits != deleted.bits:
+                marked += (bits & ~deleted.bits).bit_count()
+                entry['pending'] = Bitmap(bits, deleted.size)
+                entry['deleted'] = bits.bit_count()
+        return marked
+
+    def add_documents(self, doc_names):
+        """Новые или измененные документы - в новый сегмент, старые копии - в tombstones"""
+        name = self._new_name()
+        self._builder(self._path(name), doc_names).build_index()
+        with self.lock:
+            manifest = load_manifest(self.directory)
+            segments = manifest['segments']
+            replaced = self._delete_names(segments, set(doc_names))
+            self._commit(manifest, segments + [self._entry(name)])
+        return replaced
+
+    def delete_documents(self, doc_names):
+        with self.lock:
+            manifest = load_manifest(self.directory)
+            segments = manifest['segments']
+            deleted = self._delete_names(segments, set(doc_names))
+            if deleted:
+                self._commit(manifest, segments)
+        return deleted
+
+    def find_merges(self, segments):
+        """Группы сегментов для слияния по политике ярусов"""
+        merges = []
+        tiers = defaultdict(list)
+        for entry in segments:
+            live = entry['docs'] - entry['deleted']
+            if entry['docs'] and entry['deleted'] > MAX_DELETED_RATIO * entry['docs']:
+                merges.append([entry['name']])
+                continue
+            tier = 0
+            while live >= self.merge_factor ** (tier + 1):
+                tier += 1
+            tiers[tier].append(entry['name'])
+
+        for tier in sorted(tiers):
+            names = tiers[tier]
+            while len(names) >= self.merge_factor:
+                merges.append(names[:self.merge_factor])
+                names = names[self.merge_factor:]
+        return merges
+
+    def merge(self, names):
+        """Сливает сегменты в один без удаленных документов. Документы, удаленные
+        из исходных сегментов во время слияния, помечаются в новом сегменте"""
+        with self.lock:
+            snapshot = {entry['name']: entry for entry in load_manifest(self.directory)['segments']}
+            sources = [snapshot[name] for name in names]
+            # tombstones снимка читаются сразу: удаление, зафиксированное во время
+            # слияния, пишет новые файлы .del и удаляет файлы снимка
+            before = {source['name']: read_deletes(self.directory, source, source['docs']) for source in sources}
+
+        name = self._new_name()
+        try:
+            merged_names = self._write_merged(self._path(name), sources, before)
+            with self.lock:
+                manifest = load_manifest(self.directory)
+                segments = manifest['segments']
+                current = {entry['name']: entry for entry in segments}
+                if any(source not in current for source in names):
+                    return False
+
+                # документы, которые были живы в снимке и умерли с тех пор
+                deleted_since = set()
+                for source in names:
+                    reader = IndexReader(self._path(source))
+                    after = read_deletes(self.directory, current[source], reader.doc_count).bits
+                    for doc_id in Bitmap(after & ~before[source].bits, reader.doc_count).to_list():
+                        deleted_since.add(reader.doc_names[doc_id])
+                    reader.close()
+
+                position = min(segments.index(current[source]) for source in names)
+                kept = [entry for entry in segments if entry['name'] not in names]
+                if merged_names:
+                    pending = Bitmap.from_list([doc_id for doc_id, doc in enumerate(merged_names)
+                                                if doc in deleted_since], len(merged_names))
+                    kept.insert(position, self._entry(name, pending if pending else None))
+                self._commit(manifest, kept)
+            return True
+        finally:
+            # новый сегмент не попал в манифест (гонка, пустой результат или ошибка)
+            with self.lock:
+                if name in self.building:
+                    self._discard(name)
+
+    def _write_merged(self, path, sources, deleted):
+        """Живые документы сегментов в один файл индекса; deleted - tombstones
+        сегментов по имени. Возвращает имена документов"""
+        index = defaultdict(list)
+        frequencies = defaultdict(dict)
+        positions = defaultdict(dict)
+        doc_lengths = {}
+        has_frequencies = has_positions = True
+        for source in sources:
+            reader = IndexReader(self._path(source['name']))
+            segment_deleted = deleted[source['name']]
+            has_frequencies &= reader.has_frequencies
+            has_positions &= reader.has_positions
+            names = reader.doc_names
+            for doc_id in range(reader.doc_count):
+                if not segment_deleted.bits >> doc_id & 1 and reader.has_frequencies:
+                    doc_lengths[names[doc_id]] = reader.doc_lengths[doc_id]
+
+            for number, term in enumerate(reader.terms()):
+                doc_ids = to_list(reader.posting_set_at(number))
+                live = [i for i, doc_id in enumerate(doc_ids) if not segment_deleted.bits >> doc_id & 1]
+                if not live:
+                    continue
+                index[term].extend(names[doc_ids[i]] for i in live)
+                if reader.has_frequencies:
+                    term_frequencies = reader.frequencies_at(number)
+                    for i in live:
+                        frequencies[term][names[doc_ids[i]]] = term_frequencies[i]
+                if reader.has_positions:
+                    for doc_id, doc_positions in reader.positions_at(number, [doc_ids[i] for i in live]).items():
+                        positions[term][names[doc_id]] = doc_positions
+            reader.close()
+
+        if not index:
+            return []
+        write_index(path, index, positions if has_positions else None,
+                    frequencies if has_frequencies else None, doc_lengths if has_frequencies else None)
+        return sorted({doc for docs in index.values() for doc in docs})
+
+    def maybe_merge(self):
+        """Сливает сегменты, пока политика находит, что сливать; возвращает число слияний"""
+        merges = 0
+        while True:
+            with self.lock:
+                groups = self.find_merges(load_manifest(self.directory)['segments'])
+            if not groups:
+                return merges
+            for names in groups:
+                if self.merge(names):
+                    merges += 1
+
+    def merge_all(self):
+        with self.lock:
+            segments = load_manifest(self.directory)['segments']
+        if len(segments) > 1 or any(entry['deleted'] for entry in segments):
+            self.merge([entry['name'] for entry in segments])
+
+    def merge_in_background(self):
+        """Запускает maybe_merge в фоновом потоке, если он еще не идет"""
+        if self.merge_thread is None or not self.merge_thread.is_alive():
+            self.merge_thread = threading.Thread(target=self.maybe_merge, daemon=True)
+            self.merge_thread.start()
+        return self.merge_thread
+
+    def wait(self):
+        if self.merge_thread is not None:
+            self.merge_thread.join()
+
+
+def page_name(value):
+    """'7', 'page_007.html' -> '007', как имена файлов задания 2"""
+    match = re.search(r'\d+', value)
+    return f"{int(match.group()):03d}" if match else value
+
+
+def print_stats(directory):
+    index = SegmentedIndex(directory)
+    print(f"Поколение {index.generation}: сегментов {len(index.segments)}, "
+          f"документов {index.live_doc_count} (удаленных копий {index.doc_count - index.live_doc_count})")
+    for segment in index.segments:
+        print(f"  {segment.name}: документов {segment.reader.doc_count}, удалено {len(segment.deleted)}, "
+              f"терминов {segment.reader.term_count}")
+    index.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Сегментированный индекс с дозаписью документов")
+    parser.add_argument('--dir', default=SEGMENTS_DIR, help="каталог сегментов")
+    commands = parser.add_subparsers(dest='command', required=True)
+    create = commands.add_parser('init', help="создать каталог с одним сегментом")
+    create.add_argument('--from', dest='source', default=None,
+                        help="взять готовый файл индекса (например, inverted_index.bin) вместо построения")
+    add = commands.add_parser('add', help="добавить или обновить документы из task_2 (номера страниц)")
+    add.add_argument('pages', nargs='+')
+    add.add_argument('--merge', action='store_true',
+                     help="сразу после добавления слить сегменты по политике (синхронно, как merge)")
+    delete = commands.add_parser('delete', help="удалить документы")
+    delete.add_argument('pages', nargs='+')
+    merge = commands.add_parser('merge', help="слить сегменты по политике ярусов")
+    merge.add_argument('--all', action='store_true', help="слить все сегменты в один")
+    commands.add_parser('stats', help="сегменты и число документов")
+    args = parser.parse_args()
+
+    writer = SegmentWriter(args.dir)
+    try:
+        if args.command == 'init':
+            writer.create(args.source)
+        elif args.command == 'add':
+            pages = [page_name(page) for page in args.pages]
+            replaced = writer.open().add_documents(pages)
+            print(f"Добавлено документов: {len(pages)}, из них обновлено: {replaced}")
+            # без --merge команда завершается, как только сегмент зафиксирован;
+            # слияние - отдельной командой merge или при следующем add --merge
+            if args.merge:
+                print(f"Слияний: {writer.maybe_merge()}")
+        elif args.command == 'delete':
+            print(f"Удалено документов: {writer.open().delete_documents([page_name(p) for p in args.pages])}")
+        elif args.command == 'merge':
+            writer.open()
+            if args.all:
+                writer.merge_all()
+            else:
+                print(f"Слияний: {writer.maybe_merge()}")
+        print_stats(args.dir)
+    except (FileNotFoundError, FileExistsError) as e:
+        print(f"Ошибка: {e}")
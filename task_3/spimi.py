@@ -0,0 +1,149 @@
+import heapq
+import os
+import pickle
+import shutil
+import tempfile
+
+# Накопление постингов по схеме SPIMI (single-pass in-memory indexing): записи
+# копятся в словаре {термин: [записи]}, пока оценка занятой памяти не превысит
+# бюджет, затем словарь сортируется по терминам и сбрасывается на диск прогоном
+# (run_NNNNN.bin - подряд записи pickle (термин, [записи])), а память
+# освобождается. В конце прогоны сливаются кучей: записи одного термина из
+# разных прогонов склеиваются в порядке прогонов, поэтому, если документы
+# поступают по возрастанию номера, записи термина остаются отсортированными по
+# документу. Порядок строк Python совпадает с побайтным порядком utf-8, в котором
+# термины лежат в index_format. Если прогонов больше max_merge_runs, соседние
+# прогоны сначала сливаются группами в промежуточные, чтобы не держать открытыми
+# слишком много файлов.
+DEFAULT_MEMORY_BUDGET = 64 * 2 ** 20
+# грубая оценка памяти: новый термин в словаре вместе со списком, запись
+# (кортеж с числами) и каждое число внутри записи
+TERM_OVERHEAD = 150
+ENTRY_OVERHEAD = 100
+ITEM_SIZE = 36
+WRITE_BUFFER = 1 << 20
+MAX_MERGE_RUNS = 64
+
+
+def entry_size(items=0):
+    """Оценка памяти записи с items дополнительными числами (например, позициями)"""
+    return ENTRY_OVERHEAD + items * ITEM_SIZE
+
+
+def read_run(path):
+    with open(path, 'rb') as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+
+def merge_runs(paths):
+    """Слияние прогонов кучей: (термин, записи) по возрастанию термина"""
+    current, current_entries = None, []
+    # ключ - (термин, номер прогона): записи термина склеиваются в порядке прогонов
+    runs = [((term, number, entries) for term, entries in read_run(path)) for number, path in enumerate(paths)]
+    for term, _, entries in heapq.merge(*runs):
+        if term != current:
+            if current is not None:
+                yield current, current_entries
+            current, current_entries = term, []
+        current_entries.extend(entries)
+    if current is not None:
+        yield current, current_entries
+
+
+class SpillingPostings:
+    """Словарь {термин: [записи]} с бюджетом памяти и сбросом прогонов на диск.
+
+    Используется как контекстный менеджер: временный каталог прогонов удаляется
+    при выходе. merged() отдает (термин, записи) по возрастанию термина один раз.
+    """
+
+    def __init__(self, memory_budget=DEFAULT_MEMORY_BUDGET, temp_dir=None, max_merge_runs=MAX_MERGE_RUNS):
+        self.memory_budget = memory_budget
+        self.temp_dir = temp_dir
+        self.max_merge_runs = max_merge_runs
+        self.directory = None
+        self.terms = {}
+        self.used = 0
+        self.runs = []
+        self.entries = 0
+        # статистика: сброшено прогонов и байт, промежуточных проходов слияния
+        self.run_count = 0
+        self.spilled_bytes = 0
+        self.merge_passes = 0
+        self.files_written = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
+
+    def close(self):
+        self.terms = {}
+        if self.directory:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            self.directory = None
+
+    def add(self, term, entry, size=ENTRY_OVERHEAD):
+        entries = self.terms.get(term)
+        if entries is None:
+            entries = self.terms[term] = []
+            self.used += TERM_OVERHEAD + len(term)
+        entries.append(entry)
+        self.used += size
+        self.entries += 1
+        if self.used >= self.memory_budget:
+            self.spill()
+
+    def spill(self):
+        """Сбрасывает накопленное в новый прогон на диске"""
+        if not self.terms:
+            return
+        terms = self.terms
+        path = self._write_run((term, terms[term]) for term in sorted(terms))
+        self.runs.append(path)
+        self.run_count += 1
+        self.spilled_bytes += os.path.getsize(path)
+        self.terms = {}
+        self.used = 0
+
+    def _write_run(self, records):
+        if self.directory is None:
+            self.directory = tempfile.mkdtemp(prefix='spimi_', dir=self.temp_dir)
+        path = os.path.join(self.directory, f"run_{self.files_written:05d}.bin")
+        self.files_written += 1
+        with open(path, 'wb', buffering=WRITE_BUFFER) as f:
+            for record in records:
+                pickle.dump(record, f, protocol=pickle.HIGHEST_PROTOCOL)
+        return path
+
+    def merged(self):
+        """(термин, записи) по возрастанию термина; без сброшенных прогонов - прямо из памяти"""
+        if not self.runs:
+            terms, self.terms, self.used = self.terms, {}, 0
+            for term in sorted(terms):
+                yield term, terms.pop(term)
+            return
+
+        self.spill()
+        while len(self.runs) > self.max_merge_runs:
+            self._merge_pass()
+        yield from merge_runs(self.runs)
+
+    def _merge_pass(self):
+        """Сливает соседние группы по max_merge_runs прогонов, порядок прогонов сохраняется"""
+        self.merge_passes += 1
+        runs = []
+        for start in range(0, len(self.runs), self.max_merge_runs):
+            group = self.runs[start:start + self.max_merge_runs]
+            if len(group) == 1:
+                runs.append(group[0])
+                continue
+            runs.append(self._write_run(merge_runs(group)))
+            for path in group:
+                os.remove(path)
+        self.runs = runs
@@ -0,0 +1,74 @@
+import os
+
+import pytest
+
+from segments import SegmentWriter, SegmentedIndex, load_manifest
+
+TASK_2 = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'task_2')
+
+
+@pytest.fixture
+def writer(tmp_path):
+    """Сегмент со всеми документами задания 2 и сегмент с обновленными 001 и 002"""
+    writer = SegmentWriter(str(tmp_path / 'segments'), os.path.join(TASK_2, 'lemmas'),
+                           os.path.join(TASK_2, 'counts'))
+    writer.create()
+    writer.open().add_documents(['001', '002'])
+    return writer
+
+
+def segment_names(writer):
+    return [entry['name'] for entry in load_manifest(writer.directory)['segments']]
+
+
+def segment_files(writer):
+    return sorted(filename for filename in os.listdir(writer.directory) if filename.startswith('seg_'))
+
+
+def live_names(writer):
+    index = SegmentedIndex(writer.directory)
+    try:
+        return {index.doc_keys[doc_id] for doc_id in index.live_docs()}
+    finally:
+        index.close()
+
+
+def test_merge_with_concurrent_delete(writer, monkeypatch):
+    names = segment_names(writer)
+    write_merged = writer._write_merged
+
+    def write_merged_then_delete(path, sources, deleted):
+        merged = write_merged(path, sources, deleted)
+        # удаление фиксируется, пока слияние пишет новый сегмент: .del снимка удаляется
+        assert writer.delete_documents(['003', '001']) == 2
+        return merged
+
+    monkeypatch.setattr(writer, '_write_merged', write_merged_then_delete)
+    assert writer.merge(names)
+
+    segments = load_manifest(writer.directory)['segments']
+    assert len(segments) == 1
+    assert segments[0]['deleted'] == 2
+    live = live_names(writer)
+    assert '003' not in live and '001' not in live
+    assert '002' in live and len(live) == 98
+    assert writer.building == set()
+    assert segment_files(writer) == sorted([f"{segments[0]['name']}.bin", segments[0]['deletes']])
+
+
+def test_failed_merge_discards_new_segment(writer, monkeypatch):
+    names = segment_names(writer)
+    files = segment_files(writer)
+
+    def failing_write(path, sources, deleted):
+        with open(path, 'wb') as f:
+            f.write(b'partial')
+        raise OSError("нет места на диске")
+
+    monkeypatch.setattr(writer, '_write_merged', failing_write)
+    with pytest.raises(OSError):
+        writer.merge(names)
+
+    assert writer.building == set()
+    assert segment_files(writer) == files
+    assert segment_names(writer) == names
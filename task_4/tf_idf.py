@@ -1,13 +1,34 @@
+import argparse
 import math
 import os
-import json
+import sys
+import time
 import traceback
-from collections import defaultdict
+from collections import Counter
 
-N = 100
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "task_2"))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "task_3"))
+from segments import open_index
+from postings import Bitmap
+from term_counts import load_term_counts
+from vectors_format import write_vectors
+
+N = 0
 digits = 7
 base = 10
 INDEX = {}
+INDEX_TERMS = {}
+
+# TF-IDF считается пачкой: корпус читается один раз, термины получают номера
+# в общем словаре, частоты документа - строка матрицы документ x термин,
+# idf берется из таблицы по df (df - целое от 0 до N), tf-idf - операция над
+# массивами всей матрицы сразу. Частоты берутся из counts/ задания 2, без них -
+# из списков уникальных токенов tokens/ и lemmas/, где каждый токен встречается
+# один раз. N и список документов берутся из индекса (файла или каталога
+# сегментов): после добавления или удаления документов idf считается по живому
+# корпусу.
 
 
 def format_doc_number(num):
@@ -18,190 +39,316 @@ def solve_idf(doc_count):
         return 0
     return round(math.log(N / doc_count, base), 4)
 
-def parse_index(path="../task_3/inverted_index.json"):
-    global INDEX
+def parse_doc_number(doc):
+    if doc.startswith('page_'):
+        doc = doc.replace('page_', '')
+    try:
+        return int(doc)
+    except ValueError:
+        return doc
+
+def parse_index(path="../task_3/inverted_index.bin"):
+    global INDEX, INDEX_TERMS, N
     try:
-        with open(path, 'r', encoding='utf-8') as f:
-            json_index = json.load(f)
-            
-            for term, docs in json_index.items():
-                INDEX[term] = set()
-                for doc in docs:
-                    if isinstance(doc, str) and doc.startswith('page_'):
-                        try:
-                            doc_num = int(doc.replace('page_', ''))
-                            INDEX[term].add(doc_num)
-                        except ValueError:
-                            INDEX[term].add(doc)
-                    else:
-                        try:
-                            INDEX[term].add(int(doc))
-                        except (ValueError, TypeError):
-                            INDEX[term].add(doc)
-            
-        print(f"Загружено {len(INDEX)} терминов из JSON индекса")
-        
+        INDEX = open_index(path, doc_key=parse_doc_number)
+        INDEX_TERMS = INDEX.term_numbers()
+        N = INDEX.live_doc_count
+        print(f"Загружено {len(INDEX_TERMS)} терминов из бинарного индекса, документов: {N}")
+
     except FileNotFoundError:
         print(f"Файл индекса {path} не найден")
         exit(1)
-    except json.JSONDecodeError as e:
-        print(f"Ошибка при парсинге JSON: {e}")
+    except ValueError as e:
+        print(f"Ошибка при чтении индекса: {e}")
         exit(1)
 
 def parse_tokens(doc_num):
     formatted_num = format_doc_number(doc_num)
-    
-    possible_paths = [
-        f"../task_2/tokens/{formatted_num}.txt",
-    ]
-    
-    tokens = []
-    
-    for path in possible_paths:
-        if os.path.exists(path):
-            try:
-                with open(path, encoding="utf-8") as f:
-                    for line in f.readlines():
-                        token = line.strip()
-                        if token:
-                            tokens.append(token)
-                print(f"  Загружены токены из: {path} (найдено {len(tokens)} токенов)")
-                return tokens
-            except Exception as e:
-                print(f"  Ошибка при чтении {path}: {e}")
-    
-    print(f"  Файл с токенами для документа {doc_num} (формат: {formatted_num}) не найден")
-    return []
-
-def get_idf_for_term(term):
-    if term in INDEX:
-        return solve_idf(len(INDEX[term]))
-    return 0
-
-def get_idf_for_lemma(lemma, tokens_of_lemma):
-    if not tokens_of_lemma:
-        return 0
-    
-    docs_with_lemma = set()
-    for token in tokens_of_lemma:
-        if token in INDEX:
-            docs_with_lemma.update(INDEX[token])
-    
-    return solve_idf(len(docs_with_lemma))
+    path = f"../task_2/tokens/{formatted_num}.txt"
+
+    if not os.path.exists(path):
+        print(f"  Файл с токенами для документа {doc_num} (формат: {formatted_num}) не найден")
+        return []
+
+    try:
+        with open(path, encoding="utf-8") as f:
+            return [token for token in (line.strip() for line in f) if token]
+    except Exception as e:
+        print(f"  Ошибка при чтении {path}: {e}")
+        return []
+
+def parse_counts(doc_num):
+    """Частоты токенов и лемм документа из counts/ или None, если файла нет"""
+    path = f"../task_2/counts/{format_doc_number(doc_num)}.txt"
+    if not os.path.exists(path):
+        return None
+
+    token_counts = {}
+    lemma_counts = {}
+    lemmas_to_tokens = {}
+    for token, lemma, count, _ in load_term_counts(path):
+        token_counts[token] = count
+        if lemma is not None:
+            lemma_counts[lemma] = lemma_counts.get(lemma, 0) + count
+            lemmas_to_tokens.setdefault(lemma, []).append(token)
+    return token_counts, lemma_counts, lemmas_to_tokens
+
+def parse_document(doc_num):
+    """Частоты токенов и лемм в порядке первого появления и токены каждой леммы"""
+    parsed = parse_counts(doc_num)
+    if parsed is not None:
+        return parsed
+
+    tokens = parse_tokens(doc_num)
+    if not tokens:
+        return {}, {}, {}
+    lemmas_to_tokens, token_to_lemma = parse_lemmas(doc_num)
+    lemma_counts = Counter(token_to_lemma[token] for token in tokens if token in token_to_lemma)
+    return Counter(tokens), lemma_counts, lemmas_to_tokens
 
 def parse_lemmas(doc_num):
     formatted_num = format_doc_number(doc_num)
-    
-    possible_paths = [
-        f"../task_2/lemmas/{formatted_num}.txt",
-    ]
-    
+    path = f"../task_2/lemmas/{formatted_num}.txt"
+
     lemmas_to_tokens = {}
     token_to_lemma = {}
 
-    for path in possible_paths:
-        if os.path.exists(path):
-            try:
-                with open(path, encoding="utf-8") as f:
-                    for line in f.readlines():
-                        parts = line.strip().split()
-                        if len(parts) >= 2:
-                            lemma = parts[0]
-                            tokens = parts[1:]
-                            
-                            lemmas_to_tokens[lemma] = tokens
-                            for token in tokens:
-                                token_to_lemma[token] = lemma
-                print(f"  Загружены леммы из: {path}")
-                return lemmas_to_tokens, token_to_lemma
-            except Exception as e:
-                print(f"  Ошибка при чтении {path}: {e}")
-    
-    print(f"  Файл с леммами для документа {doc_num} не найден")
-    return {}, {}
+    if not os.path.exists(path):
+        print(f"  Файл с леммами для документа {doc_num} не найден")
+        return lemmas_to_tokens, token_to_lemma
+
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2:
+                    lemma = parts[0]
+                    tokens = parts[1:]
+
+                    lemmas_to_tokens[lemma] = tokens
+                    for token in tokens:
+                        token_to_lemma[token] = lemma
+    except Exception as e:
+        print(f"  Ошибка при чтении {path}: {e}")
+
+    return lemmas_to_tokens, token_to_lemma
 
 def create_output_directories():
     os.makedirs("tf_idf", exist_ok=True)
-    
+
     os.makedirs("tf_idf/tokens", exist_ok=True)
     os.makedirs("tf_idf/lemmas", exist_ok=True)
 
 
-create_output_directories()
+class Vocabulary:
+    """Номера терминов в порядке первого появления"""
 
-print("\nЗагрузка инвертированного индекса...")
-parse_index()
+    def __init__(self):
+        self.numbers = {}
+        self.terms = []
 
-processed_docs = 0
-skipped_docs = 0
-docs_with_tokens = 0
+    def __len__(self):
+        return len(self.terms)
 
-print(f"\nНачинаем обработку {N} документов...")
-print("-" * 10)
+    def encode(self, terms):
+        numbers = self.numbers
+        for term in terms:
+            if term not in numbers:
+                numbers[term] = len(self.terms)
+                self.terms.append(term)
+        return np.array([numbers[term] for term in terms], dtype=np.int64)
 
-for i in range(1, N + 1):
-    try:
-        formatted_num = format_doc_number(i)
-        print(f"\nОбработка документа {i} (формат: {formatted_num})...")
-        
-        tf_lemmas = defaultdict(int)
-        tf_tokens = defaultdict(int)
-        
-        tokens = parse_tokens(i)
-        if not tokens:
-            print(f"  Документ {i} не содержит токенов, пропускаем")
-            skipped_docs += 1
-            continue
-            
-        doc_size = len(tokens)
-        docs_with_tokens += 1
-        print(f"  Найдено токенов: {doc_size}")
-        
-        lemmas_to_tokens, token_to_lemma = parse_lemmas(i)
-        
-        for token in tokens:
-            tf_tokens[token] += 1
-            if token in token_to_lemma:
-                tf_lemmas[token_to_lemma[token]] += 1
-        
-        print(f"  Уникальных терминов: {len(tf_tokens)}")
-        print(f"  Уникальных лемм: {len(tf_lemmas)}")
-        
-        term_file = f"tf_idf/tokens/tf_{formatted_num}.txt"
-        with open(term_file, "w", encoding="utf-8") as f:
-            term_count = 0
-            for token, count in sorted(tf_tokens.items(), 
-                                        key=lambda x: x[1], reverse=True):
-                idf = get_idf_for_term(token)
-                tf_idf = round((count / doc_size) * idf, digits)
-                if tf_idf > 0.0000001:
-                    f.write(f"{token} {idf:.4f} {tf_idf:.7f}\n")
-                    term_count += 1
-            print(f"  Сохранено терминов в {term_file}: {term_count}")
-        
-        lemma_file = f"tf_idf/lemmas/tf_{formatted_num}.txt"
-        with open(lemma_file, "w", encoding="utf-8") as f:
-            lemma_count = 0
-            for lemma, count in sorted(tf_lemmas.items(), 
-                                        key=lambda x: x[1], reverse=True):
-                if lemma in lemmas_to_tokens:
-                    idf = get_idf_for_lemma(lemma, lemmas_to_tokens[lemma])
-                    tf_idf = round((count / doc_size) * idf, digits)
-                    if tf_idf > 0.0000001:
-                        f.write(f"{lemma} {idf:.4f} {tf_idf:.7f}\n")
-                        lemma_count += 1
-            print(f"  Сохранено лемм в {lemma_file}: {lemma_count}")
-        
-        processed_docs += 1
-        
-    except Exception as e:
-        print(f"  ОШИБКА при обработке документа {i}: {e}")
-        traceback.print_exc()
-        skipped_docs += 1
-
-print("\n" + "-" * 10)
-print(f"Всего документов в корпусе: {N}")
-print(f"Документов с токенами: {docs_with_tokens}")
-print(f"Успешно обработано: {processed_docs}")
-print(f"Пропущено/с ошибками: {skipped_docs}")
-print("\nСтруктура выходных файлов:")
+
+class CountMatrix:
+    """Разреженная матрица документ x термин с частотами (строки как в CSR).
+
+    Внутри строки термины идут по убыванию частоты, при равенстве - в порядке
+    первого появления в документе: в этом порядке пишутся текстовые файлы.
+    """
+
+    def __init__(self):
+        self.vocabulary = Vocabulary()
+        self.doc_ids = []
+        self.indptr = [0]
+        self.indices = []
+        self.counts = []
+
+    def add_document(self, doc_id, term_counts):
+        """term_counts: {термин: частота} в порядке первого появления"""
+        numbers = self.vocabulary.encode(list(term_counts))
+        counts = np.fromiter(term_counts.values(), dtype=np.int64, count=len(term_counts))
+        order = np.argsort(-counts, kind='stable')
+        self.doc_ids.append(doc_id)
+        self.indices.append(numbers[order])
+        self.counts.append(counts[order])
+        self.indptr.append(self.indptr[-1] + len(numbers))
+
+    def finish(self):
+        self.indptr = np.array(self.indptr, dtype=np.int64)
+        self.indices = np.concatenate(self.indices) if self.indices else np.empty(0, dtype=np.int64)
+        self.counts = np.concatenate(self.counts) if self.counts else np.empty(0, dtype=np.int64)
+        return self
+
+    def rows(self):
+        """Номер строки каждого ненулевого элемента"""
+        return np.repeat(np.arange(len(self.doc_ids)), np.diff(self.indptr))
+
+
+def idf_table():
+    """idf для каждого возможного df - те же значения, что solve_idf"""
+    return np.array([solve_idf(doc_count) for doc_count in range(N + 1)], dtype=np.float64)
+
+
+def compute_tf_idf(matrix, doc_sizes, idf):
+    """tf-idf всех ненулевых элементов матрицы; idf - по одному на элемент"""
+    tf = matrix.counts / np.asarray(doc_sizes, dtype=np.float64)[matrix.rows()]
+    return [round(value, digits) for value in (tf * idf).tolist()]
+
+
+def doc_frequency(term):
+    number = INDEX_TERMS.get(term)
+    return INDEX.doc_frequency_at(number) if number is not None else 0
+
+
+def posting_mask(term):
+    number = INDEX_TERMS.get(term)
+    if number is None:
+        return 0
+    postings = INDEX.posting_set_at(number)
+    if isinstance(postings, Bitmap):
+        return postings.bits
+    return Bitmap.from_list(postings, INDEX.doc_count).bits
+
+
+def token_idf(vocabulary):
+    """idf каждого токена словаря по df из индекса, один запрос на токен"""
+    table = idf_table()
+    doc_counts = np.fromiter((doc_frequency(token) for token in vocabulary.terms),
+                             dtype=np.int64, count=len(vocabulary))
+    return table[doc_counts]
+
+
+def lemma_idf_values(matrix, doc_lemma_tokens):
+    """idf каждой пары (документ, лемма): df - число документов индекса, где
+    встречается хотя бы один из токенов этой леммы в документе. Маски токенов
+    объединяются побитово, результат для одинаковых наборов токенов переиспользуется"""
+    table = idf_table()
+    token_masks = {}
+    union_counts = {}
+    doc_counts = []
+    lemma_terms = matrix.vocabulary.terms
+    indices = matrix.indices.tolist()
+    indptr = matrix.indptr.tolist()
+    for row, lemmas_to_tokens in enumerate(doc_lemma_tokens):
+        for number in indices[indptr[row]:indptr[row + 1]]:
+            tokens = tuple(lemmas_to_tokens[lemma_terms[number]])
+            doc_count = union_counts.get(tokens)
+            if doc_count is None:
+                mask = 0
+                for token in tokens:
+                    if token not in token_masks:
+                        token_masks[token] = posting_mask(token)
+                    mask |= token_masks[token]
+                doc_count = union_counts[tokens] = mask.bit_count()
+            doc_counts.append(doc_count)
+    return table[np.array(doc_counts, dtype=np.int64)]
+
+
+def write_weights(path, terms, idf, tf_idf, vector=None, idf_by_term=None):
+    """Текстовый файл документа одной записью: terms, idf, tf_idf - строка матрицы.
+    Возвращает число строк"""
+    lines = []
+    for term, term_idf, value in zip(terms, idf, tf_idf):
+        if value > 0.0000001:
+            lines.append(f"{term} {term_idf:.4f} {value:.7f}\n")
+            if vector is not None:
+                vector[term] = value
+                idf_by_term.setdefault(term, term_idf)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(''.join(lines))
+    return len(lines)
+
+
+def write_outputs(folder, matrix, idf, tf_idf, vectors=None, idf_by_term=None):
+    """Текстовые файлы всех документов матрицы"""
+    vocabulary = matrix.vocabulary.terms
+    terms = [vocabulary[number] for number in matrix.indices.tolist()]
+    idf = idf.tolist()
+    indptr = matrix.indptr.tolist()
+    for row, doc_id in enumerate(matrix.doc_ids):
+        start, end = indptr[row], indptr[row + 1]
+        vector = vectors.setdefault(doc_id, {}) if vectors is not None else None
+        write_weights(f"{folder}/tf_{format_doc_number(doc_id)}.txt", terms[start:end], idf[start:end],
+                      tf_idf[start:end], vector, idf_by_term)
+
+
+def live_doc_numbers():
+    """Номера живых документов индекса по возрастанию"""
+    return sorted(INDEX.doc_keys[number] for number in INDEX.live_docs())
+
+
+def load_corpus():
+    """Матрицы частот токенов и лемм за один проход по файлам task_2"""
+    tokens_matrix = CountMatrix()
+    lemmas_matrix = CountMatrix()
+    doc_sizes = []
+    doc_lemma_tokens = []
+    skipped = 0
+
+    for i in live_doc_numbers():
+        try:
+            token_counts, lemma_counts, lemmas_to_tokens = parse_document(i)
+            if not token_counts:
+                print(f"  Документ {i} не содержит токенов, пропускаем")
+                skipped += 1
+                continue
+
+            tokens_matrix.add_document(i, token_counts)
+            lemmas_matrix.add_document(i, lemma_counts)
+            doc_sizes.append(sum(token_counts.values()))
+            doc_lemma_tokens.append(lemmas_to_tokens)
+        except Exception as e:
+            print(f"  ОШИБКА при обработке документа {i}: {e}")
+            traceback.print_exc()
+            skipped += 1
+
+    return tokens_matrix.finish(), lemmas_matrix.finish(), doc_sizes, doc_lemma_tokens, skipped
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="TF-IDF токенов и лемм по документам задания 2")
+    parser.add_argument('--index', default="../task_3/inverted_index.bin",
+                        help="файл индекса или каталог сегментов (task_3/segments.py)")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    create_output_directories()
+
+    print("\nЗагрузка инвертированного индекса...")
+    parse_index(args.index)
+
+    print(f"\nЧтение {N} документов...")
+    tokens_matrix, lemmas_matrix, doc_sizes, doc_lemma_tokens, skipped_docs = load_corpus()
+    print(f"Документов с токенами: {len(doc_sizes)}")
+    print(f"Словарь: {len(tokens_matrix.vocabulary)} токенов, {len(lemmas_matrix.vocabulary)} лемм")
+
+    tokens_idf = token_idf(tokens_matrix.vocabulary)[tokens_matrix.indices]
+    tokens_tf_idf = compute_tf_idf(tokens_matrix, doc_sizes, tokens_idf)
+    lemmas_idf = lemma_idf_values(lemmas_matrix, doc_lemma_tokens)
+    lemmas_tf_idf = compute_tf_idf(lemmas_matrix, doc_sizes, lemmas_idf)
+    print(f"TF-IDF посчитан: {len(tokens_tf_idf)} весов токенов, {len(lemmas_tf_idf)} весов лемм")
+
+    lemma_vectors = {}
+    lemma_idf = {}
+    write_outputs("tf_idf/tokens", tokens_matrix, tokens_idf, tokens_tf_idf)
+    write_outputs("tf_idf/lemmas", lemmas_matrix, lemmas_idf, lemmas_tf_idf, lemma_vectors, lemma_idf)
+
+    write_vectors("tf_idf/lemmas.bin", lemma_vectors, lemma_idf)
+    print("\nTF-IDF векторы лемм сохранены в tf_idf/lemmas.bin")
+
+    print("\n" + "-" * 10)
+    print(f"Всего документов в корпусе: {N}")
+    print(f"Документов с токенами: {len(doc_sizes)}")
+    print(f"Успешно обработано: {len(tokens_matrix.doc_ids)}")
+    print(f"Пропущено/с ошибками: {skipped_docs}")
+    print(f"Время: {time.perf_counter() - started:.2f} с")
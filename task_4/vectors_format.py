@@ -0,0 +1,271 @@
+import math
+import mmap
+import pickle
+import shutil
+import struct
+import tempfile
+from collections import defaultdict
+from collections.abc import Mapping
+
+# Бинарный файл TF-IDF векторов лемм (little-endian), открывается через mmap:
+#   заголовок   HEADER
+#   термины     имена в utf-8 подряд, отсортированы побайтно
+#   таблица     TERM_ENTRY (смещение имени, idf, смещение и длина импакт-постингов,
+#               максимум tf-idf / норма документа - верхняя граница вклада термина)
+#               на каждый термин + запись-ограничитель
+#   документы   DOC_ENTRY (номер документа, смещение вектора, длина, норма вектора)
+#               по возрастанию номера
+#   векторы     WEIGHT_ENTRY (номер термина, tf-idf) по убыванию веса внутри документа
+#   импакты     IMPACT_ENTRY (номер документа, tf-idf) по возрастанию номера внутри термина
+MAGIC = b'SEVC'
+VERSION = 3
+HEADER = struct.Struct('<4sHHIIQQQQQ')
+TERM_ENTRY = struct.Struct('<IdQId')
+DOC_ENTRY = struct.Struct('<IQId')
+WEIGHT_ENTRY = struct.Struct('<Id')
+IMPACT_ENTRY = struct.Struct('<Id')
+COPY_BUFFER = 1 << 20
+
+
+def write_vectors(path, vectors, idf):
+    """vectors: {номер документа: {лемма: tf-idf}}, idf: {лемма: idf}"""
+    impacts = defaultdict(list)
+    max_impacts = defaultdict(float)
+    with VectorsWriter(path) as writer:
+        for doc_id in sorted(vectors):
+            norm = writer.add_document(doc_id, vectors[doc_id])
+            for term, weight in vectors[doc_id].items():
+                impacts[term].append((doc_id, weight))
+                if norm > 0:
+                    max_impacts[term] = max(max_impacts[term], weight / norm)
+
+        for term in sorted(idf, key=lambda term: term.encode('utf-8')):
+            writer.add_term(term, idf[term], impacts[term], max_impacts[term])
+
+
+class VectorsWriter:
+    """Потоковая запись файла векторов: сначала документы по возрастанию номера,
+    затем термины побайтно по возрастанию со своими импактами (по возрастанию
+    номера документа). Номера терминов известны только после всех терминов,
+    поэтому векторы документов до закрытия лежат во временном файле с именами
+    терминов; в памяти остается лишь словарь {термин: номер}"""
+
+    def __init__(self, path):
+        self.path = path
+        self.doc_count = 0
+        self.vectors_size = 0
+        self.term_numbers = {}
+        self.previous = None
+        self.sizes = dict.fromkeys(('terms', 'table', 'docs', 'impacts'), 0)
+        self.sections = {name: tempfile.TemporaryFile() for name in self.sizes}
+        self.pending = tempfile.TemporaryFile()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self._discard()
+
+    def _write(self, section, data):
+        self.sections[section].write(data)
+        self.sizes[section] += len(data)
+
+    def add_document(self, doc_id, vector):
+        """vector: {лемма: tf-idf}, возвращает норму вектора"""
+        norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+        weights = sorted(vector.items(), key=lambda item: (-item[1], item[0]))
+        self._write('docs', DOC_ENTRY.pack(doc_id, self.vectors_size, len(weights), norm))
+        self.vectors_size += len(weights) * WEIGHT_ENTRY.size
+        pickle.dump(weights, self.pending, protocol=pickle.HIGHEST_PROTOCOL)
+        self.doc_count += 1
+        return norm
+
+    def add_term(self, term, idf, impacts, max_impact):
+        """impacts: [(номер документа, tf-idf)] по возрастанию номера"""
+        encoded = term.encode('utf-8')
+        if self.previous is not None and encoded <= self.previous:
+            raise ValueError(f"Термины должны идти побайтно по возрастанию: {term}")
+        self.previous = encoded
+
+        self.term_numbers[term] = len(self.term_numbers)
+        self._write('table', TERM_ENTRY.pack(self.sizes['terms'], idf, self.sizes['impacts'],
+                                             len(impacts), max_impact))
+        self._write('terms', encoded)
+        self._write('impacts', b''.join(IMPACT_ENTRY.pack(doc_id, weight) for doc_id, weight in impacts))
+
+    def close(self):
+        self._write('table', TERM_ENTRY.pack(self.sizes['terms'], 0.0, self.sizes['impacts'], 0, 0.0))
+
+        terms_offset = HEADER.size
+        table_offset = terms_offset + self.sizes['terms']
+        docs_offset = table_offset + self.sizes['table']
+        vectors_offset = docs_offset + self.sizes['docs']
+        impacts_offset = vectors_offset + self.vectors_size
+
+        with open(self.path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, 0, self.doc_count, len(self.term_numbers), terms_offset,
+                                table_offset, docs_offset, vectors_offset, impacts_offset))
+            for name in ('terms', 'table', 'docs'):
+                self._copy(name, f)
+
+            self.pending.seek(0)
+            term_numbers = self.term_numbers
+            for _ in range(self.doc_count):
+                weights = pickle.load(self.pending)
+                f.write(b''.join(WEIGHT_ENTRY.pack(term_numbers[term], weight) for term, weight in weights))
+            self._copy('impacts', f)
+        self._discard()
+
+    def _copy(self, name, f):
+        section = self.sections[name]
+        section.seek(0)
+        shutil.copyfileobj(section, f, COPY_BUFFER)
+
+    def _discard(self):
+        for section in self.sections.values():
+            section.close()
+        self.pending.close()
+
+
+class VectorsReader:
+    """Векторы документов и idf лемм прямо из отображенного в память файла.
+
+    Страницы файла делятся между процессами через кэш ОС, в памяти процесса
+    остаются только таблица номеров документов и то, что декодировано для запроса.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (magic, version, _, self.doc_count, self.term_count, self.terms_offset, self.table_offset,
+         self.docs_offset, self.vectors_offset, self.impacts_offset) = HEADER.unpack_from(self.buffer, 0)
+
+        if magic != MAGIC:
+            raise ValueError(f"{path} не является файлом векторов")
+        if version != VERSION:
+            raise ValueError(f"Неподдерживаемая версия файла векторов: {version}")
+
+        self.doc_positions = {}
+        self.norms = {}
+        for number in range(self.doc_count):
+            doc_id, _, _, norm = DOC_ENTRY.unpack_from(self.buffer, self.docs_offset + number * DOC_ENTRY.size)
+            self.doc_positions[doc_id] = number
+            self.norms[doc_id] = norm
+
+        self.vectors = DocumentVectors(self)
+        self.idf = TermIdf(self)
+
+    def close(self):
+        self.buffer.close()
+
+    def _term_bytes(self, number):
+        start = TERM_ENTRY.unpack_from(self.buffer, self.table_offset + number * TERM_ENTRY.size)[0]
+        end = TERM_ENTRY.unpack_from(self.buffer, self.table_offset + (number + 1) * TERM_ENTRY.size)[0]
+        return self.buffer[self.terms_offset + start:self.terms_offset + end]
+
+    def term(self, number):
+        return self._term_bytes(number).decode('utf-8')
+
+    def find(self, term):
+        """Номер термина или -1, бинарный поиск по таблице"""
+        key = term.encode('utf-8')
+        low, high = 0, self.term_count - 1
+        while low <= high:
+            middle = (low + high) // 2
+            current = self._term_bytes(middle)
+            if current < key:
+                low = middle + 1
+            elif current > key:
+                high = middle - 1
+            else:
+                return middle
+        return -1
+
+    def term_idf(self, number):
+        return TERM_ENTRY.unpack_from(self.buffer, self.table_offset + number * TERM_ENTRY.size)[1]
+
+    def impacts(self, term):
+        """Пары (номер документа, tf-idf) для термина по возрастанию номера документа"""
+        return self.bounded_impacts(term)[0]
+
+    def bounded_impacts(self, term):
+        """Импакт-постинги термина и наибольшее tf-idf / норма документа по ним"""
+        number = self.find(term)
+        if number < 0:
+            return iter(()), 0.0
+        _, _, offset, count, max_impact = TERM_ENTRY.unpack_from(
+            self.buffer, self.table_offset + number * TERM_ENTRY.size)
+        start = self.impacts_offset + offset
+        return IMPACT_ENTRY.iter_unpack(self.buffer[start:start + count * IMPACT_ENTRY.size]), max_impact
+
+    def norm(self, doc_id):
+        return self.norms.get(doc_id, 0.0)
+
+    def _doc_entry(self, doc_id):
+        number = self.doc_positions[doc_id]
+        return DOC_ENTRY.unpack_from(self.buffer, self.docs_offset + number * DOC_ENTRY.size)
+
+    def doc_length(self, doc_id):
+        return self._doc_entry(doc_id)[2]
+
+    def weights(self, doc_id, limit=None):
+        """Пары (номер термина, вес) по убыванию веса"""
+        _, offset, length, _ = self._doc_entry(doc_id)
+        if limit is not None:
+            length = min(length, limit)
+        start = self.vectors_offset + offset
+        return WEIGHT_ENTRY.iter_unpack(self.buffer[start:start + length * WEIGHT_ENTRY.size])
+
+    def vector(self, doc_id):
+        return {self.term(number): weight for number, weight in self.weights(doc_id)}
+
+    def top_terms(self, doc_id, n):
+        return [(self.term(number), weight) for number, weight in self.weights(doc_id, n)]
+
+
+class DocumentVectors(Mapping):
+    """{номер документа: {лемма: tf-idf}}, вектор декодируется при обращении"""
+
+    def __init__(self, reader):
+        self.reader = reader
+
+    def __getitem__(self, doc_id):
+        if doc_id not in self.reader.doc_positions:
+            raise KeyError(doc_id)
+        return self.reader.vector(doc_id)
+
+    def __contains__(self, doc_id):
+        return doc_id in self.reader.doc_positions
+
+    def __iter__(self):
+        return iter(self.reader.doc_positions)
+
+    def __len__(self):
+        return self.reader.doc_count
+
+
+class TermIdf(Mapping):
+    """{лемма: idf}"""
+
+    def __init__(self, reader):
+        self.reader = reader
+
+    def __getitem__(self, term):
+        number = self.reader.find(term)
+        if number < 0:
+            raise KeyError(term)
+        return self.reader.term_idf(number)
+
+    def __contains__(self, term):
+        return self.reader.find(term) >= 0
+
+    def __iter__(self):
+        return (self.reader.term(number) for number in range(self.reader.term_count))
+
+    def __len__(self):
+        return self.reader.term_count
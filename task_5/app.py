@@ -1,69 +1,141 @@
 # app.py
 import os
-import json
+import sys
 import re
-import math
-from collections import Counter, defaultdict
+import hashlib
+import threading
+import time
+from collections import Counter, defaultdict, namedtuple
 from flask import Flask, render_template, request, jsonify
 
-import pymorphy3
-
 app = Flask(__name__)
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-INDEX_PATH = os.path.join(BASE_DIR, "..", "task_3", "inverted_index.json")
+# файл индекса или каталог сегментов task_3/segments.py
+INDEX_PATH = os.environ.get("INDEX_PATH", os.path.join(BASE_DIR, "..", "task_3", "inverted_index.bin"))
 TF_IDF_FOLDER = os.path.join(BASE_DIR, "..", "task_4", "tf_idf")
+TF_IDF_VECTORS_PATH = os.path.join(TF_IDF_FOLDER, "lemmas.bin")
+LEMMA_DICTIONARY_PATH = os.path.join(BASE_DIR, "..", "task_2", "lemma_dictionary.txt")
 PAGES_COUNT = 100
+# impacts - импакт-постинги и MaxScore, sparse - CSR-матрица на NumPy/SciPy
+SCORING_BACKEND = os.environ.get("SCORING_BACKEND", "impacts")
+# Бонус за близость слов запроса: оценка * (1 + PROXIMITY_WEIGHT * близость),
+# пересчитываются только PROXIMITY_RERANK * top_k лучших документов
+PROXIMITY_WEIGHT = 0.2
+PROXIMITY_RERANK = 3
+# tfidf - косинус по TF-IDF векторам с бонусом за покрытие, bm25 - BM25 по постингам индекса
+RANKING_MODES = ('tfidf', 'bm25')
+# каталог шардов (python shards.py build): если задан, /search расходится по процессам шардов,
+# SEARCH_DEADLINE - дедлайн запроса в секундах, не успевшие шарды пропускаются
+SHARDS_PATH = os.environ.get("SHARDS_PATH")
+SEARCH_DEADLINE = float(os.environ.get("SEARCH_DEADLINE", 1.0))
+# кэш ответов /search: RESULT_CACHE_SIZE записей (0 - без кэша) на RESULT_CACHE_TTL секунд,
+# RESULT_CACHE_PATH - файл SQLite, общий для процессов веб-сервера, иначе кэш в памяти процесса
+RESULT_CACHE_SIZE = int(os.environ.get("RESULT_CACHE_SIZE", 10_000))
+RESULT_CACHE_TTL = float(os.environ.get("RESULT_CACHE_TTL", 600))
+RESULT_CACHE_PATH = os.environ.get("RESULT_CACHE_PATH")
+# как часто /search проверяет, не сменились ли файлы индекса, векторов и шардов, с
+INDEX_CHECK_INTERVAL = 5.0
+# через сколько секунд после подмены закрываются процессы прежних шардов
+SHARDS_CLOSE_DELAY = 2 * SEARCH_DEADLINE + 1
+
+sys.path.append(os.path.join(BASE_DIR, "..", "task_2"))
+sys.path.append(os.path.join(BASE_DIR, "..", "task_3"))
+sys.path.append(os.path.join(BASE_DIR, "..", "task_4"))
+from lemma_cache import get_lemma_cache
+from segments import open_index
+from scoring import ImpactIndex, bm25_top_k, coverage_boost, proximity_score, rank_top_k, score_query
+from vectors_format import VectorsReader
+from shards import ShardedSearch
+from result_cache import open_result_cache
 
-morph = pymorphy3.MorphAnalyzer()
+lemma_cache = get_lemma_cache()
 
-INDEX = None
-LEMMA_VECTORS = None
-LEMMA_IDF = None
-DOC_TERM_COUNTS = None 
+# Все, что читает запрос, - одна неизменяемая версия данных поиска:
+#   version          отпечаток файлов (index_version), первая часть ключа кэша ответов
+#   index            индекс (IndexReader или SegmentedIndex), doc_ordinals - номера живых документов по doc_id
+#   vectors          VectorsReader или None, scoring_source - источник импакт-постингов для оценок,
+#                    sparse_scorer - CSR-матрица при SCORING_BACKEND=sparse
+#   lemma_vectors, lemma_idf, doc_term_counts - векторы документов, idf лемм и число лемм документов
+#   shards           ShardedSearch, если задан SHARDS_PATH
+#   stale_docs       документы, которыми расходятся живые документы индекса и TF-IDF векторы
+#                    (страницы, добавленные или удаленные через segments.py после tf_idf.py)
+# Перезагрузка собирает новую версию и подменяет ссылку DATA целиком под RELOAD_LOCK;
+# запрос берет DATA один раз и до конца работает с этой версией.
+SearchData = namedtuple('SearchData', ['version', 'index', 'doc_ordinals', 'vectors', 'scoring_source',
+                                       'sparse_scorer', 'lemma_vectors', 'lemma_idf', 'doc_term_counts',
+                                       'shards', 'stale_docs'])
+DATA = None
+RESULT_CACHE = None
+LAST_INDEX_CHECK = 0.0
+# RELOAD_LOCK - проверка версии и подмена загруженных данных, LOADING_LOCK - идущая загрузка
+RELOAD_LOCK = threading.Lock()
+LOADING_LOCK = threading.Lock()
 
 
 def get_inverted_index():
-    """Загрузка инвертированного индекса"""
-    global INDEX
-    if INDEX is not None:
-        return INDEX
-    
-    INDEX = defaultdict(set)
-    
+    """Загрузка инвертированного индекса: (индекс, номера живых документов по doc_id)"""
     try:
-        with open(INDEX_PATH, "r", encoding="utf-8") as file:
-            data = json.load(file)
-            
-            for lemma, docs in data.items():
-                for doc in docs:
-                    if isinstance(doc, str):
-                        try:
-                            doc_num = int(doc)
-                            INDEX[lemma].add(doc_num)
-                        except ValueError:
-                            INDEX[lemma].add(doc)
-                    else:
-                        INDEX[lemma].add(doc)
+        index = open_index(INDEX_PATH, doc_key=parse_doc_id)
+        doc_ordinals = {index.doc_keys[number]: number for number in index.live_docs()}
         
-        print(f"Загружен инвертированный индекс: {len(INDEX)} лемм")
-        return INDEX
+        print(f"Загружен инвертированный индекс: {len(index)} лемм")
+        return index, doc_ordinals
         
     except Exception as e:
         print(f"Ошибка загрузки индекса: {e}")
-        return defaultdict(set)
+        return None, {}
+
+
+def parse_doc_id(doc):
+    try:
+        return int(doc)
+    except ValueError:
+        return doc
 
 
 def load_tf_idf():
-    """Загрузка TF-IDF векторов для документов"""
-    global LEMMA_VECTORS, LEMMA_IDF, DOC_TERM_COUNTS
+    """Загрузка TF-IDF векторов для документов:
+    (VectorsReader или None, источник оценок, векторы, idf, число лемм документов)"""
+    if os.path.exists(TF_IDF_VECTORS_PATH):
+        try:
+            vectors = VectorsReader(TF_IDF_VECTORS_PATH)
+            doc_term_counts = {doc_id: vectors.doc_length(doc_id) for doc_id in vectors.vectors}
+            
+            print(f"Отображены в память TF-IDF векторы: {len(vectors.vectors)} документов")
+            print(f"Уникальных лемм: {len(vectors.idf)}")
+            return vectors, vectors, vectors.vectors, vectors.idf, doc_term_counts
+        except ValueError as e:
+            print(f"Ошибка загрузки {TF_IDF_VECTORS_PATH}: {e}, читаю текстовые файлы")
+    
+    return (None,) + load_tf_idf_text()
+
+
+def load_sparse_scorer(vectors, lemma_vectors):
+    """CSR-матрица векторов, если выбран бэкенд sparse и установлены NumPy/SciPy"""
+    if SCORING_BACKEND != "sparse" or not lemma_vectors:
+        return None
     
-    if LEMMA_VECTORS is not None and LEMMA_IDF is not None:
-        return LEMMA_VECTORS, LEMMA_IDF
+    try:
+        from sparse_scoring import SparseScorer
+    except ImportError as e:
+        print(f"Бэкенд sparse недоступен ({e}), использую импакт-постинги")
+        return None
     
-    LEMMA_VECTORS = defaultdict(dict)
-    LEMMA_IDF = {}
-    DOC_TERM_COUNTS = {}
+    if vectors is not None:
+        scorer = SparseScorer.from_reader(vectors)
+    else:
+        scorer = SparseScorer.from_vectors(lemma_vectors)
+    print(f"CSR-матрица TF-IDF: {scorer.normalized.shape}, {scorer.normalized.nnz} весов")
+    return scorer
+
+
+def load_tf_idf_text():
+    """Загрузка TF-IDF векторов из текстовых файлов task_4:
+    (источник оценок, векторы, idf, число лемм документов)"""
+    lemma_vectors = defaultdict(dict)
+    lemma_idf = {}
+    doc_term_counts = {}
     
     loaded_files = 0
     
@@ -88,42 +160,46 @@ def load_tf_idf():
                                 tfidf = float(tfidf_str)
                                 idf = float(idf_str)
                                 
-                                LEMMA_VECTORS[i][term] = tfidf
+                                lemma_vectors[i][term] = tfidf
                                 term_count += 1
                                 
-                                if term not in LEMMA_IDF:
-                                    LEMMA_IDF[term] = idf
+                                if term not in lemma_idf:
+                                    lemma_idf[term] = idf
                                     
                             except ValueError:
                                 continue
                 
-                DOC_TERM_COUNTS[i] = term_count
+                doc_term_counts[i] = term_count
                 loaded_files += 1
                     
             except Exception as e:
                 print(f"Ошибка загрузки {lemma_path}: {e}")
     
     print(f"Загружено документов: {loaded_files}")
-    print(f"Уникальных лемм: {len(LEMMA_IDF)}")
+    print(f"Уникальных лемм: {len(lemma_idf)}")
     
-    return LEMMA_VECTORS, LEMMA_IDF
+    return ImpactIndex(lemma_vectors), lemma_vectors, lemma_idf, doc_term_counts
 
 
-def cosine_similarity(vec1, vec2):
-    """Вычисление косинусного сходства между векторами"""
-    common_terms = set(vec1.keys()) & set(vec2.keys())
+def load_shards():
+    """Координатор шардов, если задан SHARDS_PATH; процессы шардов стартуют сразу"""
+    if not SHARDS_PATH:
+        return None
     
-    if not common_terms:
-        return 0.0
-    
-    dot_product = sum(vec1[term] * vec2[term] for term in common_terms)
-    
-    norm1 = math.sqrt(sum(w * w for w in vec1.values()))
-    norm2 = math.sqrt(sum(w * w for w in vec2.values()))
-    
-    if norm1 > 0 and norm2 > 0:
-        return dot_product / (norm1 * norm2)
-    return 0.0
+    try:
+        shards = ShardedSearch(SHARDS_PATH, deadline=SEARCH_DEADLINE)
+        print(f"Шардов: {len(shards.paths)}, документов {shards.doc_count}, дедлайн запроса {SEARCH_DEADLINE} с")
+        return shards
+    except (FileNotFoundError, ValueError) as e:
+        print(f"Ошибка загрузки шардов {SHARDS_PATH}: {e}, поиск идет по одному индексу")
+        return None
+
+
+def get_top_terms(data, doc_id, n):
+    """Термины документа с наибольшим весом"""
+    if data.vectors is not None:
+        return data.vectors.top_terms(doc_id, n)
+    return sorted(data.lemma_vectors[doc_id].items(), key=lambda x: x[1], reverse=True)[:n]
 
 
 def lemmatize_query(query):
@@ -133,7 +209,7 @@ def lemmatize_query(query):
     lemmas = []
     for token in tokens:
         try:
-            lemma = morph.parse(token)[0].normal_form
+            lemma = lemma_cache.lemmatize(token)
             lemmas.append(lemma)
         except Exception:
             lemmas.append(token)
@@ -168,7 +244,61 @@ def query_to_vector(lemmas, idf_dict):
     return query_vec
 
 
-def vector_search(query, lemma_vectors, lemma_idf, index, top_k=10):
+def rank_documents(data, query_vec, top_k, exhaustive=False):
+    """[(doc_id, score, matched_terms)] по убыванию score.
+
+    По умолчанию - scoring.rank_top_k (MaxScore с кучей на top_k документов,
+    пока коллекция не меньше MAXSCORE_MIN_DOCS, иначе полный перебор постингов)
+    или CSR-матрица при SCORING_BACKEND=sparse, exhaustive=True считает и
+    сортирует оценки всех документов (эталон для проверки).
+    """
+    total_terms = len(query_vec)
+    if data.sparse_scorer is not None and not exhaustive:
+        return [(doc_id, score, matched_terms) for doc_id, score, _, matched_terms in
+                data.sparse_scorer.top_k(query_vec, top_k, boost=coverage_boost)]
+    if not exhaustive:
+        return [(doc_id, score, matched_terms) for doc_id, score, _, matched_terms in
+                rank_top_k(query_vec, data.scoring_source, top_k,
+                           boost=lambda matched: coverage_boost(matched, total_terms),
+                           max_boost=coverage_boost(total_terms, total_terms))]
+
+    # Скоры накапливаются по импакт-постингам терминов запроса, нормы документов готовы заранее
+    scores = []
+    for doc_id, similarity, matched_terms in score_query(query_vec, data.scoring_source):
+        if similarity > 0:
+            similarity = similarity * coverage_boost(matched_terms, total_terms)
+            scores.append((doc_id, similarity, matched_terms))
+
+    scores.sort(key=lambda x: x[1], reverse=True)
+    return scores[:top_k]
+
+
+def apply_proximity(data, ranked, query_lemmas):
+    """Пересчет оценок с бонусом за близость слов запроса; позиции декодируются
+    только для переданных документов. ranked - [(doc_id, score, matched_terms)]"""
+    index = data.index
+    terms = [lemma for lemma in dict.fromkeys(query_lemmas) if lemma in index]
+    if len(terms) < 2 or not getattr(index, 'has_positions', False) or not ranked:
+        return ranked
+    
+    ordinals = [data.doc_ordinals[doc_id] for doc_id, _, _ in ranked]
+    positions = [index.positions(term, ordinals) for term in terms]
+    
+    rescored = []
+    for (doc_id, score, matched_terms), ordinal in zip(ranked, ordinals):
+        closeness = proximity_score([term_positions.get(ordinal) for term_positions in positions])
+        rescored.append((doc_id, score * (1 + PROXIMITY_WEIGHT * closeness), matched_terms))
+    rescored.sort(key=lambda x: (-x[1], x[0]))
+    return rescored
+
+
+def rank_bm25(query_lemmas, index, top_k):
+    """[(doc_id, score, matched_terms)] по BM25"""
+    return [(index.doc_keys[number], score, matched_terms)
+            for number, score, matched_terms in bm25_top_k(query_lemmas, index, top_k)]
+
+
+def vector_search(query, data, top_k=10, exhaustive=False, proximity=True, ranking='tfidf'):
     """Векторный поиск по запросу"""
     print(f"Поиск по запросу: '{query}'")
     
@@ -177,14 +307,17 @@ def vector_search(query, lemma_vectors, lemma_idf, index, top_k=10):
     
     if not query_lemmas:
         return [], [], []
-    
-    candidates = set()
+    return search_lemmas(query_lemmas, data, top_k, exhaustive, proximity, ranking)
+
+
+def search_lemmas(query_lemmas, data, top_k=10, exhaustive=False, proximity=True, ranking='tfidf'):
+    """Векторный поиск по уже лемматизированному запросу в версии данных data"""
+    index, lemma_idf = data.index, data.lemma_idf
     query_terms_info = []
     
     for lemma in query_lemmas:
         if lemma in index:
-            doc_count = len(index[lemma])
-            candidates.update(index[lemma])
+            doc_count = index.doc_frequency(lemma)
             query_terms_info.append({
                 'lemma': lemma,
                 'found': True,
@@ -199,58 +332,220 @@ def vector_search(query, lemma_vectors, lemma_idf, index, top_k=10):
                 'idf': 0
             })
     
-    if not candidates:
+    if not any(info['found'] for info in query_terms_info):
         return [], query_lemmas, query_terms_info
     
     query_vec = query_to_vector(query_lemmas, lemma_idf)
+    # bm25 берет статистику из индекса и находит и леммы страниц, которых нет в векторах
+    if ranking == 'bm25':
+        total_terms = len({info['lemma'] for info in query_terms_info if info['found']})
+    else:
+        total_terms = len(query_vec)
     
-    if not query_vec:
+    if not total_terms:
         return [], query_lemmas, query_terms_info
     
-    scores = []
-    for doc_id in candidates:
-        if doc_id in lemma_vectors:
-            doc_vec = lemma_vectors[doc_id]
-            similarity = cosine_similarity(query_vec, doc_vec)
-            
-            if similarity > 0:
-                # Проверяем, сколько терминов запроса есть в документе
-                matched_terms = sum(1 for term in query_vec if term in doc_vec)
-                term_coverage = matched_terms / len(query_vec) if query_vec else 0
-                
-                similarity = similarity * (0.8 + 0.4 * term_coverage)
-                
-                scores.append((doc_id, similarity, matched_terms))
-    
-    scores.sort(key=lambda x: x[1], reverse=True)
+    depth = top_k * PROXIMITY_RERANK if proximity else top_k
+    if ranking == 'bm25':
+        ranked = rank_bm25(query_lemmas, index, depth)
+    else:
+        ranked = rank_documents(data, query_vec, depth, exhaustive)
+    if proximity:
+        ranked = apply_proximity(data, ranked, query_lemmas)[:top_k]
     
+    ranked = [(doc_id, score, matched_terms, get_top_terms(data, doc_id, 5) if doc_id in data.lemma_vectors else [])
+              for doc_id, score, matched_terms in ranked]
+    return format_results(ranked, total_terms), query_lemmas, query_terms_info
+
+
+def format_results(ranked, total_terms):
+    """Ответ поиска из [(doc_id, score, matched_terms, лучшие термины документа)]"""
     results = []
-    for i, (doc_id, score, matched_terms) in enumerate(scores[:top_k]):
+    for i, (doc_id, score, matched_terms, doc_top_terms) in enumerate(ranked):
         doc_num = f"{doc_id:03d}"
         
-        doc_top_terms = []
-        if doc_id in lemma_vectors:
-            doc_vec = lemma_vectors[doc_id]
-            doc_top_terms = sorted(doc_vec.items(), key=lambda x: x[1], reverse=True)[:5]
-        
         results.append({
             'rank': i + 1,
             'doc_id': doc_id,
             'doc_num': doc_num,
             'score': round(score, 6),
             'matched_terms': matched_terms,
-            'total_terms': len(query_vec),
-            'coverage': f"{matched_terms}/{len(query_vec)}",
+            'total_terms': total_terms,
+            'coverage': f"{matched_terms}/{total_terms}",
             'top_terms': [{'term': t, 'weight': round(w, 4)} for t, w in doc_top_terms]
         })
     
-    return results, query_lemmas, query_terms_info
+    return results
+
+
+def sharded_search(query, shards, top_k=10, proximity=True, ranking='tfidf', deadline=SEARCH_DEADLINE):
+    """vector_search по шардам: df, idf и средняя длина документа собираются со
+    всех шардов, поэтому при ответе всех шардов результат тот же, что по одному
+    индексу. Четвертым значением возвращаются шарды, не ответившие до дедлайна"""
+    print(f"Поиск по запросу: '{query}', шардов: {len(shards.paths)}")
+    
+    query_lemmas = lemmatize_query(query)
+    print(f"Леммы запроса: {query_lemmas}")
+    
+    if not query_lemmas:
+        return [], [], [], []
+    return search_shards(query_lemmas, shards, top_k, proximity, ranking, deadline)
+
+
+def search_shards(query_lemmas, shards, top_k=10, proximity=True, ranking='tfidf', deadline=SEARCH_DEADLINE):
+    """sharded_search по уже лемматизированному запросу"""
+    expires = time.monotonic() + deadline
+    stats, answered, missing = shards.statistics(query_lemmas, expires)
+    
+    query_terms_info = []
+    for lemma in query_lemmas:
+        doc_count = stats.doc_frequency(lemma)
+        query_terms_info.append({
+            'lemma': lemma,
+            'found': doc_count > 0,
+            'doc_count': doc_count,
+            'idf': stats.idf.get(lemma, 0) if doc_count else 0
+        })
+    
+    query_vec = query_to_vector(query_lemmas, stats.idf)
+    # как в search_lemmas: bm25 считает леммы индекса, которых может не быть в векторах
+    if ranking == 'bm25':
+        total_terms = len({info['lemma'] for info in query_terms_info if info['found']})
+    else:
+        total_terms = len(query_vec)
+    if not total_terms:
+        return [], query_lemmas, query_terms_info, missing
+    
+    ranked, missing = shards.search(query_lemmas, query_vec, stats, answered, expires, top_k, ranking,
+                                    PROXIMITY_WEIGHT if proximity else 0.0, PROXIMITY_RERANK)
+    return format_results(ranked, total_terms), query_lemmas, query_terms_info, missing
+
+
+def effective_ranking(ranking, data):
+    """Ранжирование для запроса: tfidf по векторам, которые расходятся с индексом,
+    заменяется на bm25 по постингам, если в индексе есть частоты"""
+    if (ranking == 'tfidf' and data.stale_docs and data.shards is None
+            and getattr(data.index, 'has_frequencies', False)):
+        return 'bm25'
+    return ranking
+
+
+def cached_search(query, cache, ranking='tfidf', top_k=10, proximity=True, data=None):
+    """Поиск для /search через кэш ответов (cache=None - без кэша):
+    (results, query_lemmas, query_terms_info, не ответившие шарды).
+
+    Весь запрос идет по одной версии данных: data или DATA, взятой один раз в
+    начале. Ключ - версия индекса этой же версии, леммы запроса и параметры
+    ранжирования, так что одинаковые после лемматизации запросы делят одну
+    запись. Неполные ответы шардов не кэшируются.
+    """
+    if data is None:
+        data = DATA
+    print(f"Поиск по запросу: '{query}'")
+    
+    query_lemmas = lemmatize_query(query)
+    print(f"Леммы запроса: {query_lemmas}")
+    
+    if not query_lemmas:
+        return [], [], [], []
+    
+    key = (data.version, tuple(query_lemmas), ranking, top_k, proximity,
+           'sparse' if data.sparse_scorer is not None else 'impacts')
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            return tuple(cached)
+    
+    if data.shards is not None:
+        answer = search_shards(query_lemmas, data.shards, top_k, proximity, ranking)
+    else:
+        answer = search_lemmas(query_lemmas, data, top_k, proximity=proximity, ranking=ranking) + ([],)
+    if cache is not None and not answer[3]:
+        cache.put(key, answer)
+    return answer
+
+
+def index_version():
+    """Отпечаток файлов индекса, векторов и шардов по размеру и времени изменения"""
+    paths = [INDEX_PATH, os.path.join(INDEX_PATH, "manifest.json"), TF_IDF_VECTORS_PATH]
+    if SHARDS_PATH:
+        paths.append(os.path.join(SHARDS_PATH, "manifest.json"))
+    
+    parts = []
+    for path in paths:
+        try:
+            info = os.stat(path)
+            parts.append(f"{path} {info.st_size} {info.st_mtime_ns}")
+        except OSError:
+            parts.append(f"{path} -")
+    return hashlib.sha256('\n'.join(parts).encode('utf-8')).hexdigest()[:16]
+
+
+def load_search_data():
+    """Загрузка индекса, векторов и шардов; при повторном вызове - перезагрузка
+    с новой версией, кэш ответов очищается от записей прежних версий.
+
+    Новая версия (SearchData) загружается целиком рядом с прежней и подменяет
+    ее одной ссылкой под RELOAD_LOCK; запрос, взявший прежнюю DATA, до конца
+    работает с ней. Прежние файлы не закрываются (их еще могут читать идущие
+    запросы), а пулы прежних шардов закрываются через SHARDS_CLOSE_DELAY секунд,
+    когда запросы к ним гарантированно уложились в свой дедлайн.
+    """
+    global DATA
+    
+    version = index_version()
+    index, doc_ordinals = get_inverted_index()
+    vectors, scoring_source, vectors_by_doc, idf, doc_term_counts = load_tf_idf()
+    sparse_scorer = load_sparse_scorer(vectors, vectors_by_doc)
+    shards = load_shards()
+    stale_docs = len(set(doc_ordinals) ^ set(vectors_by_doc)) if index is not None else 0
+    if stale_docs:
+        print(f"TF-IDF векторы расходятся с индексом на {stale_docs} документов: "
+              f"tfidf заменяется на bm25, пока не пересчитан task_4/tf_idf.py")
+    
+    data = SearchData(version, index if index is not None else defaultdict(set), doc_ordinals, vectors,
+                      scoring_source, sparse_scorer, vectors_by_doc, idf, doc_term_counts, shards, stale_docs)
+    with RELOAD_LOCK:
+        previous_shards = DATA.shards if DATA is not None else None
+        DATA = data
+    
+    if previous_shards is not None:
+        closer = threading.Timer(SHARDS_CLOSE_DELAY, previous_shards.close)
+        closer.daemon = True
+        closer.start()
+    if RESULT_CACHE is not None:
+        RESULT_CACHE.invalidate(version)
+    print(f"Версия индекса: {version}")
+
+
+def check_index_version():
+    """Не чаще раза в INDEX_CHECK_INTERVAL секунд сверяет файлы с загруженной версией.
+
+    Новую версию загружает один запрос; остальные тем временем идут по прежней.
+    """
+    global LAST_INDEX_CHECK
+    with RELOAD_LOCK:
+        now = time.monotonic()
+        if now - LAST_INDEX_CHECK < INDEX_CHECK_INTERVAL:
+            return
+        LAST_INDEX_CHECK = now
+        if index_version() == DATA.version:
+            return
+    
+    if not LOADING_LOCK.acquire(blocking=False):
+        return
+    try:
+        print("Файлы индекса изменились, загружаю новую версию")
+        load_search_data()
+    finally:
+        LOADING_LOCK.release()
 
 
 print("Загрузка поисковой системы...")
 
-inverted_index = get_inverted_index()
-lemma_vectors, lemma_idf = load_tf_idf()
+RESULT_CACHE = open_result_cache(RESULT_CACHE_PATH, RESULT_CACHE_SIZE, RESULT_CACHE_TTL)
+load_search_data()
+print(f"Словарь лемм: {lemma_cache.load_dictionary(LEMMA_DICTIONARY_PATH)} слов")
 
 @app.route('/')
 def index():
@@ -262,23 +557,33 @@ def index():
 def search():
     """Обработка поискового запроса"""
     query = request.form.get('query', '').strip()
+    requested = request.form.get('ranking', 'tfidf')
     
     if not query:
         return jsonify({'error': 'Пустой запрос'})
+    if requested not in RANKING_MODES:
+        return jsonify({'error': f"Неизвестный режим ранжирования: {requested}"})
     
     try:
-        results, query_lemmas, query_terms_info = vector_search(
-            query, lemma_vectors, lemma_idf, inverted_index
-        )
+        check_index_version()
+        data = DATA
+        ranking = effective_ranking(requested, data)
+        results, query_lemmas, query_terms_info, missing = cached_search(query, RESULT_CACHE, ranking=ranking,
+                                                                         data=data)
         
-        return jsonify({
-            'success': True,
-            'query': query,
+        response = {'success': True, 'query': query, 'ranking': ranking}
+        if data.stale_docs:
+            response['stale_vectors'] = data.stale_docs
+        if data.shards is not None:
+            response['partial'] = bool(missing)
+            response['missing_shards'] = missing
+        response.update({
             'query_lemmas': query_lemmas,
             'query_terms': query_terms_info,
             'results': results,
             'total_results': len(results)
         })
+        return jsonify(response)
         
     except Exception as e:
         print(f"Ошибка поиска: {e}")
@@ -291,12 +596,12 @@ def search():
 def get_document(doc_id):
     """Получение информации о документе"""
     doc_num = f"{doc_id:03d}"
+    data = DATA
     
-    if doc_id not in lemma_vectors:
+    if doc_id not in data.lemma_vectors:
         return jsonify({'error': 'Документ не найден'})
     
-    doc_vec = lemma_vectors[doc_id]
-    top_terms = sorted(doc_vec.items(), key=lambda x: x[1], reverse=True)[:20]
+    top_terms = get_top_terms(data, doc_id, 20)
     
     doc_text = None
     doc_path = os.path.join(BASE_DIR, "..", "task_1", "clean", f"{doc_num}.txt")
@@ -311,7 +616,7 @@ def get_document(doc_id):
     return jsonify({
         'doc_id': doc_id,
         'doc_num': doc_num,
-        'term_count': DOC_TERM_COUNTS.get(doc_id, 0) if DOC_TERM_COUNTS else 0,
+        'term_count': data.doc_term_counts.get(doc_id, 0) if data.doc_term_counts else 0,
         'top_terms': [{'term': t, 'weight': round(w, 4)} for t, w in top_terms],
         'preview': doc_text
     })
@@ -320,16 +625,23 @@ def get_document(doc_id):
 @app.route('/stats')
 def get_stats():
     """Статистика системы"""
-    if lemma_vectors and DOC_TERM_COUNTS:
-        avg_length = round(sum(DOC_TERM_COUNTS.values()) / len(lemma_vectors), 1)
+    data = DATA
+    if data.lemma_vectors and data.doc_term_counts:
+        avg_length = round(sum(data.doc_term_counts.values()) / len(data.lemma_vectors), 1)
     else:
         avg_length = 0
     
     return jsonify({
-        'total_docs': len(lemma_vectors),
-        'unique_lemmas': len(lemma_idf),
+        'total_docs': len(data.lemma_vectors),
+        'unique_lemmas': len(data.lemma_idf),
         'avg_doc_length': avg_length,
-        'index_size': len(inverted_index)
+        'index_size': len(data.index),
+        'scoring_backend': 'sparse' if data.sparse_scorer is not None else 'impacts',
+        'lemma_cache': lemma_cache.stats(),
+        'shards': data.shards.stats() if data.shards is not None else None,
+        'index_version': data.version,
+        'stale_vectors': data.stale_docs,
+        'result_cache': RESULT_CACHE.stats() if RESULT_CACHE is not None else None
     })
 
 
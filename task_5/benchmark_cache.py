@@ -0,0 +1,102 @@
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+from itertools import accumulate
+
+from benchmark_ranking import PAGES_INDEX_PATH, load_known_items
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import app
+from result_cache import DEFAULT_TTL, ResultCache, SQLiteResultCache
+
+
+def make_distinct_queries(count, max_terms):
+    """Названия городов из index.txt и случайные наборы лемм корпуса до count разных запросов"""
+    queries = list(dict.fromkeys(query for query, _ in load_known_items(PAGES_INDEX_PATH)))
+    terms = list(app.DATA.lemma_idf)
+    while len(queries) < count:
+        queries.append(' '.join(random.choices(terms, k=random.randint(1, max_terms))))
+    random.shuffle(queries)
+    return queries[:count]
+
+
+def zipf_log(queries, length, exponent):
+    """Журнал запросов: i-й по популярности запрос встречается с частотой ~ 1 / i^exponent"""
+    weights = list(accumulate(1 / rank ** exponent for rank in range(1, len(queries) + 1)))
+    return random.choices(queries, cum_weights=weights, k=length)
+
+
+def replay(log, cache, rankings):
+    """Прогон журнала: задержки по запросам и ответы для сверки"""
+    latencies = []
+    answers = []
+    for i, query in enumerate(log):
+        ranking = rankings[i % len(rankings)]
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            answer = app.cached_search(query, cache, ranking=ranking)
+        latencies.append(time.perf_counter() - started)
+        answers.append(answer)
+    return latencies, answers
+
+
+def summary(latencies):
+    ordered = sorted(latencies)
+    total = sum(ordered)
+    return total / len(ordered) * 1e3, ordered[int(0.95 * (len(ordered) - 1))] * 1e3, len(ordered) / total
+
+
+def same_answer(first, second):
+    """Сравнение ответов с точностью до кортежей, которые общий кэш возвращает списками"""
+    return [list(part) for part in first] == [list(part) for part in second]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Кэш ответов поиска на журнале запросов с распределением Ципфа")
+    parser.add_argument('--distinct', type=int, default=2000, help="разных запросов")
+    parser.add_argument('--length', type=int, default=20000, help="запросов в журнале")
+    parser.add_argument('--zipf', type=float, default=1.0, help="показатель распределения Ципфа")
+    parser.add_argument('--max-terms', type=int, default=3)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 500, 2000], help="размеры кэша в памяти")
+    args = parser.parse_args()
+
+    random.seed(0)
+    log = zipf_log(make_distinct_queries(args.distinct, args.max_terms), args.length, args.zipf)
+    rankings = app.RANKING_MODES
+    print(f"Журнал: {len(log)} запросов, разных {len(set(log))}, Ципф s={args.zipf}, "
+          f"ранжирование {'/'.join(rankings)} по очереди")
+
+    latencies, reference = replay(log, None, rankings)
+    mean, p95, throughput = summary(latencies)
+    print(f"{'Кэш':22s} {'попаданий':>10s} {'среднее, мс':>12s} {'p95, мс':>9s} {'запросов/с':>11s}")
+    print(f"{'без кэша':22s} {'-':>10s} {mean:12.3f} {p95:9.3f} {throughput:11.0f}")
+
+    mismatches = []
+    with tempfile.TemporaryDirectory() as directory:
+        caches = [(f"память, {size}", ResultCache(size, DEFAULT_TTL)) for size in args.sizes]
+        caches.append((f"sqlite, {max(args.sizes)}",
+                       SQLiteResultCache(os.path.join(directory, 'results.sqlite'), max(args.sizes), DEFAULT_TTL)))
+        for name, cache in caches:
+            latencies, answers = replay(log, cache, rankings)
+            mean, p95, throughput = summary(latencies)
+            stats = cache.stats()
+            print(f"{name:22s} {stats['hit_rate']:10.1%} {mean:12.3f} {p95:9.3f} {throughput:11.0f}")
+            if not all(same_answer(answer, expected) for answer, expected in zip(answers, reference)):
+                mismatches.append(name)
+
+            # новая версия индекса: после сброса первые повторы снова промахи
+            cache.invalidate('new-version')
+            if len(cache):
+                mismatches.append(f"{name}: записи пережили смену версии")
+            if isinstance(cache, SQLiteResultCache):
+                cache.close()
+
+    if mismatches:
+        print(f"Ответы из кэша отличаются от поиска без кэша: {', '.join(mismatches)}")
+        sys.exit(1)
+    print("Ответы из кэша совпадают с поиском без кэша, смена версии очищает кэш")
@@ -0,0 +1,70 @@
+import argparse
+import contextlib
+import io
+import os
+import time
+from urllib.parse import unquote
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PAGES_INDEX_PATH = os.path.join(BASE_DIR, "..", "index.txt")
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import app
+
+
+def load_known_items(path):
+    """Запросы с заранее известным ответом: название города из адреса страницы -> номер страницы"""
+    items = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            parts = line.strip().split('\t')
+            if len(parts) != 2:
+                continue
+
+            page, url = parts
+            doc_id = int(page.removeprefix('page_').removesuffix('.html'))
+            title = unquote(url.rstrip('/').rsplit('/', 1)[-1])
+            items.append((title.replace('_', ' ').replace('-', ' '), doc_id))
+    return items
+
+
+def evaluate(items, ranking, proximity, k):
+    """MRR@k, доля запросов с верным ответом на первом месте и в top-k, задержки"""
+    reciprocal_ranks = []
+    latencies = []
+    for query, relevant in items:
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            results, _, _ = app.vector_search(query, app.DATA, top_k=k, proximity=proximity, ranking=ranking)
+        latencies.append(time.perf_counter() - started)
+
+        ranks = [result['rank'] for result in results if result['doc_id'] == relevant]
+        reciprocal_ranks.append(1 / ranks[0] if ranks else 0.0)
+
+    latencies.sort()
+    count = len(items)
+    return {
+        'mrr': sum(reciprocal_ranks) / count,
+        'success_1': sum(1 for rr in reciprocal_ranks if rr == 1.0) / count,
+        'success_k': sum(1 for rr in reciprocal_ranks if rr > 0) / count,
+        'mean_ms': sum(latencies) / count * 1e3,
+        'p95_ms': latencies[int(0.95 * (count - 1))] * 1e3,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Качество и скорость ранжирования TF-IDF и BM25")
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=3, help="прогонов для замера задержек")
+    args = parser.parse_args()
+
+    items = load_known_items(PAGES_INDEX_PATH)
+    print(f"Запросов: {len(items)} (название города -> его страница), top-{args.top_k}")
+    print(f"{'Режим':24s} {'MRR':>6s} {'S@1':>6s} {f'S@{args.top_k}':>6s} {'мс':>7s} {'p95 мс':>7s}")
+    for ranking in app.RANKING_MODES:
+        for proximity in (False, True):
+            runs = [evaluate(items, ranking, proximity, args.top_k) for _ in range(args.repeat)]
+            best = min(runs, key=lambda run: run['mean_ms'])
+            name = f"{ranking}{' + близость' if proximity else ''}"
+            print(f"{name:24s} {best['mrr']:6.3f} {best['success_1']:6.2f} {best['success_k']:6.2f} "
+                  f"{best['mean_ms']:7.2f} {best['p95_ms']:7.2f}")
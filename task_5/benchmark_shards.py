@@ -0,0 +1,102 @@
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+from benchmark_ranking import PAGES_INDEX_PATH, load_known_items
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import app
+from shards import ShardedSearch, build_shards
+
+
+def make_queries(count, max_terms):
+    """Названия городов из index.txt и случайные наборы лемм корпуса (частые леммы чаще)"""
+    queries = [query for query, _ in load_known_items(PAGES_INDEX_PATH)]
+    terms = list(app.DATA.lemma_idf)
+    weights = [1 / app.DATA.lemma_idf[term] for term in terms]
+    while len(queries) < count:
+        queries.append(' '.join(random.choices(terms, weights=weights, k=random.randint(1, max_terms))))
+    return queries[:count]
+
+
+def run_single(query, ranking, k):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return app.vector_search(query, app.DATA, top_k=k, ranking=ranking)
+
+
+def run_sharded(query, shards, ranking, k, deadline):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return app.sharded_search(query, shards, top_k=k, ranking=ranking, deadline=deadline)
+
+
+def latencies(function, queries, repeat):
+    """Средняя задержка и p95 в мс, лучший из repeat прогонов по каждому запросу"""
+    times = []
+    for query in queries:
+        best = float('inf')
+        for _ in range(repeat):
+            started = time.perf_counter()
+            function(query)
+            best = min(best, time.perf_counter() - started)
+        times.append(best)
+    times.sort()
+    return sum(times) / len(times) * 1e3, times[int(0.95 * (len(times) - 1))] * 1e3
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Поиск по шардам в процессах против одного индекса: "
+                                                 "сверка результатов, задержки и дедлайн")
+    parser.add_argument('--shards', type=int, nargs='+', default=[1, 2, 4], help="число шардов")
+    parser.add_argument('--queries', type=int, default=300)
+    parser.add_argument('--max-terms', type=int, default=4)
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=3, help="прогонов для замера задержек")
+    parser.add_argument('--tight-deadline', type=float, default=0.0005,
+                        help="короткий дедлайн для проверки неполных ответов, с")
+    args = parser.parse_args()
+
+    random.seed(0)
+    queries = make_queries(args.queries, args.max_terms)
+    print(f"Запросов: {len(queries)}, top-{args.top_k}, ядер: {os.cpu_count()}")
+
+    mismatches = []
+    print(f"{'Поиск':22s} {'ранжирование':>12s} {'среднее, мс':>12s} {'p95, мс':>9s}")
+    for ranking in app.RANKING_MODES:
+        mean, p95 = latencies(lambda query: run_single(query, ranking, args.top_k), queries, args.repeat)
+        print(f"{'один индекс':22s} {ranking:>12s} {mean:12.2f} {p95:9.2f}")
+
+    with tempfile.TemporaryDirectory() as directory:
+        for count in args.shards:
+            path = os.path.join(directory, f"shards_{count}")
+            started = time.perf_counter()
+            build_shards(path, count, app.INDEX_PATH, app.TF_IDF_VECTORS_PATH)
+            build_time = time.perf_counter() - started
+            shards = ShardedSearch(path)
+            try:
+                name = f"{count} шард(ов)"
+                for ranking in app.RANKING_MODES:
+                    for query in queries:
+                        results, lemmas, terms, missing = run_sharded(query, shards, ranking, args.top_k, 10.0)
+                        if missing or (results, lemmas, terms) != run_single(query, ranking, args.top_k):
+                            mismatches.append((name, ranking, query))
+
+                    mean, p95 = latencies(lambda query: run_sharded(query, shards, ranking, args.top_k, 10.0),
+                                          queries, args.repeat)
+                    print(f"{name:22s} {ranking:>12s} {mean:12.2f} {p95:9.2f}")
+
+                partial = sum(1 for query in queries
+                              if run_sharded(query, shards, 'tfidf', args.top_k, args.tight_deadline)[3])
+                print(f"  сборка {build_time:.2f} с; с дедлайном {args.tight_deadline * 1e3:g} мс "
+                      f"неполных ответов: {partial} из {len(queries)}")
+            finally:
+                shards.close()
+
+    if mismatches:
+        print(f"Результаты шардов отличаются от одного индекса: {len(mismatches)}, например {mismatches[:3]}")
+        sys.exit(1)
+    print("Результаты всех шардов совпадают с поиском по одному индексу")
@@ -0,0 +1,83 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+VECTORS_PATH = os.path.join(BASE_DIR, "..", "task_4", "tf_idf", "lemmas.bin")
+
+sys.path.append(os.path.join(BASE_DIR, "..", "task_3"))
+sys.path.append(os.path.join(BASE_DIR, "..", "task_4"))
+from benchmark_topk import make_queries
+from scoring import ImpactIndex, score_query
+from sparse_scoring import SparseScorer
+from vectors_format import VectorsReader
+
+
+def rank_dict(query_vec, index, k):
+    scores = [(doc_id, cosine) for doc_id, cosine, _ in score_query(query_vec, index) if cosine > 0]
+    scores.sort(key=lambda x: x[1], reverse=True)
+    return scores[:k]
+
+
+def rank_sparse(query_vec, scorer, k):
+    return [(doc_id, cosine) for doc_id, _, cosine, _ in scorer.top_k(query_vec, k)]
+
+
+def timed(function):
+    started = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - started
+
+
+def run_benchmark(count, max_terms, k):
+    reader = VectorsReader(VECTORS_PATH)
+    queries = make_queries(reader, count, max_terms)
+
+    vectors, dict_load = timed(lambda: {doc_id: reader.vector(doc_id) for doc_id in reader.vectors})
+    index, index_load = timed(lambda: ImpactIndex(vectors))
+    scorer, sparse_load = timed(lambda: SparseScorer.from_reader(reader))
+    print(f"Документов: {reader.doc_count}, лемм: {reader.term_count}, весов: {scorer.normalized.nnz}")
+    print(f"Загрузка: словари {(dict_load + index_load) * 1e3:.1f} мс, CSR-матрица {sparse_load * 1e3:.1f} мс")
+
+    # те же документы в том же порядке, косинусы - до погрешности суммирования
+    mismatches = 0
+    max_error = 0.0
+    batch = scorer.top_k_batch(queries, k)
+    for query_vec, batch_result in zip(queries, batch):
+        expected = rank_dict(query_vec, index, k)
+        single = rank_sparse(query_vec, scorer, k)
+        if [doc_id for doc_id, _ in expected] != [doc_id for doc_id, _ in single]:
+            mismatches += 1
+        if [item[0] for item in batch_result] != [doc_id for doc_id, _ in single]:
+            mismatches += 1
+        for (_, a), (_, b) in zip(expected, single):
+            max_error = max(max_error, abs(a - b))
+    print(f"Запросов: {count}, до {max_terms} лемм, top-{k}")
+    print(f"Расхождений в ранжировании: {mismatches}, наибольшая разница косинусов: {max_error:.1e}")
+
+    _, dict_time = timed(lambda: [rank_dict(query_vec, index, k) for query_vec in queries])
+    _, single_time = timed(lambda: [rank_sparse(query_vec, scorer, k) for query_vec in queries])
+    _, batch_time = timed(lambda: scorer.top_k_batch(queries, k))
+    _, product_time = timed(lambda: scorer.score_batch(queries))
+
+    print(f"Словари, по одному запросу:    {dict_time / count * 1e6:10.1f} мкс/запрос")
+    print(f"CSR, по одному запросу:        {single_time / count * 1e6:10.1f} мкс/запрос")
+    print(f"CSR, пачка из {count} запросов:  {batch_time / count * 1e6:10.1f} мкс/запрос "
+          f"(из них умножение матриц {product_time / count * 1e6:.1f})")
+
+    reader.close()
+    return mismatches
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Словари против CSR-матрицы для косинусного ранжирования")
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--max-terms', type=int, default=6)
+    parser.add_argument('--top-k', type=int, default=10)
+    args = parser.parse_args()
+
+    random.seed(0)
+    if run_benchmark(args.queries, args.max_terms, args.top_k):
+        sys.exit(1)
@@ -0,0 +1,117 @@
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+VECTORS_PATH = os.path.join(BASE_DIR, "..", "task_4", "tf_idf", "lemmas.bin")
+
+sys.path.append(os.path.join(BASE_DIR, "..", "task_3"))
+sys.path.append(os.path.join(BASE_DIR, "..", "task_4"))
+from scoring import MAXSCORE_MIN_DOCS, rank_top_k, score_query, top_k
+from vectors_format import VectorsReader, write_vectors
+
+
+def make_queries(reader, count, max_terms):
+    """Случайные запросы из лемм корпуса, частые леммы попадаются чаще"""
+    terms = [reader.term(number) for number in range(reader.term_count)]
+    frequencies = [sum(1 for _ in reader.impacts(term)) for term in terms]
+    queries = []
+    for _ in range(count):
+        lemmas = random.choices(terms, weights=frequencies, k=random.randint(1, max_terms))
+        tf = Counter(lemmas)
+        queries.append({lemma: n / len(lemmas) * reader.idf[lemma] for lemma, n in tf.items()})
+    return queries
+
+
+def exhaustive(query_vec, reader, k, boost):
+    scores = []
+    for doc_id, cosine, matched in score_query(query_vec, reader):
+        if cosine > 0:
+            scores.append((doc_id, cosine * boost(query_vec, matched)))
+    scores.sort(key=lambda x: x[1], reverse=True)
+    return scores[:k]
+
+
+def maxscore(query_vec, reader, k, boost):
+    return [(doc_id, score) for doc_id, score, _, _ in
+            top_k(query_vec, reader, k,
+                  boost=lambda matched: boost(query_vec, matched),
+                  max_boost=boost(query_vec, len(query_vec)))]
+
+
+def by_size(query_vec, reader, k, boost):
+    return [(doc_id, score) for doc_id, score, _, _ in
+            rank_top_k(query_vec, reader, k,
+                       boost=lambda matched: boost(query_vec, matched),
+                       max_boost=boost(query_vec, len(query_vec)))]
+
+
+def coverage_boost(query_vec, matched):
+    return 0.8 + 0.4 * matched / len(query_vec)
+
+
+def scaled_vectors(path, copies):
+    """Файл векторов в copies раз больше корпуса: копии документов с весами,
+    случайно измененными в 0.5-1.5 раза, чтобы оценки копий не совпадали"""
+    reader = VectorsReader(VECTORS_PATH)
+    step = max(reader.vectors) + 1
+    vectors = {}
+    for copy in range(copies):
+        for doc_id in reader.vectors:
+            vectors[copy * step + doc_id] = {term: weight * random.uniform(0.5, 1.5)
+                                             for term, weight in reader.vector(doc_id).items()}
+    idf = dict(reader.idf.items())
+    reader.close()
+    write_vectors(path, vectors, idf)
+    return path
+
+
+def run_benchmark(count, max_terms, k, path=VECTORS_PATH):
+    reader = VectorsReader(path)
+    queries = make_queries(reader, count, max_terms)
+
+    # проверка точности: тот же список документов и те же оценки
+    mismatches = 0
+    for query_vec in queries:
+        expected = exhaustive(query_vec, reader, k, coverage_boost)
+        if (expected != maxscore(query_vec, reader, k, coverage_boost)
+                or expected != by_size(query_vec, reader, k, coverage_boost)):
+            mismatches += 1
+    print(f"Документов: {reader.doc_count}, запросов: {count}, до {max_terms} лемм, top-{k}")
+    print(f"Расхождений с полным ранжированием: {mismatches}")
+
+    timings = {}
+    chosen = 'MaxScore' if reader.doc_count >= MAXSCORE_MIN_DOCS else 'перебор'
+    for name, rank in (('Полное ранжирование', exhaustive), ('MaxScore top-k', maxscore),
+                       (f"rank_top_k ({chosen})", by_size)):
+        started = time.perf_counter()
+        for query_vec in queries:
+            rank(query_vec, reader, k, coverage_boost)
+        timings[name] = (time.perf_counter() - started) / count
+        print(f"{name:22s} {timings[name] * 1e6:10.1f} мкс/запрос")
+
+    reader.close()
+    return mismatches
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Точность и скорость top-k поиска с MaxScore")
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--max-terms', type=int, default=6)
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--copies', type=int, nargs='+', default=[1],
+                        help="размеры коллекции в копиях корпуса (для поиска порога MAXSCORE_MIN_DOCS)")
+    args = parser.parse_args()
+
+    random.seed(0)
+    mismatches = 0
+    with tempfile.TemporaryDirectory() as directory:
+        for copies in args.copies:
+            path = VECTORS_PATH if copies == 1 else scaled_vectors(os.path.join(directory, f"x{copies}.bin"), copies)
+            mismatches += run_benchmark(args.queries, args.max_terms, args.top_k, path)
+    if mismatches:
+        sys.exit(1)
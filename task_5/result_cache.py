@@ -0,0 +1,162 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Кэш ответов поиска. Ключ - версия индекса, леммы запроса в порядке запроса
+# (от порядка зависит бонус за близость) и параметры ранжирования, значение -
+# готовый ответ. Записи вытесняются по LRU сверх maxsize и устаревают через ttl
+# секунд. При загрузке новой версии индекса кэш очищается; в общем хранилище
+# (SQLite-файл, один на все процессы веб-сервера) записи старой версии, кроме
+# того, перестают совпадать по ключу, даже если другой процесс еще не перечитал индекс.
+DEFAULT_CACHE_SIZE = 10_000
+DEFAULT_TTL = 600
+SQLITE_TIMEOUT = 5.0
+
+
+class ResultCache:
+    """LRU с TTL в памяти процесса; потокобезопасен"""
+
+    backend = 'memory'
+
+    def __init__(self, maxsize=DEFAULT_CACHE_SIZE, ttl=DEFAULT_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        """Ответ или None; устаревшая запись удаляется и считается промахом"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                del self.entries[key]
+                self.expired += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, version=None):
+        """Сбрасывает записи (кроме записей версии version, если она указана)"""
+        with self.lock:
+            if version is None:
+                self.entries.clear()
+            else:
+                for key in [key for key in self.entries if key[0] != version]:
+                    del self.entries[key]
+            self.invalidations += 1
+
+    def __len__(self):
+        return len(self.entries)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'backend': self.backend,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'size': len(self),
+            'maxsize': self.maxsize,
+            'ttl': self.ttl,
+            'expired': self.expired,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+        }
+
+
+class SQLiteResultCache(ResultCache):
+    """Тот же кэш в файле SQLite, общий для нескольких процессов на машине.
+
+    Ключ - кортеж, первый элемент которого - версия индекса; ключ и ответ хранятся
+    в JSON, поэтому кортежи в ответе возвращаются списками. Время - time.time(),
+    чтобы сроки жизни совпадали во всех процессах. Счетчики попаданий - по процессу.
+    """
+
+    backend = 'sqlite'
+
+    def __init__(self, path, maxsize=DEFAULT_CACHE_SIZE, ttl=DEFAULT_TTL):
+        super().__init__(maxsize, ttl)
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path, timeout=SQLITE_TIMEOUT, check_same_thread=False,
+                                          isolation_level=None)
+        with self.lock:
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            # в режиме WAL запись без fsync на каждую транзакцию теряет при сбое ОС только хвост кэша
+            self.connection.execute('PRAGMA synchronous=NORMAL')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, version TEXT, '
+                                    'value TEXT, expires REAL, used REAL)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS results_used ON results (used)')
+
+    def close(self):
+        self.connection.close()
+
+    def get(self, key):
+        encoded = json.dumps(key, ensure_ascii=False)
+        now = time.time()
+        with self.lock:
+            row = self.connection.execute('SELECT value, expires FROM results WHERE key = ?', (encoded,)).fetchone()
+            if row is not None and row[1] <= now:
+                self.connection.execute('DELETE FROM results WHERE key = ?', (encoded,))
+                self.expired += 1
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self.connection.execute('UPDATE results SET used = ? WHERE key = ?', (now, encoded))
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        now = time.time()
+        with self.lock:
+            self.connection.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)',
+                                    (json.dumps(key, ensure_ascii=False), key[0],
+                                     json.dumps(value, ensure_ascii=False), now + self.ttl, now))
+            excess = self.connection.execute('SELECT COUNT(*) FROM results').fetchone()[0] - self.maxsize
+            if excess > 0:
+                self.connection.execute('DELETE FROM results WHERE key IN '
+                                        '(SELECT key FROM results ORDER BY used LIMIT ?)', (excess,))
+                self.evictions += excess
+
+    def invalidate(self, version=None):
+        with self.lock:
+            if version is None:
+                self.connection.execute('DELETE FROM results')
+            else:
+                self.connection.execute('DELETE FROM results WHERE version != ?', (version,))
+            self.invalidations += 1
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+
+def open_result_cache(path=None, maxsize=DEFAULT_CACHE_SIZE, ttl=DEFAULT_TTL):
+    """Общий кэш в файле path или кэш в памяти процесса; maxsize 0 - без кэша"""
+    if maxsize <= 0:
+        return None
+    if path:
+        return SQLiteResultCache(path, maxsize, ttl)
+    return ResultCache(maxsize, ttl)
@@ -0,0 +1,246 @@
+import heapq
+import math
+from collections import Counter, defaultdict
+
+from postings import gallop, min_distance
+
+# Параметры BM25: насыщение tf и степень нормировки по длине документа
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Запас на погрешность округления при сравнении верхних границ с порогом кучи
+BOUND_EPSILON = 1e-12
+# Ограничитель в конце списков документов, чтобы не проверять выход за границу
+END_OF_LIST = float('inf')
+# MaxScore окупается только на больших коллекциях: меньше этого числа документов
+# полный перебор постингов терминов запроса быстрее (benchmark_topk.py --copies)
+MAXSCORE_MIN_DOCS = 2500
+
+
+class ImpactIndex:
+    """Импакт-постинги и нормы документов в памяти - для текстовых векторов без lemmas.bin"""
+
+    def __init__(self, vectors):
+        self.postings = defaultdict(list)
+        self.norms = {}
+        self.max_impacts = defaultdict(float)
+        for doc_id in sorted(vectors):
+            doc_vec = vectors[doc_id]
+            norm = math.sqrt(sum(w * w for w in doc_vec.values()))
+            self.norms[doc_id] = norm
+            for term, weight in doc_vec.items():
+                self.postings[term].append((doc_id, weight))
+                if norm > 0:
+                    self.max_impacts[term] = max(self.max_impacts[term], weight / norm)
+
+    def impacts(self, term):
+        return self.postings.get(term, ())
+
+    def bounded_impacts(self, term):
+        return self.impacts(term), self.max_impacts.get(term, 0.0)
+
+    def norm(self, doc_id):
+        return self.norms.get(doc_id, 0.0)
+
+
+def score_query(query_vec, source):
+    """Косинусная близость запроса к документам по импакт-постингам (term-at-a-time).
+
+    Обходятся только постинги терминов запроса, нормы документов посчитаны заранее.
+    source - VectorsReader или ImpactIndex. Возвращает [(doc_id, cosine, matched_terms)]
+    по возрастанию doc_id.
+    """
+    query_norm = math.sqrt(sum(w * w for w in query_vec.values()))
+    if query_norm == 0:
+        return []
+
+    accumulators = defaultdict(float)
+    matched = defaultdict(int)
+    for term, query_weight in query_vec.items():
+        for doc_id, weight in source.impacts(term):
+            accumulators[doc_id] += query_weight * weight
+            matched[doc_id] += 1
+
+    scores = []
+    for doc_id in sorted(accumulators):
+        doc_norm = source.norm(doc_id)
+        if doc_norm > 0:
+            scores.append((doc_id, accumulators[doc_id] / (query_norm * doc_norm), matched[doc_id]))
+    return scores
+
+
+def top_k(query_vec, source, k, boost=None, max_boost=1.0, min_cosine=0.0):
+    """k лучших документов без полного ранжирования (MaxScore, document-at-a-time).
+
+    Итоговая оценка документа - cosine * boost(matched_terms), boost не убывает
+    и не больше max_boost. Термины упорядочены по верхней границе вклада
+    query_weight * max_impact / |q|: пока сумма границ самых слабых терминов,
+    умноженная на max_boost, не дотягивает до худшего документа в куче, их
+    постинги не порождают кандидатов, а только досчитываются прыжками.
+    Документ бросается, как только его оценка с остатком границ не проходит порог.
+
+    Результат совпадает с первыми k строками полного ранжирования score_query:
+    [(doc_id, score, cosine, matched_terms)] по убыванию score, при равенстве -
+    по возрастанию doc_id.
+    """
+    query_norm = math.sqrt(sum(w * w for w in query_vec.values()))
+    if query_norm == 0 or k <= 0:
+        return []
+
+    lists = []
+    for position, (term, query_weight) in enumerate(query_vec.items()):
+        impacts, max_impact = source.bounded_impacts(term)
+        doc_ids, values = [], []
+        for doc_id, weight in impacts:
+            doc_ids.append(doc_id)
+            values.append(query_weight * weight)
+        if doc_ids:
+            doc_ids.append(END_OF_LIST)
+            lists.append((query_weight * max_impact / query_norm, position, doc_ids, values))
+    if not lists:
+        return []
+    lists.sort(key=lambda item: item[0])
+
+    # prefix[i] - сумма границ терминов lists[:i]
+    prefix = [0.0]
+    for bound, *_ in lists:
+        prefix.append(prefix[-1] + bound)
+
+    term_positions = [item[1] for item in lists]
+    doc_lists = [item[2] for item in lists]
+    value_lists = [item[3] for item in lists]
+    cursors = [0] * len(lists)
+    heap = []
+    threshold = -math.inf
+    first_essential = 0
+    essential = range(first_essential, len(lists))
+
+    while True:
+        candidate = min(doc_lists[i][cursors[i]] for i in essential)
+        if candidate == END_OF_LIST:
+            break
+
+        contributions = []
+        for i in essential:
+            if doc_lists[i][cursors[i]] == candidate:
+                contributions.append((term_positions[i], value_lists[i][cursors[i]]))
+                cursors[i] += 1
+
+        doc_norm = source.norm(candidate)
+        if doc_norm <= 0:
+            continue
+
+        scale = query_norm * doc_norm
+        partial = sum(value for _, value in contributions) / scale
+        pruned = False
+        for i in range(first_essential - 1, -1, -1):
+            if (partial + prefix[i + 1]) * max_boost + BOUND_EPSILON <= threshold:
+                pruned = True
+                break
+            doc_ids = doc_lists[i]
+            cursors[i] = gallop(doc_ids, candidate, cursors[i])
+            if doc_ids[cursors[i]] == candidate:
+                value = value_lists[i][cursors[i]]
+                contributions.append((term_positions[i], value))
+                partial += value / scale
+        if pruned:
+            continue
+
+        # сумма в порядке терминов запроса - ровно как в score_query
+        dot = 0.0
+        for _, value in sorted(contributions):
+            dot += value
+        cosine = dot / scale
+        if cosine <= min_cosine:
+            continue
+        matched = len(contributions)
+        score = cosine * boost(matched) if boost else cosine
+
+        entry = (score, -candidate, cosine, matched)
+        if len(heap) < k:
+            heapq.heappush(heap, entry)
+        elif entry > heap[0]:
+            heapq.heapreplace(heap, entry)
+        else:
+            continue
+
+        if len(heap) == k:
+            threshold = heap[0][0]
+            while (first_essential < len(lists)
+                   and prefix[first_essential + 1] * max_boost + BOUND_EPSILON <= threshold):
+                first_essential += 1
+            if first_essential == len(lists):
+                break
+            essential = range(first_essential, len(lists))
+
+    return [(-neg_doc_id, score, cosine, matched)
+            for score, neg_doc_id, cosine, matched in sorted(heap, reverse=True)]
+
+
+def rank_top_k(query_vec, source, k, boost=None, max_boost=1.0):
+    """k лучших документов тем способом, что быстрее для размера коллекции:
+    MaxScore (top_k) от MAXSCORE_MIN_DOCS документов, иначе полный перебор
+    score_query с сортировкой. Результат в обоих случаях как у top_k"""
+    if len(source.norms) >= MAXSCORE_MIN_DOCS:
+        return top_k(query_vec, source, k, boost, max_boost)
+
+    scores = []
+    for doc_id, cosine, matched in score_query(query_vec, source):
+        if cosine > 0:
+            scores.append((doc_id, cosine * boost(matched) if boost else cosine, cosine, matched))
+    # сортировка устойчива: при равенстве оценок остается порядок по doc_id
+    scores.sort(key=lambda x: x[1], reverse=True)
+    return scores[:k]
+
+
+def coverage_boost(matched_terms, total_terms):
+    """Множитель за долю найденных терминов запроса: от 0.8 до 1.2"""
+    return 0.8 + 0.4 * matched_terms / total_terms
+
+
+def bm25_top_k(query_lemmas, index, k, k1=BM25_K1, b=BM25_B, stats=None):
+    """k лучших документов по BM25, term-at-a-time по постингам индекса.
+
+    tf лемм, длины документов и средняя длина берутся из индекса (index.py --counts).
+    stats - откуда брать число документов, df и среднюю длину, если индекс - только
+    часть коллекции (шард): нужен live_doc_count, average_doc_length и doc_frequency(term).
+    Повтор леммы в запросе умножает ее вклад. Возвращает
+    [(номер документа в индексе, score, matched_terms)] по убыванию score.
+    """
+    if not index.has_frequencies:
+        raise ValueError("Индекс построен без частот терминов: python index.py --counts")
+
+    lengths = index.doc_lengths
+    average_length = (stats or index).average_doc_length or 1.0
+    doc_count = (stats or index).live_doc_count
+
+    scores = defaultdict(float)
+    matched = defaultdict(int)
+    for term, query_tf in Counter(query_lemmas).items():
+        doc_ids = index.postings(term)
+        if not doc_ids:
+            continue
+
+        df = stats.doc_frequency(term) if stats else len(doc_ids)
+        idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+        for doc_id, tf in zip(doc_ids, index.frequencies(term)):
+            norm = k1 * (1 - b + b * lengths[doc_id] / average_length)
+            scores[doc_id] += query_tf * idf * tf * (k1 + 1) / (tf + norm)
+            matched[doc_id] += 1
+
+    best = heapq.nlargest(k, scores.items(), key=lambda item: (item[1], -item[0]))
+    return [(doc_id, score, matched[doc_id]) for doc_id, score in best]
+
+
+def proximity_score(position_lists):
+    """Близость терминов запроса в документе: среднее 1 / расстояние по соседним
+    парам терминов запроса (1 - слова стоят рядом, 0 - какого-то термина нет).
+    position_lists - отсортированные позиции терминов в порядке запроса или None"""
+    pairs = list(zip(position_lists, position_lists[1:]))
+    if not pairs:
+        return 0.0
+
+    total = 0.0
+    for first, second in pairs:
+        if first and second:
+            total += 1.0 / max(1, min_distance(first, second))
+    return total / len(pairs)
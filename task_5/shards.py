@@ -0,0 +1,338 @@
+import argparse
+import heapq
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+INDEX_PATH = os.environ.get("INDEX_PATH", os.path.join(BASE_DIR, "..", "task_3", "inverted_index.bin"))
+VECTORS_PATH = os.path.join(BASE_DIR, "..", "task_4", "tf_idf", "lemmas.bin")
+
+sys.path.append(os.path.join(BASE_DIR, "..", "task_3"))
+sys.path.append(os.path.join(BASE_DIR, "..", "task_4"))
+from index_format import IndexReader, IndexWriter
+from scoring import bm25_top_k, coverage_boost, proximity_score, rank_top_k
+from segments import open_index
+from vectors_format import VectorsReader, VectorsWriter
+
+# Шардированный поиск: при сборке документы делятся на N шардов по кругу в
+# порядке имен, каждый шард - каталог с обычными inverted_index.bin и lemmas.bin
+# своей части документов:
+#   shards/manifest.json         шарды и их документы
+#   shards/shard_NN/...
+# Веса tf-idf посчитаны по всему корпусу и копируются в шарды как есть. Каждый
+# шард обслуживает свой процесс. Запрос проходит по шардам в два круга
+# (scatter-gather): сначала собираются df лемм, число и суммарная длина
+# документов - из них глобальные idf и средняя длина, так что оценка документа
+# не зависит от того, в какой шард он попал; затем каждый шард отдает свои
+# лучшие документы, и координатор сливает их в общий top-k. Оба круга
+# укладываются в дедлайн запроса: шард, не ответивший вовремя, пропускается
+# до конца запроса, а результат помечается неполным.
+SHARDS_DIR = os.path.join(BASE_DIR, "shards")
+MANIFEST = 'manifest.json'
+INDEX_FILE = 'inverted_index.bin'
+VECTORS_FILE = 'lemmas.bin'
+DEFAULT_DEADLINE = 1.0
+TOP_TERMS = 5
+
+
+def parse_doc_id(doc):
+    try:
+        return int(doc)
+    except ValueError:
+        return doc
+
+
+def load_manifest(directory):
+    with open(os.path.join(directory, MANIFEST), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def build_shards(directory, shard_count, index_path=INDEX_PATH, vectors_path=VECTORS_PATH):
+    """Делит индекс и векторы на shard_count шардов. Каталог собирается рядом и
+    подменяет прежний целиком, уже открытые файлы старых шардов остаются целы"""
+    index = open_index(index_path)
+    vectors = VectorsReader(vectors_path)
+    names = sorted(index.doc_names[number] for number in index.live_docs())
+    shard_names = [names[shard::shard_count] for shard in range(shard_count)]
+    local_ids = {name: (shard, position) for shard, docs in enumerate(shard_names)
+                 for position, name in enumerate(docs)}
+    doc_shards = {parse_doc_id(name): shard for name, (shard, _) in local_ids.items()}
+
+    temporary = f"{directory.rstrip(os.sep)}.tmp"
+    shutil.rmtree(temporary, ignore_errors=True)
+    paths = [os.path.join(temporary, f"shard_{shard:02d}") for shard in range(shard_count)]
+    for path in paths:
+        os.makedirs(path)
+
+    index_writers = [IndexWriter(os.path.join(path, INDEX_FILE), docs, positions=index.has_positions,
+                                 frequencies=index.has_frequencies) for path, docs in zip(paths, shard_names)]
+    if index.has_frequencies:
+        lengths = {index.doc_names[number]: index.doc_lengths[number] for number in index.live_docs()}
+        for writer, docs in zip(index_writers, shard_names):
+            writer.doc_lengths = [lengths[name] for name in docs]
+
+    for term in index.terms():
+        doc_ids = index.postings(term)
+        frequencies = index.frequencies(term) if index.has_frequencies else [None] * len(doc_ids)
+        positions = index.positions(term, doc_ids) if index.has_positions else {}
+        parts = [([], [], []) for _ in range(shard_count)]
+        for doc_id, tf in zip(doc_ids, frequencies):
+            shard, local_id = local_ids[index.doc_names[doc_id]]
+            parts[shard][0].append(local_id)
+            parts[shard][1].append(positions.get(doc_id))
+            parts[shard][2].append(tf)
+        for writer, (local, term_positions, term_frequencies) in zip(index_writers, parts):
+            if local:
+                writer.add_term(term, local, term_positions if index.has_positions else None,
+                                term_frequencies if index.has_frequencies else None)
+    for writer in index_writers:
+        writer.close()
+    index.close()
+
+    vectors_writers = [VectorsWriter(os.path.join(path, VECTORS_FILE)) for path in paths]
+    for doc_id in sorted(vectors.doc_positions):
+        if doc_id in doc_shards:
+            vectors_writers[doc_shards[doc_id]].add_document(doc_id, vectors.vector(doc_id))
+
+    for number in range(vectors.term_count):
+        term = vectors.term(number)
+        parts = [[] for _ in range(shard_count)]
+        for doc_id, weight in vectors.impacts(term):
+            if doc_id in doc_shards:
+                parts[doc_shards[doc_id]].append((doc_id, weight))
+        for writer, impacts in zip(vectors_writers, parts):
+            if impacts:
+                max_impact = max(weight / vectors.norm(doc_id) if vectors.norm(doc_id) > 0 else 0.0
+                                 for doc_id, weight in impacts)
+                writer.add_term(term, vectors.term_idf(number), impacts, max_impact)
+    for writer in vectors_writers:
+        writer.close()
+    vectors.close()
+
+    manifest = {'index': os.path.abspath(index_path), 'vectors': os.path.abspath(vectors_path),
+                'shards': [{'name': os.path.basename(path), 'docs': docs} for path, docs in zip(paths, shard_names)]}
+    with open(os.path.join(temporary, MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(temporary, directory)
+    return manifest
+
+
+class Shard:
+    """Индекс и векторы одного шарда в процессе-обработчике"""
+
+    def __init__(self, path):
+        self.index = IndexReader(os.path.join(path, INDEX_FILE), doc_key=parse_doc_id)
+        self.vectors = VectorsReader(os.path.join(path, VECTORS_FILE))
+        self.ordinals = {self.index.doc_keys[number]: number for number in self.index.live_docs()}
+        self.total_length = sum(self.index.doc_lengths)
+
+    def info(self):
+        return {'docs': self.index.live_doc_count, 'terms': len(self.index), 'pid': os.getpid()}
+
+    def statistics(self, lemmas):
+        """Число и суммарная длина документов шарда, {лемма: (df, idf tf-idf или None)}"""
+        terms = {}
+        for lemma in set(lemmas):
+            number = self.vectors.find(lemma)
+            terms[lemma] = (self.index.doc_frequency(lemma),
+                            self.vectors.term_idf(number) if number >= 0 else None)
+        return {'docs': self.index.live_doc_count, 'length': self.total_length, 'terms': terms}
+
+    def search(self, query_lemmas, query_vec, stats, depth, ranking, proximity_terms):
+        """depth лучших документов шарда: [(doc_id, score, matched_terms, близость, лучшие термины)].
+        Близость считается по proximity_terms - леммам запроса, которые есть хоть в одном шарде"""
+        if ranking == 'bm25':
+            ranked = [(self.index.doc_keys[number], score, matched)
+                      for number, score, matched in bm25_top_k(query_lemmas, self.index, depth, stats=stats)]
+        else:
+            total_terms = len(query_vec)
+            ranked = [(doc_id, score, matched) for doc_id, score, _, matched in
+                      rank_top_k(query_vec, self.vectors, depth,
+                                 boost=lambda matched: coverage_boost(matched, total_terms),
+                                 max_boost=coverage_boost(total_terms, total_terms))]
+
+        closeness = [0.0] * len(ranked)
+        if len(proximity_terms) >= 2 and self.index.has_positions and ranked:
+            ordinals = [self.ordinals[doc_id] for doc_id, _, _ in ranked]
+            positions = [self.index.positions(term, ordinals) for term in proximity_terms]
+            closeness = [proximity_score([term_positions.get(ordinal) for term_positions in positions])
+                         for ordinal in ordinals]
+
+        return [(doc_id, score, matched, close,
+                 self.vectors.top_terms(doc_id, TOP_TERMS) if doc_id in self.vectors.doc_positions else [])
+                for (doc_id, score, matched), close in zip(ranked, closeness)]
+
+
+# шард процесса-обработчика, открывается инициализатором пула
+_shard = None
+
+
+def _open_shard(path):
+    global _shard
+    _shard = Shard(path)
+
+
+def _shard_info():
+    return _shard.info()
+
+
+def _shard_statistics(lemmas):
+    return _shard.statistics(lemmas)
+
+
+def _shard_search(*args):
+    return _shard.search(*args)
+
+
+class CollectionStats:
+    """Статистика всей коллекции по ответам шардов: то, что bm25_top_k берет из stats"""
+
+    def __init__(self, answers):
+        self.live_doc_count = sum(answer['docs'] for answer in answers)
+        total_length = sum(answer['length'] for answer in answers)
+        self.average_doc_length = total_length / self.live_doc_count if self.live_doc_count else 0.0
+        self.doc_frequencies = {}
+        self.idf = {}
+        for answer in answers:
+            for lemma, (df, idf) in answer['terms'].items():
+                self.doc_frequencies[lemma] = self.doc_frequencies.get(lemma, 0) + df
+                if idf is not None:
+                    self.idf.setdefault(lemma, idf)
+
+    def doc_frequency(self, term):
+        return self.doc_frequencies.get(term, 0)
+
+
+class ShardedSearch:
+    """Координатор: по процессу на шард, запросы расходятся по всем шардам.
+
+    Процессы запускаются сразу, чтобы fork прошел до старта потоков веб-сервера.
+    Упавший процесс шарда перезапускается, а запрос считается неполным.
+    """
+
+    def __init__(self, directory=SHARDS_DIR, deadline=DEFAULT_DEADLINE):
+        self.directory = directory
+        self.deadline = deadline
+        self.paths = [os.path.join(directory, entry['name']) for entry in load_manifest(directory)['shards']]
+        self.executors = [self._start(path) for path in self.paths]
+        self.queries = 0
+        self.partial_queries = 0
+        self.infos = self._gather(range(len(self.paths)), None, _shard_info)[0]
+        self.doc_count = sum(info['docs'] for info in self.infos.values())
+
+    def _start(self, path):
+        return ProcessPoolExecutor(max_workers=1, initializer=_open_shard, initargs=(path,))
+
+    def _restart(self, shard):
+        print(f"Процесс шарда {shard} упал, перезапуск")
+        self.executors[shard].shutdown(wait=False, cancel_futures=True)
+        self.executors[shard] = self._start(self.paths[shard])
+
+    def close(self):
+        for executor in self.executors:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _gather(self, shards, deadline, function, *args):
+        """Вызывает function(*args) в процессах шардов и ждет ответов до deadline
+        (time.monotonic(), None - без ограничения). Возвращает ({шард: ответ}, [не ответившие])"""
+        futures = {}
+        missing = []
+        for shard in shards:
+            try:
+                futures[self.executors[shard].submit(function, *args)] = shard
+            except BrokenProcessPool:
+                self._restart(shard)
+                missing.append(shard)
+
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        done, pending = wait(futures, timeout=timeout)
+        for future in pending:
+            # уже начатый вызов не прерывается, его ответ просто не ждут
+            future.cancel()
+            missing.append(futures[future])
+
+        answers = {}
+        for future in done:
+            shard = futures[future]
+            try:
+                answers[shard] = future.result()
+            except BrokenProcessPool:
+                self._restart(shard)
+                missing.append(shard)
+        return answers, sorted(missing)
+
+    def statistics(self, query_lemmas, deadline):
+        """Круг 1: (CollectionStats, ответившие шарды, не ответившие шарды)"""
+        answers, missing = self._gather(range(len(self.paths)), deadline, _shard_statistics, query_lemmas)
+        return CollectionStats(answers.values()), sorted(answers), missing
+
+    def search(self, query_lemmas, query_vec, stats, shards, deadline, top_k, ranking='tfidf',
+               proximity_weight=0.0, rerank=1):
+        """Круг 2: общий top-k по шардам, ответившим в круге 1.
+
+        Каждый шард отдает rerank * top_k лучших по своей оценке (при равенстве -
+        по номеру документа), из слитого списка берутся столько же лучших, и только
+        они получают бонус за близость - как при поиске по одному индексу.
+        Возвращает ([(doc_id, score, matched_terms, лучшие термины)], не ответившие шарды).
+        """
+        self.queries += 1
+        depth = top_k * rerank if proximity_weight else top_k
+        proximity_terms = [lemma for lemma in dict.fromkeys(query_lemmas) if stats.doc_frequency(lemma) > 0]
+        answers, missing = self._gather(shards, deadline, _shard_search, query_lemmas, query_vec, stats,
+                                         depth, ranking, proximity_terms if proximity_weight else [])
+        missing = sorted(missing + [shard for shard in range(len(self.paths)) if shard not in shards])
+        if missing:
+            self.partial_queries += 1
+
+        rows = heapq.nsmallest(depth, (row for rows in answers.values() for row in rows),
+                               key=lambda row: (-row[1], row[0]))
+        if proximity_weight and len(proximity_terms) >= 2:
+            rows = [(doc_id, score * (1 + proximity_weight * close), matched, close, terms)
+                    for doc_id, score, matched, close, terms in rows]
+            rows.sort(key=lambda row: (-row[1], row[0]))
+        return [(doc_id, score, matched, terms) for doc_id, score, matched, _, terms in rows[:top_k]], missing
+
+    def stats(self):
+        return {
+            'shards': len(self.paths),
+            'docs': self.doc_count,
+            'deadline': self.deadline,
+            'queries': self.queries,
+            'partial_queries': self.partial_queries,
+        }
+
+
+def print_stats(directory):
+    manifest = load_manifest(directory)
+    print(f"Шардов: {len(manifest['shards'])}, индекс {manifest['index']}")
+    for entry in manifest['shards']:
+        reader = IndexReader(os.path.join(directory, entry['name'], INDEX_FILE))
+        print(f"  {entry['name']}: документов {reader.doc_count}, терминов {reader.term_count}")
+        reader.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Шарды индекса и векторов для поиска по процессам")
+    parser.add_argument('--dir', default=SHARDS_DIR, help="каталог шардов")
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help="разделить индекс и векторы на шарды")
+    build.add_argument('--shards', type=int, default=os.cpu_count() or 1, help="число шардов")
+    build.add_argument('--index', default=INDEX_PATH, help="файл индекса или каталог сегментов")
+    build.add_argument('--vectors', default=VECTORS_PATH, help="файл векторов lemmas.bin")
+    commands.add_parser('stats', help="шарды и число документов")
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'build':
+            started = time.perf_counter()
+            build_shards(args.dir, args.shards, args.index, args.vectors)
+            print(f"Шарды собраны за {time.perf_counter() - started:.2f} с")
+        print_stats(args.dir)
+    except (FileNotFoundError, ValueError) as e:
+        print(f"Ошибка: {e}")
@@ -0,0 +1,150 @@
+import numpy as np
+from scipy import sparse
+
+from vectors_format import DOC_ENTRY, WEIGHT_ENTRY
+
+# Необязательный бэкенд ранжирования на NumPy/SciPy: TF-IDF векторы лежат
+# в CSR-матрице документ x термин с заранее нормированными строками, поэтому
+# косинус запроса со всеми документами - одно разреженное умножение матрицы
+# на вектор, а пачка запросов - одно умножение матриц.
+
+DOC_DTYPE = np.dtype([('doc_id', '<u4'), ('offset', '<u8'), ('length', '<u4'), ('norm', '<f8')])
+WEIGHT_DTYPE = np.dtype([('term', '<u4'), ('weight', '<f8')])
+
+assert DOC_DTYPE.itemsize == DOC_ENTRY.size and WEIGHT_DTYPE.itemsize == WEIGHT_ENTRY.size
+
+
+class SparseScorer:
+    """Косинусная близость запросов к документам через CSR-матрицу.
+
+    doc_ids - номера документов по строкам, vocabulary - леммы по столбцам.
+    Одиночный запрос берет строки терминов из транспонированной матрицы,
+    пачка запросов умножается на матрицу целиком.
+    """
+
+    def __init__(self, doc_ids, vocabulary, matrix):
+        self.doc_ids = doc_ids
+        self.vocabulary = vocabulary
+        self.columns = {term: number for number, term in enumerate(vocabulary)}
+
+        norms = np.sqrt(matrix.multiply(matrix).sum(axis=1)).A1
+        self.has_norm = norms > 0
+        scale = np.divide(1.0, norms, out=np.zeros_like(norms), where=self.has_norm)
+        self.normalized = sparse.diags(scale) @ matrix
+        self.normalized = self.normalized.tocsr()
+        self.presence = self.normalized.copy()
+        self.presence.data = np.ones_like(self.presence.data)
+        self.by_term = self.normalized.T.tocsr()
+
+    @classmethod
+    def from_reader(cls, reader):
+        """Матрица из секций lemmas.bin целиком, без разбора векторов по одному"""
+        docs = np.frombuffer(reader.buffer, dtype=DOC_DTYPE, count=reader.doc_count,
+                             offset=reader.docs_offset).copy()
+        weights = np.frombuffer(reader.buffer, dtype=WEIGHT_DTYPE,
+                                count=int(docs['length'].sum()), offset=reader.vectors_offset).copy()
+
+        indptr = np.zeros(len(docs) + 1, dtype=np.int64)
+        np.cumsum(docs['length'], out=indptr[1:])
+        matrix = sparse.csr_matrix((weights['weight'], weights['term'].astype(np.int32), indptr),
+                                   shape=(reader.doc_count, reader.term_count))
+        matrix.sort_indices()
+
+        vocabulary = np.array([reader.term(number) for number in range(reader.term_count)], dtype=object)
+        return cls(docs['doc_id'].astype(np.int64), vocabulary, matrix)
+
+    @classmethod
+    def from_vectors(cls, vectors):
+        """Матрица из {номер документа: {лемма: tf-idf}}"""
+        vocabulary = sorted({term for doc_vec in vectors.values() for term in doc_vec})
+        columns = {term: number for number, term in enumerate(vocabulary)}
+
+        doc_ids = sorted(vectors)
+        indptr = [0]
+        indices = []
+        data = []
+        for doc_id in doc_ids:
+            for term, weight in vectors[doc_id].items():
+                indices.append(columns[term])
+                data.append(weight)
+            indptr.append(len(indices))
+        matrix = sparse.csr_matrix((data, indices, indptr), shape=(len(doc_ids), len(vocabulary)))
+        matrix.sort_indices()
+        return cls(np.array(doc_ids, dtype=np.int64), np.array(vocabulary, dtype=object), matrix)
+
+    def _query_terms(self, query_vec):
+        """Номера столбцов терминов запроса и их веса, деленные на норму запроса"""
+        norm = np.sqrt(sum(w * w for w in query_vec.values()))
+        numbers = []
+        weights = []
+        for term, weight in query_vec.items():
+            number = self.columns.get(term)
+            if number is not None:
+                numbers.append(number)
+                weights.append(weight / norm if norm > 0 else 0.0)
+        return numbers, weights
+
+    def score_vector(self, query_vec):
+        """Косинусы и число совпавших терминов одного запроса по всем документам:
+        сумма строк терминов транспонированной матрицы с весами запроса"""
+        numbers, weights = self._query_terms(query_vec)
+        rows = self.by_term[numbers]
+        contributions = rows.data * np.repeat(weights, np.diff(rows.indptr))
+        size = len(self.doc_ids)
+        cosines = np.bincount(rows.indices, weights=contributions, minlength=size)
+        matched = np.bincount(rows.indices, minlength=size)
+        return cosines, matched
+
+    def query_matrix(self, query_vecs):
+        """Запросы строками: нормированные веса и индикаторы терминов"""
+        indptr = [0]
+        indices = []
+        data = []
+        for query_vec in query_vecs:
+            numbers, weights = self._query_terms(query_vec)
+            indices.extend(numbers)
+            data.extend(weights)
+            indptr.append(len(indices))
+
+        shape = (len(query_vecs), len(self.vocabulary))
+        weights = sparse.csr_matrix((data, indices, indptr), shape=shape)
+        terms = sparse.csr_matrix((np.ones(len(indices)), indices, indptr), shape=shape)
+        return weights, terms
+
+    def score_batch(self, query_vecs):
+        """Косинусы и число совпавших терминов для пачки запросов:
+        две разреженные матрицы запрос x документ"""
+        weights, terms = self.query_matrix(query_vecs)
+        cosines = (weights @ self.normalized.T).tocsr()
+        matched = (terms @ self.presence.T).tocsr()
+        return cosines, matched
+
+    def score(self, query_vec):
+        """[(doc_id, cosine, matched_terms)] по возрастанию doc_id, как score_query"""
+        cosines, matched = self.score_vector(query_vec)
+        found = np.flatnonzero((matched > 0) & self.has_norm)
+        return [(int(self.doc_ids[i]), float(cosines[i]), int(matched[i])) for i in found]
+
+    def _top_k_row(self, cosines, matched, k, boost, total_terms, min_cosine):
+        found = np.flatnonzero((matched > 0) & self.has_norm & (cosines > min_cosine))
+        cosines = cosines[found]
+        matched = matched[found]
+        scores = cosines * boost(matched, total_terms) if boost else cosines
+        order = np.lexsort((self.doc_ids[found], -scores))[:k]
+        return [(int(self.doc_ids[found[i]]), float(scores[i]), float(cosines[i]), int(matched[i]))
+                for i in order]
+
+    def top_k(self, query_vec, k, boost=None, min_cosine=0.0):
+        """[(doc_id, score, cosine, matched_terms)] как scoring.top_k.
+
+        boost(matched_terms, total_terms) получает массив чисел совпавших терминов.
+        """
+        cosines, matched = self.score_vector(query_vec)
+        return self._top_k_row(cosines, matched, k, boost, len(query_vec), min_cosine)
+
+    def top_k_batch(self, query_vecs, k, boost=None, min_cosine=0.0):
+        cosines, matched = self.score_batch(query_vecs)
+        cosines = cosines.toarray()
+        matched = matched.toarray()
+        return [self._top_k_row(cosines[row], matched[row], k, boost, len(query_vec), min_cosine)
+                for row, query_vec in enumerate(query_vecs)]
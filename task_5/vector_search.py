@@ -1,51 +1,52 @@
 import os
-import json
+import sys
 import re
-import math
 from collections import Counter, defaultdict
-
-import pymorphy3
+from itertools import islice
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-INDEX_PATH = os.path.join(BASE_DIR, "..", "task_3", "inverted_index.json")
+INDEX_PATH = os.environ.get("INDEX_PATH", os.path.join(BASE_DIR, "..", "task_3", "inverted_index.bin"))
 TF_IDF_FOLDER = os.path.join(BASE_DIR, "..", "task_4", "tf_idf")
+TF_IDF_VECTORS_PATH = os.path.join(TF_IDF_FOLDER, "lemmas.bin")
 PAGES_FOLDER = os.path.join(BASE_DIR, "..", "task_1", "clean")
+LEMMA_DICTIONARY_PATH = os.path.join(BASE_DIR, "..", "task_2", "lemma_dictionary.txt")
 PAGES_COUNT = 100
 
-morph = pymorphy3.MorphAnalyzer()
+sys.path.append(os.path.join(BASE_DIR, "..", "task_2"))
+sys.path.append(os.path.join(BASE_DIR, "..", "task_3"))
+sys.path.append(os.path.join(BASE_DIR, "..", "task_4"))
+from lemma_cache import get_lemma_cache
+from segments import open_index
+from scoring import ImpactIndex, rank_top_k, score_query
+from vectors_format import VectorsReader
+
+lemma_cache = get_lemma_cache()
+
+
+def parse_doc_id(doc):
+    try:
+        return int(doc)
+    except ValueError:
+        return doc
 
 
 def get_inverted_index():
-    index = defaultdict(set)
-    
     try:
-        with open(INDEX_PATH, "r", encoding="utf-8") as file:
-            data = json.load(file)
-            
-            for lemma, docs in data.items():
-                for doc in docs:
-                    if isinstance(doc, str):
-                        try:
-                            doc_num = int(doc)
-                            index[lemma].add(doc_num)
-                        except ValueError:
-                            index[lemma].add(doc)
-                    else:
-                        index[lemma].add(doc)
+        index = open_index(INDEX_PATH, doc_key=parse_doc_id)
         
-        print(f"Загружен инвертированный индекс из JSON: {len(index)} лемм")
+        print(f"Загружен бинарный инвертированный индекс: {len(index)} лемм")
         
         print("Примеры лемм из индекса:")
-        for i, (lemma, docs) in enumerate(list(index.items())[:5]):
-            print(f"  {lemma}: {sorted(docs)[:5]}")
+        for lemma in islice(index, 5):
+            print(f"  {lemma}: {sorted(index[lemma])[:5]}")
         
         return index
         
     except FileNotFoundError:
         print(f"Файл индекса {INDEX_PATH} не найден")
         return defaultdict(set)
-    except json.JSONDecodeError as e:
-        print(f"Ошибка при парсинге JSON: {e}")
+    except ValueError as e:
+        print(f"Ошибка при чтении индекса: {e}")
         return defaultdict(set)
     except Exception as e:
         print(f"Ошибка при загрузке индекса: {e}")
@@ -53,6 +54,20 @@ def get_inverted_index():
 
 
 def load_tf_idf():
+    """Векторы, idf и источник импакт-постингов для ранжирования"""
+    if os.path.exists(TF_IDF_VECTORS_PATH):
+        try:
+            reader = VectorsReader(TF_IDF_VECTORS_PATH)
+            print(f"Отображены в память TF-IDF векторы: {len(reader.vectors)} документов")
+            return reader.vectors, reader.idf, reader
+        except ValueError as e:
+            print(f"Ошибка загрузки {TF_IDF_VECTORS_PATH}: {e}, читаю текстовые файлы")
+    
+    vectors, idf_dict = load_tf_idf_text()
+    return vectors, idf_dict, ImpactIndex(vectors)
+
+
+def load_tf_idf_text():
     vectors = defaultdict(dict)
     idf_dict = {}
 
@@ -106,31 +121,13 @@ def load_tf_idf():
     return vectors, idf_dict
 
 
-def cosine_similarity(vec1, vec2):
-    common_terms = set(vec1.keys()) & set(vec2.keys())
-    
-    if not common_terms:
-        return 0.0
-    
-    # Скалярное произведение
-    dot_product = sum(vec1[term] * vec2[term] for term in common_terms)
-    
-    # Нормы векторов
-    norm1 = math.sqrt(sum(w * w for w in vec1.values()))
-    norm2 = math.sqrt(sum(w * w for w in vec2.values()))
-    
-    if norm1 > 0 and norm2 > 0:
-        return dot_product / (norm1 * norm2)
-    return 0.0
-
-
 def lemmatize_query(query):
     tokens = re.findall(r'\b[а-яa-z]+\b', query.lower())
     
     lemmas = []
     for token in tokens:
         try:
-            lemma = morph.parse(token)[0].normal_form
+            lemma = lemma_cache.lemmatize(token)
             lemmas.append(lemma)
         except Exception:
             lemmas.append(token)
@@ -162,7 +159,7 @@ def query_to_vector(lemmas, idf_dict):
     return query_vec
 
 
-def vector_search(query, lemma_vectors, lemma_idf, index, top_k=10):
+def vector_search(query, scoring_source, lemma_idf, index, top_k=10, exhaustive=False):
     print(f"\nЗапрос: '{query}'")
     
     query_lemmas = lemmatize_query(query)
@@ -172,33 +169,32 @@ def vector_search(query, lemma_vectors, lemma_idf, index, top_k=10):
         print("Запрос не содержит значимых лемм")
         return []
     
-    candidates = set()
     for lemma in query_lemmas:
         if lemma in index:
-            candidates.update(index[lemma])
-            print(f"  Лемма '{lemma}' найдена в {len(index[lemma])} документах")
+            print(f"  Лемма '{lemma}' найдена в {index.doc_frequency(lemma)} документах")
         else:
             print(f"  Лемма '{lemma}' не найдена в индексе")
     
-    if not candidates:
+    if not any(lemma in index for lemma in query_lemmas):
         print("Нет документов, содержащих леммы запроса")
         return []
     
-    print(f"Найдено кандидатов: {len(candidates)}")
-    
     query_vec = query_to_vector(query_lemmas, lemma_idf)
     
     if not query_vec:
         print("Не удалось создать вектор запроса")
         return []
     
+    if not exhaustive:
+        # способ ранжирования выбирается по размеру коллекции (MAXSCORE_MIN_DOCS), оценки
+        # упорядочены по косинусу, так что отсечение слабых документов просто убирает хвост
+        return [(doc_id, similarity) for doc_id, similarity, _, _ in
+                rank_top_k(query_vec, scoring_source, top_k) if similarity > 0.0001]
+
     scores = {}
-    for doc_id in candidates:
-        if doc_id in lemma_vectors:
-            doc_vec = lemma_vectors[doc_id]
-            similarity = cosine_similarity(query_vec, doc_vec)
-            if similarity > 0.0001:
-                scores[doc_id] = similarity
+    for doc_id, similarity, _ in score_query(query_vec, scoring_source):
+        if similarity > 0.0001:
+            scores[doc_id] = similarity
     
     ranked = sorted(scores.items(), key=lambda x: x[1], reverse=True)
     
@@ -267,7 +263,8 @@ def diagnose_term(term, index, idf_dict, lemma_vectors, top_n=5):
 
 
 index = get_inverted_index()
-lemma_vectors, lemma_idf = load_tf_idf()
+lemma_vectors, lemma_idf, scoring_source = load_tf_idf()
+print(f"Словарь лемм: {lemma_cache.load_dictionary(LEMMA_DICTIONARY_PATH)} слов")
 
 print(f"Документов: {len(lemma_vectors)}")
 print(f"Уникальных лемм: {len(lemma_idf)}")
@@ -297,6 +294,9 @@ while True:
             if lemma_vectors:
                 avg_len = sum(len(v) for v in lemma_vectors.values()) / len(lemma_vectors)
                 print(f"  Средняя длина документа: {avg_len:.1f} лемм")
+            cache_stats = lemma_cache.stats()
+            print(f"  Кэш лемм: попаданий {cache_stats['hits']}, промахов {cache_stats['misses']}, "
+                  f"из словаря {cache_stats['dictionary_hits']}")
             continue
         
         if query.startswith('/diag '):
@@ -307,7 +307,7 @@ while True:
         if not query:
             continue
         
-        results = vector_search(query, lemma_vectors, lemma_idf, index)
+        results = vector_search(query, scoring_source, lemma_idf, index)
         print_results(results, query)
         
         if results: